@@ -0,0 +1,225 @@
+"""
+Write-behind tracking of ``last_seen``.
+
+Writing ``last_seen`` on every request would take a row lock on
+account_user each time. ``ActivityTracker`` keeps the latest time of each
+user in memory instead; a flusher thread writes them every
+``ACCOUNT_ACTIVITY_FLUSH_INTERVAL`` seconds, one UPDATE per batch of
+users, and once more when the process exits.
+
+A user's time is written at most once per ``ACCOUNT_ACTIVITY_INTERVAL``
+seconds: a process ignores users it recorded less than an interval ago,
+and before writing claims each user with ``cache.add``, which is shared
+between workers when the cache is Redis. The stored times are therefore
+up to an interval old, and a crash loses the times not flushed yet. A
+failed write puts its entries back and releases their claims.
+
+With ``ACCOUNT_ACTIVITY_FLUSH_INTERVAL = 0`` nothing is written until
+``flush()`` is called; the test runner sets it, so tests never write
+behind their own back.
+
+``last_login`` is not written behind: ``default_token_generator`` hashes
+it, and a login has to invalidate the password reset links sent before.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject, empty
+
+FIELDS = ('last_seen',)
+CLAIM_KEY = 'account:activity:%s:%s'
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+def get_interval():
+    return getattr(settings, 'ACCOUNT_ACTIVITY_INTERVAL', 300)
+
+
+def get_flush_interval():
+    return getattr(settings, 'ACCOUNT_ACTIVITY_FLUSH_INTERVAL', 10)
+
+
+class ActivityTracker:
+    def __init__(self, batch_size=500):
+        self.batch_size = batch_size
+        # (field, user id) -> time to write
+        self._pending = {}
+        # (field, user id) -> monotonic time it was last recorded
+        self._recorded = {}
+        self._lock = threading.Lock()
+        self._flusher_lock = threading.Lock()
+        self._stop = None
+        self._thread = None
+        self._pid = None
+        atexit.register(self.close)
+
+    def record(self, user_id, field, when=None):
+        """
+        Remember ``when`` (now by default) as the ``field`` of the user,
+        unless it was recorded less than an interval ago. Never blocks on
+        the database or the cache, so it is safe under ASGI.
+        """
+        key = (field, user_id)
+        now = time.monotonic()
+        recorded = self._recorded.get(key)
+        if recorded is not None and now - recorded < get_interval():
+            return False
+        with self._lock:
+            self._recorded[key] = now
+            self._pending[key] = when or timezone.now()
+        self._ensure_flusher()
+        return True
+
+    def _ensure_flusher(self):
+        # forked workers (gunicorn --preload) don't inherit the thread
+        if self._pid == os.getpid() or get_flush_interval() <= 0:
+            return
+        with self._flusher_lock:
+            if self._pid == os.getpid():
+                return
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._stop,),
+                                            name='activity-flusher', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self, stop):
+        while not stop.wait(get_flush_interval()):
+            self._flush_logged()
+
+    def _flush_logged(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('could not write user activity')
+        finally:
+            # the flusher's own connections, not the request threads'
+            connections.close_all()
+
+    def claim(self, pending):
+        """
+        The entries of ``pending`` no process wrote within the interval.
+        """
+        interval = get_interval()
+        if interval <= 0:
+            return pending
+        return {key: when for key, when in pending.items() if cache.add(CLAIM_KEY % key, 1, interval)}
+
+    def flush(self):
+        """
+        Write the pending times, returns the number of rows updated.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            horizon = time.monotonic() - get_interval()
+            self._recorded = {key: recorded for key, recorded in self._recorded.items() if recorded > horizon}
+
+        claimed = self.claim(pending)
+        users = {}
+        for (field, user_id), when in claimed.items():
+            users.setdefault(user_id, {})[field] = when
+
+        # in id order, so concurrent flushes lock the rows in the same order
+        user_ids = sorted(users)
+        updated = 0
+        for start in range(0, len(user_ids), self.batch_size):
+            batch = user_ids[start:start + self.batch_size]
+            values = {}
+            for field in FIELDS:
+                whens = [When(pk=user_id, then=Value(users[user_id][field]))
+                         for user_id in batch if field in users[user_id]]
+                if whens:
+                    values[field] = Case(*whens, default=F(field), output_field=DateTimeField())
+            try:
+                updated += User.objects.filter(pk__in=batch).update(**values)
+            except Exception:
+                self.requeue(claimed, user_ids[start:])
+                raise
+        return updated
+
+    def requeue(self, claimed, user_ids):
+        """
+        Put the ``claimed`` entries of ``user_ids`` back for the next flush
+        and release their claims, so this or another process retries them.
+        """
+        user_ids = set(user_ids)
+        failed = {key: when for key, when in claimed.items() if key[1] in user_ids}
+        with self._lock:
+            # times recorded since are newer, keep those
+            for key, when in failed.items():
+                self._pending.setdefault(key, when)
+        if get_interval() > 0:
+            cache.delete_many([CLAIM_KEY % key for key in failed])
+
+    def close(self):
+        with self._flusher_lock:
+            if self._pid != os.getpid():
+                return
+            self._stop.set()
+            self._thread.join(timeout=10)
+            self._pid = None
+        self._flush_logged()
+
+
+tracker = ActivityTracker()
+
+
+def record_login(user):
+    # an UPDATE of the one column, not save(): no post_save invalidations
+    user.last_login = timezone.now()
+    User._base_manager.filter(pk=user.pk).update(last_login=user.last_login)
+
+
+def get_user_id(request):
+    user = getattr(request, 'user', None)
+    if user is None or isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+        # not resolved by the view, don't load it (a query) just for this
+        return None
+    if not user.is_authenticated:
+        return None
+    return user.pk
+
+
+class ActivityMiddleware:
+    """
+    Records the ``last_seen`` of the user a request was authenticated as,
+    session or token. Runs natively under both WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self.process_request_user(request)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        self.process_request_user(request)
+        return response
+
+    def process_request_user(self, request):
+        user_id = get_user_id(request)
+        if user_id is not None:
+            tracker.record(user_id, 'last_seen')
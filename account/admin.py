@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.models import Permission
+from django.utils.translation import gettext_lazy as _, ngettext
 
+from account import tasks
 from account.models import User
 
 
@@ -8,6 +10,25 @@ from account.models import User
 class UserAdmin(admin.ModelAdmin):
     list_display = ['username', 'get_full_name',
                     'email', 'phone', 'date_joined']
+    actions = ['send_password_reset']
+
+    def formfield_for_manytomany(self, db_field, request=None, **kwargs):
+        # the choices are labelled with str(permission), which reads the content type
+        if db_field.name == 'user_permissions':
+            qs = kwargs.get('queryset', db_field.remote_field.model.objects)
+            kwargs['queryset'] = qs.select_related('content_type')
+        return super().formfield_for_manytomany(db_field, request=request, **kwargs)
+
+    @admin.action(description=_('Send a password reset email'))
+    def send_password_reset(self, request, queryset):
+        user_ids = list(queryset.values_list('pk', flat=True))
+        for start in range(0, len(user_ids), tasks.RESET_BATCH_SIZE):
+            batch = user_ids[start:start + tasks.RESET_BATCH_SIZE]
+            tasks.send_password_reset_emails.delay_on_commit(batch)
+        self.message_user(request, ngettext(
+            'A password reset email will be sent to %d user.',
+            'A password reset email will be sent to %d users.',
+            len(user_ids)) % len(user_ids))
 
 
 @admin.register(Permission)
@@ -15,3 +36,6 @@ class PermissionAdmin(admin.ModelAdmin):
     search_fields = ('codename', 'name')
     list_filter = ['content_type']
     list_display = ['__str__', 'content_type', 'codename', 'name']
+    list_select_related = ['content_type']
+    # filtered pages skip the COUNT(*) of the whole table
+    show_full_result_count = False
@@ -0,0 +1,57 @@
+"""
+Permission checks without a query per check.
+
+``ModelBackend`` resolves a user's permissions with two queries (direct
+and group permissions) the first time a user object is asked, and again
+for every new user object, i.e. on every request. ``CachedPermissionBackend``
+loads both in one query and keeps the resulting set in the cache, keyed
+by ``account.cache.permissions_key``; the signals in ``account.signals``
+drop it when the user, its groups or a group's permissions change.
+"""
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+
+from account import cache as account_cache
+
+
+class CachedPermissionBackend(ModelBackend):
+    def _load_permissions(self, user_obj):
+        """
+        (app_label, codename) rows of the direct and the group permissions
+        of ``user_obj``, in one query.
+        """
+        def names(queryset):
+            return queryset.values_list('content_type__app_label', 'codename').order_by()
+
+        if user_obj.is_superuser:
+            return names(Permission.objects.all())
+        return names(Permission.objects.filter(user=user_obj.pk)).union(
+            names(Permission.objects.filter(group__user=user_obj.pk)))
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        # not hasattr(): ClaimsUser answers None for any unknown attribute
+        if getattr(user_obj, '_perm_cache', None) is None:
+            key = account_cache.permissions_key(user_obj.pk)
+            permissions = cache.get(key)
+            if permissions is None:
+                permissions = {'%s.%s' % (app_label, codename)
+                               for app_label, codename in self._load_permissions(user_obj)}
+                cache.set(key, permissions, account_cache.get_timeout())
+            user_obj._perm_cache = permissions
+        return user_obj._perm_cache
+
+    async def aget_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if getattr(user_obj, '_perm_cache', None) is None:
+            key = await account_cache.apermissions_key(user_obj.pk)
+            permissions = await cache.aget(key)
+            if permissions is None:
+                permissions = {'%s.%s' % (app_label, codename)
+                               async for app_label, codename in self._load_permissions(user_obj)}
+                await cache.aset(key, permissions, account_cache.get_timeout())
+            user_obj._perm_cache = permissions
+        return user_obj._perm_cache
@@ -0,0 +1,295 @@
+"""
+Bulk create, partial update and delete of users.
+
+Records are validated one by one with the user serializer, minus its
+per-record uniqueness queries: username/email uniqueness is checked for
+the whole payload with one query. Passwords are hashed together in the
+hashing pool and rows are written with ``bulk_create``/``bulk_update`` in
+transactions of ``BULK_BATCH_SIZE`` records.
+
+Every operation returns one result per input record, in input order:
+``{'index': 0, 'status': 'created', 'id': 42}`` or
+``{'index': 1, 'status': 'error', 'errors': {...}}``.
+
+Bulk writes don't send ``post_save``, so caches are invalidated here.
+
+Only superusers may change passwords or touch staff and superuser
+accounts; for anyone else such records fail with an ``id`` error.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
+
+from account import cache, hashing, tokens
+from account.serializers import UserSerializer
+from projectx.db_router import after_replication
+
+User = get_user_model()
+
+UNIQUE_FIELDS = ('username', 'email')
+
+
+class BulkUserSerializer(UserSerializer):
+    """
+    ``UserSerializer`` without the uniqueness queries and password hashing,
+    both are done for the whole payload by ``BulkUserService``.
+    """
+    def get_fields(self):
+        fields = super().get_fields()
+        for name in UNIQUE_FIELDS:
+            fields[name].validators = [
+                validator for validator in fields[name].validators
+                if not isinstance(validator, UniqueValidator)]
+        return fields
+
+    def validate(self, attrs):
+        return attrs
+
+
+def get_max_records():
+    return getattr(settings, 'BULK_MAX_RECORDS', 5000)
+
+
+def get_batch_size():
+    return getattr(settings, 'BULK_BATCH_SIZE', 500)
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _error(index, errors):
+    return {'index': index, 'status': 'error', 'errors': errors}
+
+
+def _to_pk(value):
+    # JSON true/false would otherwise pass as 1/0
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise TypeError(value)
+    return int(value)
+
+
+def _is_privileged(user):
+    return user.is_staff or user.is_superuser
+
+
+class BulkUserService:
+    serializer_class = BulkUserSerializer
+
+    def __init__(self, user):
+        self.user = user
+
+    def may_change(self, instance):
+        return self.user.is_superuser or not _is_privileged(instance)
+
+    def create(self, data):
+        records = self.check_payload(data)
+        results = [None] * len(records)
+
+        valid = {}
+        for index, record in enumerate(records):
+            serializer = self.serializer_class(data=record)
+            if serializer.is_valid():
+                valid[index] = serializer.validated_data
+            else:
+                results[index] = _error(index, serializer.errors)
+
+        self.check_unique(valid, results)
+        self.hash_passwords(valid)
+
+        for batch in _batches(sorted(valid), get_batch_size()):
+            users = [User(**valid[index]) for index in batch]
+            try:
+                with transaction.atomic():
+                    User.objects.bulk_create(users)
+            except IntegrityError:
+                # lost a race on a unique field, find out which records
+                users = self.save_one_by_one(users)
+            for index, user in zip(batch, users):
+                if user is None:
+                    results[index] = _error(index, {'non_field_errors': [_('Username or email already exists.')]})
+                else:
+                    results[index] = {'index': index, 'status': 'created', 'id': user.pk}
+
+        self.invalidate([])
+        return results
+
+    def update(self, data):
+        records = self.check_payload(data)
+        results = [None] * len(records)
+
+        ids = {}
+        for index, record in enumerate(records):
+            if not isinstance(record, dict) or 'id' not in record:
+                results[index] = _error(index, {'id': [_('This field is required.')]})
+                continue
+            try:
+                pk = _to_pk(record['id'])
+            except (TypeError, ValueError):
+                results[index] = _error(index, {'id': [_('A valid integer is required.')]})
+                continue
+            if pk in ids.values():
+                results[index] = _error(index, {'id': [_('Duplicate id in the payload.')]})
+                continue
+            ids[index] = pk
+        instances = User.objects.in_bulk(list(ids.values()))
+
+        valid = {}
+        for index, pk in ids.items():
+            instance = instances.get(pk)
+            if instance is None:
+                results[index] = _error(index, {'id': [_('User not found.')]})
+                continue
+            if not self.may_change(instance) or 'password' in records[index] and not self.user.is_superuser:
+                results[index] = _error(index, {'id': [_('You may not change this user.')]})
+                continue
+
+            serializer = self.serializer_class(instance, data=records[index], partial=True)
+            if serializer.is_valid():
+                valid[index] = serializer.validated_data
+            else:
+                results[index] = _error(index, serializer.errors)
+
+        self.check_unique(valid, results, instances={index: instances[ids[index]] for index in valid})
+        self.hash_passwords(valid)
+
+        updated = []
+        for batch in _batches(sorted(valid), get_batch_size()):
+            users = []
+            fields = set()
+            for index in batch:
+                user = instances[ids[index]]
+                for field, value in valid[index].items():
+                    setattr(user, field, value)
+                fields.update(valid[index])
+                users.append(user)
+
+            if fields:
+                try:
+                    with transaction.atomic():
+                        User.objects.bulk_update(users, sorted(fields))
+                except IntegrityError:
+                    # lost a race on a unique field, find out which records
+                    users = self.save_one_by_one(users, update_fields=sorted(fields))
+            for index, user in zip(batch, users):
+                if user is None:
+                    results[index] = _error(index, {'non_field_errors': [_('Username or email already exists.')]})
+                else:
+                    results[index] = {'index': index, 'status': 'updated', 'id': user.pk}
+                    updated.append(user.pk)
+
+        self.invalidate(updated)
+        return results
+
+    def delete(self, data):
+        ids = self.check_payload(data)
+        pks = {}
+        for index, value in enumerate(ids):
+            try:
+                pks[index] = _to_pk(value)
+            except (TypeError, ValueError):
+                pass
+
+        existing, protected = set(), set()
+        for batch in _batches(sorted(set(pks.values())), get_batch_size()):
+            with transaction.atomic():
+                for pk, is_staff, is_superuser in User.objects.filter(pk__in=batch).values_list(
+                        'pk', 'is_staff', 'is_superuser'):
+                    if self.user.is_superuser or not (is_staff or is_superuser):
+                        existing.add(pk)
+                    else:
+                        protected.add(pk)
+                # a regular delete, post_delete keeps the caches in sync
+                User.objects.filter(pk__in=[pk for pk in batch if pk in existing]).delete()
+
+        results = []
+        for index, value in enumerate(ids):
+            pk = pks.get(index)
+            if index not in pks:
+                results.append(_error(index, {'id': [_('A valid integer is required.')]}))
+            elif pk in existing:
+                results.append({'index': index, 'status': 'deleted', 'id': pk})
+            elif pk in protected:
+                results.append(_error(index, {'id': [_('You may not delete this user.')]}))
+            else:
+                results.append(_error(index, {'id': [_('User not found.')]}))
+        return results
+
+    def check_payload(self, data):
+        if not isinstance(data, list):
+            raise serializers.ValidationError({'non_field_errors': [_('Expected a list of records.')]})
+
+        max_records = get_max_records()
+        if len(data) > max_records:
+            raise serializers.ValidationError(
+                {'non_field_errors': [_('At most %d records per request.') % max_records]})
+        return data
+
+    def check_unique(self, valid, results, instances=None):
+        """
+        Rejects records whose username or email is taken, by another user
+        or by an earlier record of the same payload. Takes a single query.
+        """
+        instances = instances or {}
+        values = {field: {} for field in UNIQUE_FIELDS}
+        for index, attrs in valid.items():
+            for field in UNIQUE_FIELDS:
+                if field in attrs:
+                    values[field].setdefault(attrs[field], []).append(index)
+
+        condition = Q()
+        for field in UNIQUE_FIELDS:
+            if values[field]:
+                condition |= Q(**{'%s__in' % field: list(values[field])})
+        taken = {field: {} for field in UNIQUE_FIELDS}
+        if condition:
+            for row in User.objects.filter(condition).order_by().values('pk', *UNIQUE_FIELDS):
+                for field in UNIQUE_FIELDS:
+                    taken[field][row[field]] = row['pk']
+
+        for field in UNIQUE_FIELDS:
+            for value, indexes in values[field].items():
+                for position, index in enumerate(indexes):
+                    own_pk = getattr(instances.get(index), 'pk', None)
+                    owner = taken[field].get(value)
+                    if position > 0 or owner not in (None, own_pk):
+                        message = _('A user with that %s already exists.') % field
+                        results[index] = _error(index, {field: [message]})
+
+        for index in list(valid):
+            if results[index] is not None:
+                del valid[index]
+
+    def hash_passwords(self, valid):
+        indexes = [index for index, attrs in valid.items() if 'password' in attrs]
+        hashing.check_capacity()
+        passwords = hashing.make_passwords([valid[index]['password'] for index in indexes])
+        for index, password in zip(indexes, passwords):
+            valid[index]['password'] = password
+
+    def save_one_by_one(self, users, update_fields=None):
+        saved = []
+        for user in users:
+            try:
+                with transaction.atomic():
+                    if update_fields:
+                        user.save(update_fields=update_fields)
+                    else:
+                        user.save(force_insert=True)
+                saved.append(user)
+            except IntegrityError:
+                saved.append(None)
+        return saved
+
+    def invalidate(self, user_ids):
+        def invalidate():
+            cache.invalidate_users(user_ids)
+            tokens.forget_auth_stamps(user_ids)
+
+        invalidate()
+        transaction.on_commit(lambda: after_replication(invalidate))
@@ -0,0 +1,173 @@
+import hashlib
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from projectx.renderers import dumps
+
+USER_KEY = 'account:user:%s'
+USERS_GENERATION_KEY = 'account:users:generation'
+USERS_LIST_KEY = 'account:users:list:%s:%s:%s'
+PERMISSIONS_GENERATION_KEY = 'account:permissions:generation'
+PERMISSIONS_KEY = 'account:permissions:%s:%s'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def get_stats():
+    """
+    Hit/miss counters of this process.
+    """
+    with _stats_lock:
+        return {'hits': _stats['hits'], 'misses': _stats['misses']}
+
+
+def get_timeout():
+    return getattr(settings, 'ACCOUNT_CACHE_TIMEOUT', 300)
+
+
+def user_key(user_id):
+    return USER_KEY % user_id
+
+
+def users_list_key(request):
+    """
+    List pages are keyed by the permission scope of the requesting user and
+    the absolute URL: the pages carry absolute ``next``/``previous`` links,
+    so the scheme and host are part of the key. What a page shows depends
+    on permissions, not on who asks: all staff share their entries, all
+    other users theirs. The generation number is bumped on every user
+    change, so all cached pages go stale at once without having to find and
+    delete them.
+    """
+    generation = cache.get_or_set(USERS_GENERATION_KEY, 1, None)
+    return _users_list_key(request, generation)
+
+
+async def ausers_list_key(request):
+    generation = await cache.aget_or_set(USERS_GENERATION_KEY, 1, None)
+    return _users_list_key(request, generation)
+
+
+def get_list_scope(user):
+    return 'staff' if user.is_staff else 'user'
+
+
+def _users_list_key(request, generation):
+    url = request.build_absolute_uri()
+    digest = hashlib.md5(url.encode(), usedforsecurity=False).hexdigest()
+    return USERS_LIST_KEY % (generation, get_list_scope(request.user), digest)
+
+
+def invalidate_user(user_id):
+    cache.delete(user_key(user_id))
+    invalidate_users_list()
+
+
+def invalidate_users(user_ids):
+    cache.delete_many([user_key(user_id) for user_id in user_ids])
+    invalidate_users_list()
+
+
+def invalidate_users_list():
+    try:
+        cache.incr(USERS_GENERATION_KEY)
+    except ValueError:
+        cache.set(USERS_GENERATION_KEY, 1, None)
+
+
+def permissions_key(user_id):
+    """
+    Permission sets are keyed by user and a generation number. A change to
+    one user deletes that user's key, a change to a group's (or any)
+    permissions bumps the generation, which drops every cached set.
+    """
+    generation = cache.get_or_set(PERMISSIONS_GENERATION_KEY, 1, None)
+    return PERMISSIONS_KEY % (generation, user_id)
+
+
+async def apermissions_key(user_id):
+    generation = await cache.aget_or_set(PERMISSIONS_GENERATION_KEY, 1, None)
+    return PERMISSIONS_KEY % (generation, user_id)
+
+
+def invalidate_permissions(user_id):
+    cache.delete(permissions_key(user_id))
+
+
+def invalidate_all_permissions():
+    try:
+        cache.incr(PERMISSIONS_GENERATION_KEY)
+    except ValueError:
+        cache.set(PERMISSIONS_GENERATION_KEY, 1, None)
+
+
+def make_etag(data):
+    return quote_etag(hashlib.md5(dumps(data).encode(), usedforsecurity=False).hexdigest())
+
+
+def etag_matches(etag, if_none_match):
+    """
+    Weak comparison of ``etag`` against an ``If-None-Match`` header, as
+    ``django.utils.cache`` does it.
+    """
+    etags = parse_etags(if_none_match)
+    return '*' in etags or etag in (tag.removeprefix('W/') for tag in etags)
+
+
+def cached_response(request, key, get_response):
+    """
+    Serve ``key`` from the cache, falling back to ``get_response()`` and
+    caching its data if it was a 200. Answers ``If-None-Match`` requests
+    with a 304 when the ETag still matches.
+    """
+    payload = cache.get(key)
+    if payload is None:
+        _count('misses')
+        response = get_response()
+        if not _is_cacheable(response):
+            return response
+        payload = (make_etag(response.data), response.data)
+        cache.set(key, payload, get_timeout())
+    else:
+        _count('hits')
+    return _payload_response(request, payload)
+
+
+async def acached_response(request, key, get_response):
+    """
+    ``cached_response`` for async views, ``get_response`` is awaited.
+    """
+    payload = await cache.aget(key)
+    if payload is None:
+        _count('misses')
+        response = await get_response()
+        if not _is_cacheable(response):
+            return response
+        payload = (make_etag(response.data), response.data)
+        await cache.aset(key, payload, get_timeout())
+    else:
+        _count('hits')
+    return _payload_response(request, payload)
+
+
+def _is_cacheable(response):
+    return isinstance(response, Response) and response.status_code == status.HTTP_200_OK
+
+
+def _payload_response(request, payload):
+    etag, data = payload
+    if etag_matches(etag, request.headers.get('If-None-Match', '')):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return Response(data, headers={'ETag': etag})
@@ -0,0 +1,134 @@
+"""
+Password hashing off the request thread.
+
+With ``PASSWORD_HASHING_WORKERS`` > 0, hashing and verification run in a
+process pool of that size, so a burst of signups or logins only occupies
+those cores and every other endpoint keeps its CPU. With no workers (the
+default for tests and local runs) hashing runs inline.
+
+Hashing itself always waits its turn, so ``User.set_password`` and
+``check_password`` behave the same for the admin, ``ModelBackend`` and
+management commands. Load is shed by the API instead: its serializers call
+``check_capacity()`` first, which answers 429 (``HashingBusy``) once
+``PASSWORD_HASHING_MAX_PENDING`` operations are queued or running in the
+process.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import Throttled
+
+_lock = threading.Lock()
+_executor = None
+_pid = None
+# operations queued or running in this process
+_pending = 0
+
+
+class HashingBusy(Throttled):
+    default_detail = _('Too many password operations in progress, try again shortly.')
+    default_code = 'hashing_busy'
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _get_pool():
+    """
+    Returns the executor of this process, creating it on first use and
+    again after a fork; None without workers.
+    """
+    global _executor, _pid, _pending
+
+    if _pid != os.getpid():
+        with _lock:
+            if _pid != os.getpid():
+                workers = getattr(settings, 'PASSWORD_HASHING_WORKERS', 0)
+                _executor = None
+                if workers:
+                    _executor = ProcessPoolExecutor(
+                        max_workers=workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=_init_worker)
+                _pending = 0
+                _pid = os.getpid()
+    return _executor
+
+
+def shutdown():
+    global _executor, _pid
+
+    with _lock:
+        if _executor is not None and _pid == os.getpid():
+            _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+        _pid = None
+
+
+atexit.register(shutdown)
+
+
+def check_capacity():
+    """
+    For the API, before it hashes: raises ``HashingBusy`` when the
+    process has ``PASSWORD_HASHING_MAX_PENDING`` operations in flight.
+    """
+    _get_pool()
+    if _pending >= getattr(settings, 'PASSWORD_HASHING_MAX_PENDING', 32):
+        raise HashingBusy(wait=1)
+
+
+def _track(count):
+    global _pending
+
+    with _lock:
+        _pending += count
+
+
+def _run(func, *args):
+    executor = _get_pool()
+    _track(1)
+    try:
+        if executor is None:
+            return func(*args)
+        return executor.submit(func, *args).result()
+    finally:
+        _track(-1)
+
+
+def make_password(password):
+    if password is None:
+        # unusable password, nothing to hash
+        return hashers.make_password(None)
+    return _run(hashers.make_password, password)
+
+
+def make_passwords(passwords):
+    """
+    Hash many passwords at once, spread over all pool workers. Counts as a
+    single pending operation for the whole batch.
+    """
+    executor = _get_pool()
+    _track(1)
+    try:
+        if executor is None:
+            return [hashers.make_password(password) for password in passwords]
+        return list(executor.map(hashers.make_password, passwords))
+    finally:
+        _track(-1)
+
+
+def verify_password(password, encoded):
+    """
+    Returns ``(is_correct, must_update)``, see
+    ``django.contrib.auth.hashers.verify_password``.
+    """
+    return _run(hashers.verify_password, password, encoded)
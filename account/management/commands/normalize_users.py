@@ -0,0 +1,90 @@
+"""
+Normalizes the email (lowercase) and phone (E.164) of users stored before
+account.models normalized them on save, in batches of primary keys:
+
+    python manage.py normalize_users --dry-run
+    python manage.py normalize_users --batch-size 5000
+
+Emails that clash once lowercased are found first, with one query. Then
+each batch is one query to read and a ``bulk_update`` in its own
+transaction, so the command can be stopped and run again at any time.
+Users whose email clashes keep it (their phone is still normalized) and
+are reported, the accounts have to be merged by hand.
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+from account import cache
+from projectx.db_router import after_replication
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Lowercase emails and store phone numbers in E.164, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users read and updated per batch.')
+        parser.add_argument('--dry-run', action='store_true', help='Count the users to normalize, change nothing.')
+
+    def handle(self, *args, **options):
+        batch_size, dry_run = options['batch_size'], options['dry_run']
+        email_field, phone_field = User._meta.get_field('email'), User._meta.get_field('phone')
+        # the primary, a lagging replica would hand out rows already fixed
+        users = User.objects.using(DEFAULT_DB_ALIAS).order_by('pk')
+
+        clashing = set(users.order_by().values(email_lower=Lower('email')).annotate(
+            count=Count('pk')).filter(count__gt=1).values_list('email_lower', flat=True))
+
+        last_pk, scanned, normalized, conflicts = 0, 0, 0, []
+        while True:
+            rows = list(users.filter(pk__gt=last_pk).values_list('pk', 'email', 'phone')[:batch_size])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            scanned += len(rows)
+
+            changed = {}
+            for pk, email, phone in rows:
+                user = User(pk=pk, email=email_field.normalize(email), phone=phone_field.normalize(phone))
+                if user.email != email or user.phone != phone:
+                    changed[pk] = (user, email, phone)
+
+            clashes = {pk for pk, (user, email, _) in changed.items()
+                       if user.email != email and user.email in clashing}
+            conflicts.extend(sorted(clashes))
+            updates = [user for pk, (user, _, _) in changed.items() if pk not in clashes]
+            # only the phone of users whose email clashes
+            phone_updates = [user for pk, (user, _, phone) in changed.items()
+                             if pk in clashes and user.phone != phone]
+            normalized += len(updates) + len(phone_updates)
+            if not dry_run:
+                self.update(updates, ['email', 'phone'])
+                self.update(phone_updates, ['phone'])
+            self.stdout.write('  up to pk %d: %d scanned, %d normalized' % (last_pk, scanned, normalized))
+
+        self.stdout.write(self.style.SUCCESS('%s %d of %d users.' % (
+            'Would normalize' if dry_run else 'Normalized', normalized, scanned)))
+        if conflicts:
+            self.stdout.write(self.style.WARNING(
+                'Emails of %d users clash with another user once lowercased, left as they are: pk %s' % (
+                    len(conflicts), ', '.join(map(str, conflicts)))))
+
+    def update(self, users, fields):
+        if not users:
+            return
+        user_ids = [user.pk for user in users]
+
+        def invalidate():
+            cache.invalidate_users(user_ids)
+
+        try:
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                User.objects.using(DEFAULT_DB_ALIAS).bulk_update(users, fields)
+                transaction.on_commit(lambda: after_replication(invalidate), using=DEFAULT_DB_ALIAS)
+        except IntegrityError as error:
+            # an email saved since the clashes were looked up
+            raise CommandError('%s, run the command again.' % error)
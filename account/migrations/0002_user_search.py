@@ -0,0 +1,103 @@
+from django.db import migrations
+
+SEARCH_COLUMNS = ('username', 'email', 'first_name', 'last_name', 'phone')
+
+POSTGRESQL_FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    """
+    ALTER TABLE account_user ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        to_tsvector('simple'::regconfig, regexp_replace(
+            coalesce(username, '') || ' ' || coalesce(email, '') || ' ' ||
+            coalesce(first_name, '') || ' ' || coalesce(last_name, '') || ' ' ||
+            coalesce(phone, ''),
+            '[^[:alnum:]_]+', ' ', 'g'))
+    ) STORED
+    """,
+    'CREATE INDEX account_user_search_vector_idx ON account_user USING gin (search_vector)',
+    """
+    CREATE INDEX account_user_full_name_trgm_idx ON account_user
+    USING gin ((first_name || ' ' || last_name) gin_trgm_ops)
+    """,
+]
+
+POSTGRESQL_BACKWARD = [
+    'DROP INDEX IF EXISTS account_user_full_name_trgm_idx',
+    'DROP INDEX IF EXISTS account_user_search_vector_idx',
+    'ALTER TABLE account_user DROP COLUMN IF EXISTS search_vector',
+]
+
+
+def _columns(prefix):
+    return ', '.join('%s%s' % (prefix, column) for column in SEARCH_COLUMNS)
+
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE account_user_fts USING fts5(
+        %s, content='account_user', content_rowid='id'
+    )
+    """ % _columns(''),
+    """
+    CREATE TRIGGER account_user_fts_insert AFTER INSERT ON account_user BEGIN
+        INSERT INTO account_user_fts (rowid, %s) VALUES (new.id, %s);
+    END
+    """ % (_columns(''), _columns('new.')),
+    """
+    CREATE TRIGGER account_user_fts_delete AFTER DELETE ON account_user BEGIN
+        INSERT INTO account_user_fts (account_user_fts, rowid, %s)
+        VALUES ('delete', old.id, %s);
+    END
+    """ % (_columns(''), _columns('old.')),
+    """
+    CREATE TRIGGER account_user_fts_update AFTER UPDATE ON account_user BEGIN
+        INSERT INTO account_user_fts (account_user_fts, rowid, %s)
+        VALUES ('delete', old.id, %s);
+        INSERT INTO account_user_fts (rowid, %s) VALUES (new.id, %s);
+    END
+    """ % (_columns(''), _columns('old.'), _columns(''), _columns('new.')),
+    "INSERT INTO account_user_fts (account_user_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS account_user_fts_update',
+    'DROP TRIGGER IF EXISTS account_user_fts_delete',
+    'DROP TRIGGER IF EXISTS account_user_fts_insert',
+    'DROP TABLE IF EXISTS account_user_fts',
+]
+
+STATEMENTS = {
+    'postgresql': (POSTGRESQL_FORWARD, POSTGRESQL_BACKWARD),
+    'sqlite': (SQLITE_FORWARD, SQLITE_BACKWARD),
+}
+
+
+def _run(schema_editor, index):
+    statements = STATEMENTS.get(schema_editor.connection.vendor)
+    if statements is None:
+        return
+    for statement in statements[index]:
+        schema_editor.execute(statement)
+
+
+def forward(apps, schema_editor):
+    _run(schema_editor, 0)
+
+
+def backward(apps, schema_editor):
+    _run(schema_editor, 1)
+
+
+class Migration(migrations.Migration):
+    """
+    Search support for account.search. Nothing on the model changes, so
+    vendors without a search backend get a no-op.
+    """
+
+    dependencies = [
+        ('account', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(forward, backward),
+    ]
@@ -0,0 +1,42 @@
+import django.core.validators
+import django.db.models.functions.text
+from django.db import migrations, models
+
+import account.models
+
+
+class Migration(migrations.Migration):
+    """
+    Email and phone are normalized in Python (account.models), the columns
+    stay as they are: the field changes are state only, an AlterField
+    would have SQLite rebuild the table and drop the search triggers of
+    0002_user_search. Existing rows are normalized by the
+    normalize_users command.
+    """
+
+    dependencies = [
+        ('account', '0002_user_search'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='user',
+                name='email',
+                field=account.models.LowercaseEmailField(max_length=254, unique=True, verbose_name='email address'),
+            ),
+            migrations.AlterField(
+                model_name='user',
+                name='phone',
+                field=account.models.PhoneNumberField(blank=True, max_length=17, validators=[django.core.validators.RegexValidator(message='Must be a valid phone number of bangladesh', regex='^(?:\\+88|88)?(0(1|9)[3-9]\\d{7,10})$')], verbose_name='phone number'),
+            ),
+        ]),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(django.db.models.functions.text.Upper('username'), name='user_username_upper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['phone'], name='user_phone_idx'),
+        ),
+    ]
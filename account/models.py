@@ -1,20 +1,79 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import Upper
 from django.utils.translation import gettext_lazy as _
 
-from projectx.utils import phone_regex
+from account import hashing
+from projectx.utils import normalize_phone, phone_regex
+
+
+class NormalizedFieldMixin:
+    """
+    Stores ``normalize(value)`` and normalizes the values it is compared
+    with (exact and ``in`` lookups), so lookups by any accepted form use
+    the plain index on the column.
+    """
+    def normalize(self, value):
+        return value
+
+    def get_prep_value(self, value):
+        return self.normalize(super().get_prep_value(value))
+
+    def pre_save(self, model_instance, add):
+        value = self.normalize(super().pre_save(model_instance, add))
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+class LowercaseEmailField(NormalizedFieldMixin, models.EmailField):
+    def normalize(self, value):
+        return value.lower() if isinstance(value, str) else value
+
+
+class PhoneNumberField(NormalizedFieldMixin, models.CharField):
+    def normalize(self, value):
+        return normalize_phone(value)
 
 
 class User(AbstractUser):
-    email = models.EmailField(
+    email = LowercaseEmailField(
         _('email address'),
         unique=True)
 
-    phone = models.CharField(
+    phone = PhoneNumberField(
         _('phone number'),
         max_length=17,
         validators=[phone_regex],
         blank=True)
 
+    # written behind by account.activity, at most every ACCOUNT_ACTIVITY_INTERVAL
+    last_seen = models.DateTimeField(
+        _('last seen'),
+        blank=True,
+        null=True)
+
     class Meta:
         ordering = ('username', 'email')
+        indexes = [
+            # username__iexact compares UPPER(username)
+            models.Index(Upper('username'), name='user_username_upper_idx'),
+            models.Index(fields=['phone'], name='user_phone_idx'),
+        ]
+
+    # hashing waits for its turn here, the API sheds load before calling
+    # these (account.hashing.check_capacity)
+    def set_password(self, raw_password):
+        self.password = hashing.make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        """
+        Verify in the hashing pool and transparently rehash the password
+        when the preferred hasher or its work factor changed.
+        """
+        is_correct, must_update = hashing.verify_password(raw_password, self.password)
+        if is_correct and must_update:
+            self.set_password(raw_password)
+            self._password = None
+            self.save(update_fields=['password'])
+        return is_correct
@@ -1,12 +1,20 @@
-from django.contrib.auth import get_user_model
-from django.contrib.auth.hashers import make_password
+from django.contrib.auth import get_user_model, password_validation
+from django.contrib.auth.tokens import default_token_generator
+from django.core.exceptions import ValidationError
+from django.utils.encoding import force_str
+from django.utils.http import urlsafe_base64_decode
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
+from rest_framework_simplejwt import serializers as jwt_serializers
+
+from account import activity, hashing, tokens
+from projectx.serializers import ModelSerializer
 
 
 User = get_user_model()
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ModelSerializer):
     class Meta:
         model = User
         fields = (
@@ -23,13 +31,73 @@ class UserSerializer(serializers.ModelSerializer):
             'password': {'write_only': True},
         }
 
+    # normalized here already, so uniqueness checks of the validated data
+    # (account.bulk) compare what will be stored
+    def validate_email(self, value):
+        return User._meta.get_field('email').normalize(value)
+
+    def validate_phone(self, value):
+        return User._meta.get_field('phone').normalize(value)
+
     def validate(self, attrs):
         if 'password' in attrs:
-            attrs['password'] = make_password(attrs['password'])
+            hashing.check_capacity()
+            attrs['password'] = hashing.make_password(attrs['password'])
         return attrs
 
 
-class UserMiniSerializer(serializers.ModelSerializer):
+class UserMiniSerializer(ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'first_name', 'last_name', 'email')
+
+
+class PasswordResetSerializer(serializers.Serializer):
+    """
+    A new password for the ``uid`` and ``token`` of a password reset email
+    (``account.tasks.send_password_reset_emails``).
+    """
+    uid = serializers.CharField()
+    token = serializers.CharField()
+    password = serializers.CharField(write_only=True)
+
+    def validate(self, attrs):
+        try:
+            user = User.objects.get(pk=force_str(urlsafe_base64_decode(attrs['uid'])), is_active=True)
+        except (ValueError, OverflowError, User.DoesNotExist):
+            user = None
+        if user is None or not default_token_generator.check_token(user, attrs['token']):
+            raise serializers.ValidationError(_('The password reset link is invalid or has expired.'))
+        try:
+            password_validation.validate_password(attrs['password'], user)
+        except ValidationError as e:
+            raise serializers.ValidationError({'password': e.messages})
+        attrs['user'] = user
+        return attrs
+
+    def save(self):
+        user = self.validated_data['user']
+        hashing.check_capacity()
+        user.set_password(self.validated_data['password'])
+        user.save(update_fields=['password'])
+        return user
+
+
+class TokenObtainPairSerializer(jwt_serializers.TokenObtainPairSerializer):
+    """
+    Issues tokens carrying the claims ``TokenUserAuthentication`` builds
+    ``request.user`` from.
+    """
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token.payload.update(tokens.get_claims(user))
+        return token
+
+    def validate(self, attrs):
+        # authenticating verifies the password
+        hashing.check_capacity()
+        # not simplejwt's UPDATE_LAST_LOGIN, an UPDATE per token obtained
+        data = super().validate(attrs)
+        activity.record_login(self.user)
+        return data
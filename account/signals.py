@@ -0,0 +1,74 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_in
+from django.contrib.auth.models import Group, Permission
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from account import activity, cache, tokens
+from projectx.db_router import after_replication
+
+User = get_user_model()
+
+# django.contrib.auth saves last_login on every login, account.activity
+# updates the one column instead
+user_logged_in.disconnect(dispatch_uid='update_last_login')
+
+
+def _forget(user_id):
+    cache.invalidate_user(user_id)
+    cache.invalidate_permissions(user_id)
+    tokens.forget_auth_stamp(user_id)
+
+
+def _invalidate_permissions():
+    cache.invalidate_all_permissions()
+    transaction.on_commit(lambda: after_replication(cache.invalidate_all_permissions))
+
+
+def _invalidate(user_id):
+    _forget(user_id)
+    # drop whatever a concurrent reader cached from the pre-commit state,
+    # or from a replica that had not caught up yet
+    transaction.on_commit(lambda: after_replication(_forget, user_id))
+
+
+@receiver(post_save, sender=User, dispatch_uid='account_user_saved')
+@receiver(post_delete, sender=User, dispatch_uid='account_user_deleted')
+def user_changed(sender, instance, **kwargs):
+    _invalidate(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through, dispatch_uid='account_user_groups_changed')
+@receiver(m2m_changed, sender=User.user_permissions.through, dispatch_uid='account_user_permissions_changed')
+def user_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+
+    if not reverse:
+        _invalidate(instance.pk)
+    elif pk_set:
+        # changed from the group/permission side, pk_set holds user ids
+        for user_id in pk_set:
+            _invalidate(user_id)
+    else:
+        # cleared from the group/permission side, the users are unknown
+        cache.invalidate_users_list()
+        _invalidate_permissions()
+
+
+@receiver(m2m_changed, sender=Group.permissions.through, dispatch_uid='account_group_permissions_changed')
+def group_permissions_changed(sender, action, **kwargs):
+    if action.startswith('post_'):
+        _invalidate_permissions()
+
+
+@receiver(post_delete, sender=Group, dispatch_uid='account_group_deleted')
+@receiver(post_delete, sender=Permission, dispatch_uid='account_permission_deleted')
+def permissions_deleted(sender, **kwargs):
+    _invalidate_permissions()
+
+
+@receiver(user_logged_in, dispatch_uid='account_user_logged_in')
+def user_logged_in_recorded(sender, user, **kwargs):
+    activity.record_login(user)
@@ -0,0 +1,76 @@
+"""
+Account side effects run by Celery workers (``projectx.celery``).
+
+Sending mail can take seconds, or fail for a while when the SMTP server is
+down, so it never happens in a request: views enqueue these tasks with
+``delay_on_commit()`` and answer right away. Tasks take ids, not users,
+and read the rows themselves, so they see the committed state. Failures
+to talk to the mail server are retried with exponential backoff and
+jitter, up to ``MAX_RETRIES`` times, on workers; eager tasks fail at once.
+"""
+import logging
+from smtplib import SMTPException
+
+from celery import shared_task
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core import mail
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from django.utils.translation import gettext as _
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+RETRY_FOR = (SMTPException, OSError)
+MAX_RETRIES = 5
+# seconds, doubled per attempt up to RETRY_BACKOFF_MAX
+RETRY_BACKOFF = 30
+RETRY_BACKOFF_MAX = 600
+# users per password reset task, enqueued by the admin action
+RESET_BATCH_SIZE = 100
+
+RETRY_OPTIONS = dict(autoretry_for=RETRY_FOR, max_retries=MAX_RETRIES, retry_backoff=RETRY_BACKOFF,
+                     retry_backoff_max=RETRY_BACKOFF_MAX, retry_jitter=True)
+
+
+@shared_task(**RETRY_OPTIONS)
+def send_welcome_email(user_id):
+    user = User.objects.filter(pk=user_id, is_active=True).exclude(email='').first()
+    if user is None:
+        return
+    mail.send_mail(
+        _('Welcome, %(name)s') % {'name': user.get_short_name() or user.username},
+        _('Your account %(username)s is ready.') % {'username': user.username},
+        settings.DEFAULT_FROM_EMAIL,
+        [user.email])
+    logger.info('welcome email sent to user %s', user_id)
+
+
+def get_password_reset_url(user):
+    return settings.PASSWORD_RESET_URL.format(
+        uid=urlsafe_base64_encode(force_bytes(user.pk)),
+        token=default_token_generator.make_token(user))
+
+
+@shared_task(**RETRY_OPTIONS)
+def send_password_reset_emails(user_ids):
+    """
+    Password reset links to the active users of ``user_ids``, over one
+    mail server connection. A retry sends the whole batch again; the
+    links of the first attempt stay valid until the password is changed.
+    """
+    messages = [
+        mail.EmailMessage(
+            _('Reset your password'),
+            _('Hi %(username)s, choose a new password at %(url)s') % {
+                'username': user.username, 'url': get_password_reset_url(user)},
+            settings.DEFAULT_FROM_EMAIL,
+            [user.email])
+        for user in User.objects.filter(pk__in=user_ids, is_active=True).exclude(email='').order_by('pk')]
+    if messages:
+        mail.get_connection().send_messages(messages)
+    logger.info('%d password reset emails sent', len(messages))
+    return len(messages)
@@ -1,14 +1,44 @@
-from django.contrib.auth import get_user_model
-from django.urls import reverse
-from model_bakery import baker
+import json
+import re
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
+
+from asgiref.sync import iscoroutinefunction
+from celery.exceptions import Retry
+from django.contrib.admin import site as admin_site
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.tokens import default_token_generator
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, connection
+from django.db.models import QuerySet
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from model_bakery import baker, random_gen
 from rest_framework import status
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from account import activity, cache as account_cache, hashing, tasks
+from account.admin import UserAdmin
+from account.tokens import ClaimsUser
+from account.views import UserViewSet
+from projectx.testing import QueryAssertionsMixin, async_views
+from projectx.utils import LimitOffsetPagination10v2
 
 
 User = get_user_model()
 
+baker.generators.add('account.models.LowercaseEmailField', random_gen.gen_email)
+baker.generators.add('account.models.PhoneNumberField', random_gen.gen_string)
+
 
-class TestUserViewSet(APITestCase):
+class TestUserViewSet(QueryAssertionsMixin, APITestCase):
     @classmethod
     def setUpTestData(cls):
         cls.users_url = reverse('users-list')
@@ -24,6 +54,9 @@ class TestUserViewSet(APITestCase):
                    username='darkLord',
                    email='darkLord@voldy.com')
 
+    def setUp(self):
+        cache.clear()
+
     def test_user_registration_with_all_valid_data(self):
         data = {
             "username": "testUser",
@@ -39,8 +72,24 @@ class TestUserViewSet(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertTrue(response_json.get('id'))
         self.assertEqual(response_json.get('username'), data['username'])
-        self.assertEqual(response_json.get('email'), data['email'])
-        self.assertEqual(response_json.get('phone'), data['phone'])
+        # stored normalized
+        self.assertEqual(response_json.get('email'), 'testuser@google.yahoo')
+        self.assertEqual(response_json.get('phone'), '+8801777333777')
+
+    def test_email_and_phone_lookups_by_any_form(self):
+        self.existing_user.phone = '8801777333777'
+        self.existing_user.save()
+        self.assertEqual(User.objects.get(email='Existing@User.COM', phone='01777333777'), self.existing_user)
+
+        response = self.client.post(self.users_url, {'username': 'other', 'email': 'EXISTING@user.com',
+                                                     'password': 'SuperSecrete'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('email address already exists', response.json()['detail'])
+
+        self.client.force_login(self.existing_user)
+        for term in ('01777333777', '+8801777', '017773'):
+            response = self.client.get(self.users_url, {'search': term})
+            self.assertEqual([user['username'] for user in response.json()['results']], ['existing'], term)
 
     def test_user_registration_with_existing_username(self):
         data = {
@@ -81,6 +130,33 @@ class TestUserViewSet(APITestCase):
         response = self.client.get(self.users_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_token_user_skips_user_query(self):
+        data = {"username": "existing", "password": "existing_password"}
+        response = self.client.post(self.token_url, data)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + response.json()['access'])
+
+        self.client.get('/api/ping/')  # caches the auth stamp
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/ping/')
+        self.assertTrue(response.json()['is_authenticated'])
+
+        response = self.client.patch(self.users_url + '%s/' % self.existing_user.pk, {'first_name': 'Harry'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(self.users_url + 'me/')
+        self.assertEqual(response.json()['first_name'], 'Harry')
+
+    def test_password_change_revokes_token(self):
+        data = {"username": "existing", "password": "existing_password"}
+        response = self.client.post(self.token_url, data)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + response.json()['access'])
+        self.assertEqual(self.client.get(self.users_url + 'me/').status_code, status.HTTP_200_OK)
+
+        self.existing_user.set_password('new_password')
+        self.existing_user.save()
+        response = self.client.get(self.users_url + 'me/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(response.json()['detail'], 'Token has been revoked')
+
     def test_get_all_users(self):
         self.client.force_login(self.existing_user)
         response = self.client.get(self.users_url)
@@ -88,6 +164,14 @@ class TestUserViewSet(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response_json['count'], 2)
 
+    def test_list_users_without_n_plus_one(self):
+        baker.make('account.User', _quantity=10)
+        self.client.force_login(self.existing_user)
+        with self.assertNoNPlusOne():
+            response = self.client.get(self.users_url + '?page_size=20')
+        self.assertEqual(response.json()['count'], 12)
+        self.assertIn('queries', response['Server-Timing'])
+
     def test_search_users(self):
         self.client.force_login(self.existing_user)
         response = self.client.get(self.users_url + "?search=existing")
@@ -95,3 +179,523 @@ class TestUserViewSet(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response_json['count'], 1)
         self.assertEqual(response_json['results'][0]['username'], self.existing_user.username)
+
+    def test_keyset_pagination(self):
+        self.client.force_login(self.existing_user)
+        response = self.client.get(self.users_url, {'cursor': '', 'length': 1})
+        response_json = response.json()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response_json['recordsFiltered'], 2)
+        self.assertEqual(response_json['data'][0]['username'], 'darkLord')
+        self.assertIsNone(response_json['previous'])
+
+        response = self.client.get(response_json['next'])
+        response_json = response.json()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response_json['data'][0]['username'], 'existing')
+        self.assertIsNone(response_json['next'])
+
+    def test_keyset_pagination_rejects_tampered_cursor(self):
+        self.client.force_login(self.existing_user)
+        response = self.client.get(self.users_url, {'cursor': 'cD1leGlzdGluZw=='})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_keyset_pagination_rejects_search(self):
+        self.client.force_login(self.existing_user)
+        response = self.client.get(self.users_url, {'cursor': '', 'search': 'exist'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('cursor', response.json()['detail'])
+
+    def test_sparse_fieldsets(self):
+        self.client.force_login(self.existing_user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.users_url, {'fields': 'id,email'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([list(row) for row in response.json()['results']], [['id', 'email'], ['id', 'email']])
+        select = next(query['sql'] for query in queries.captured_queries if 'ORDER BY' in query['sql'])
+        self.assertNotIn('password', select)
+        self.assertNotIn('last_login', select)
+
+        response = self.client.get(self.users_url, {'omit': 'phone,email', 'cursor': '', 'length': 1})
+        self.assertEqual(list(response.json()['data'][0]), ['id', 'username', 'first_name', 'last_name'])
+        response = self.client.get(response.json()['next'])
+        self.assertEqual(response.json()['data'][0]['username'], 'existing')
+
+        for params in ({'fields': 'id,password'}, {'fields': 'bogus'}, {'omit': 'id,username,email,first_name,last_name,phone'}):
+            response = self.client.get(self.users_url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    @mock.patch.object(UserViewSet, 'pagination_class', LimitOffsetPagination10v2)
+    def test_stream_all_users_for_app(self):
+        self.client.force_login(self.existing_user)
+        response = self.client.get(self.users_url, HTTP_FROMAPP='true')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        response_json = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(response_json['recordsFiltered'], 2)
+        self.assertEqual([user['username'] for user in response_json['data']],
+                         ['darkLord', 'existing'])
+
+        response = self.client.get(self.users_url, HTTP_FROMAPP='true',
+                                   HTTP_ACCEPT='application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(json.loads(lines[1])['username'], 'existing')
+
+        response = self.client.get(self.users_url + 'me/', HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+
+        response = self.client.get(self.users_url, {'length': 1}, HTTP_FROMAPP='true')
+        self.assertFalse(response.streaming)
+        self.assertEqual(len(response.json()['data']), 1)
+
+    def test_me_is_cached_and_invalidated_on_save(self):
+        self.client.force_authenticate(self.existing_user)
+        me_url = self.users_url + 'me/'
+        stats = account_cache.get_stats()
+
+        response = self.client.get(me_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(me_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(account_cache.get_stats()['hits'], stats['hits'] + 1)
+
+        self.existing_user.first_name = 'Changed'
+        self.existing_user.save()
+        response = self.client.get(me_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['first_name'], 'Changed')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_is_cached_per_url_and_permission_scope(self):
+        other, *_ = baker.make('account.User', _quantity=20)
+        params = {'page': 1}
+        self.client.force_authenticate(self.existing_user)
+        response = self.client.get(self.users_url, params)
+        self.assertTrue(response.json()['next'].startswith('http://testserver/'))
+
+        # another user with the same permissions shares the page
+        self.client.force_authenticate(other)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.users_url, params).json(), response.json())
+
+        # but not with another host or scheme, the links are absolute
+        response = self.client.get(self.users_url, params, HTTP_HOST='localhost')
+        self.assertTrue(response.json()['next'].startswith('http://localhost/'))
+        response = self.client.get(self.users_url, params, secure=True)
+        self.assertTrue(response.json()['next'].startswith('https://testserver/'))
+
+        other.is_staff = True
+        self.client.force_authenticate(other)
+        stats = account_cache.get_stats()
+        self.client.get(self.users_url, params)
+        self.assertEqual(account_cache.get_stats()['misses'], stats['misses'] + 1)
+
+    def test_retrieve_is_cached_by_normalized_pk(self):
+        self.client.force_authenticate(self.existing_user)
+        url = '%s%d/' % (self.users_url, self.existing_user.pk)
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get('%s0%d/' % (self.users_url, self.existing_user.pk),
+                                   HTTP_IF_NONE_MATCH='"other", W/%s' % etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"x%s"' % etag.strip('"'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(self.users_url + 'abc/').status_code, status.HTTP_404_NOT_FOUND)
+
+        self.existing_user.first_name = 'Changed'
+        self.existing_user.save()
+        response = self.client.get('%s0%d/' % (self.users_url, self.existing_user.pk))
+        self.assertEqual(response.json()['first_name'], 'Changed')
+
+    def test_search_users_by_prefix(self):
+        self.client.force_login(self.existing_user)
+        response = self.client.get(self.users_url, {'search': 'exist'})
+        self.assertEqual([user['username'] for user in response.json()['results']], ['existing'])
+
+        response = self.client.get(self.users_url, {'search': 'voldy.com'})
+        self.assertEqual([user['username'] for user in response.json()['results']], ['darkLord'])
+
+        self.existing_user.last_name = 'Potter'
+        self.existing_user.save()
+        response = self.client.get(self.users_url, {'search': 'pott'})
+        self.assertEqual([user['username'] for user in response.json()['results']], ['existing'])
+
+    def test_search_ranks_a_limited_number_of_matches(self):
+        self.client.force_login(self.existing_user)
+        response = self.client.get(self.users_url, {'search': 'com'})
+        self.assertEqual(response.json()['count'], 2)
+
+        cache.clear()
+        with override_settings(ACCOUNT_SEARCH_MAX_CANDIDATES=1):
+            response = self.client.get(self.users_url, {'search': 'com'})
+        self.assertEqual(response.json()['count'], 1)
+
+    async def test_async_me_with_token(self):
+        with async_views():
+            await self._test_async_me_with_token()
+
+    async def _test_async_me_with_token(self):
+        response = await self.async_client.post(
+            self.token_url, {'username': 'existing', 'password': 'existing_password'},
+            content_type='application/json')
+        headers = {'Authorization': 'Bearer ' + response.json()['access']}
+
+        response = await self.async_client.get('/api/ping/', headers=headers)
+        self.assertTrue(response.json()['is_authenticated'])
+
+        response = await self.async_client.get(self.users_url + 'me/', headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['username'], 'existing')
+
+        response = await self.async_client.get(
+            self.users_url + str(self.existing_user.pk) + '/', headers=headers)
+        self.assertEqual(response.json()['email'], 'existing@user.com')
+
+    @mock.patch.object(UserViewSet, 'pagination_class', LimitOffsetPagination10v2)
+    async def test_async_stream_all_users_for_app(self):
+        await self.async_client.aforce_login(self.existing_user)
+        with async_views():
+            self.assertTrue(iscoroutinefunction(resolve(self.users_url).func))
+            response = await self.async_client.get(self.users_url, headers={'fromApp': 'true'})
+            content = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(json.loads(content)['recordsFiltered'], 2)
+
+    def test_login_rehashes_password_from_old_hasher(self):
+        self.existing_user.password = make_password('existing_password', hasher='pbkdf2_sha1')
+        self.existing_user.save()
+
+        response = self.client.post(self.token_url, {"username": "existing", "password": "existing_password"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.existing_user.refresh_from_db()
+        self.assertTrue(self.existing_user.password.startswith('pbkdf2_sha256$'))
+
+    @override_settings(PASSWORD_HASHING_MAX_PENDING=0)
+    def test_login_is_shed_when_hashing_is_saturated(self):
+        response = self.client.post(self.token_url, {"username": "existing", "password": "existing_password"})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        # outside the API hashing waits instead: admin login, ModelBackend, commands
+        self.assertEqual(authenticate(username='existing', password='existing_password'), self.existing_user)
+        self.existing_user.set_password('wingardium')
+        self.assertTrue(self.existing_user.check_password('wingardium'))
+
+    @override_settings(PASSWORD_HASHING_WORKERS=1)
+    def test_hashing_in_process_pool(self):
+        hashing.shutdown()
+        self.addCleanup(hashing.shutdown)
+        encoded = hashing.make_password('secret')
+        self.assertEqual(hashing.verify_password('secret', encoded), (True, False))
+
+    def test_bulk_create_update_delete(self):
+        bulk_url = self.users_url + 'bulk/'
+        records = [
+            {'username': 'bulk1', 'email': 'bulk1@user.com', 'password': 'secret'},
+            {'username': 'bulk2', 'email': 'bulk2@user.com', 'password': 'secret'},
+            {'username': 'bulk2', 'email': 'bulk3@user.com', 'password': 'secret'},
+            {'username': 'bulk4', 'email': 'existing@user.com', 'password': 'secret'},
+            {'username': 'bulk5'},
+        ]
+        self.client.force_authenticate(self.existing_user)
+        response = self.client.post(bulk_url, records, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.existing_user.is_staff = True
+        self.client.force_authenticate(self.existing_user)
+        with self.assertNumQueries(4):  # uniqueness check, the insert and its savepoint
+            response = self.client.post(bulk_url, records, format='json')
+        results = response.json()
+        self.assertEqual([result['status'] for result in results],
+                         ['created', 'created', 'error', 'error', 'error'])
+        self.assertIn('username', results[2]['errors'])
+        self.assertIn('email', results[3]['errors'])
+        self.assertIn('password', results[4]['errors'])
+        self.assertTrue(User.objects.get(pk=results[0]['id']).check_password('secret'))
+
+        response = self.client.patch(bulk_url, [
+            {'id': results[0]['id'], 'first_name': 'Bulk'},
+            {'id': results[1]['id'], 'email': 'existing@user.com'},
+            {'id': 0, 'first_name': 'Nobody'},
+        ], format='json')
+        self.assertEqual([result['status'] for result in response.json()], ['updated', 'error', 'error'])
+        self.assertEqual(User.objects.get(pk=results[0]['id']).first_name, 'Bulk')
+
+        response = self.client.delete(bulk_url, [results[0]['id'], results[1]['id'], 0], format='json')
+        self.assertEqual([result['status'] for result in response.json()], ['deleted', 'deleted', 'error'])
+        self.assertFalse(User.objects.filter(username__startswith='bulk').exists())
+
+    def test_bulk_is_limited_for_staff(self):
+        bulk_url = self.users_url + 'bulk/'
+        staff = baker.make('account.User', is_staff=True)
+        admin = baker.make('account.User', is_staff=True, is_superuser=True, email='admin@user.com')
+        other, another = baker.make('account.User', _quantity=2)
+        self.client.force_authenticate(staff)
+
+        response = self.client.patch(bulk_url, [
+            {'id': admin.pk, 'email': 'mine@user.com'},
+            {'id': another.pk, 'password': 'secret'},
+            {'id': other.pk, 'first_name': 'Other'},
+            {'id': other.pk, 'last_name': 'Twice'},
+            {'id': 'abc', 'first_name': 'Nobody'},
+            {'id': [other.pk], 'first_name': 'Nobody'},
+            {'id': True, 'first_name': 'Nobody'},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()
+        self.assertEqual([result['status'] for result in results], ['error', 'error', 'updated'] + ['error'] * 4)
+        self.assertTrue(all('id' in result['errors'] for result in results if result['status'] == 'error'))
+        admin.refresh_from_db()
+        self.assertEqual(admin.email, 'admin@user.com')
+
+        count = User.objects.count()
+        response = self.client.delete(bulk_url, [admin.pk, staff.pk, True, 'abc', {}], format='json')
+        self.assertEqual([result['status'] for result in response.json()], ['error'] * 5)
+        self.assertEqual(User.objects.count(), count)
+
+        self.client.force_authenticate(admin)
+        response = self.client.delete(bulk_url, [staff.pk], format='json')
+        self.assertEqual(response.json()[0]['status'], 'deleted')
+
+    def test_bulk_update_lost_unique_race(self):
+        other = baker.make('account.User')
+        self.client.force_authenticate(baker.make('account.User', is_staff=True))
+        with mock.patch('django.db.models.query.QuerySet.bulk_update', side_effect=IntegrityError):
+            response = self.client.patch(self.users_url + 'bulk/', [
+                {'id': other.pk, 'email': 'raced@user.com'},
+                {'id': self.existing_user.pk, 'first_name': 'Fine'},
+            ], format='json')
+        self.assertEqual([result['status'] for result in response.json()], ['updated', 'updated'])
+        self.assertEqual(User.objects.get(pk=other.pk).email, 'raced@user.com')
+
+
+class TestPermissionCache(QueryAssertionsMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='perms', email='perms@user.com', password='secret')
+        cls.group = Group.objects.create(name='editors')
+        cls.change_user = Permission.objects.get(codename='change_user')
+        cls.view_user = Permission.objects.get(codename='view_user')
+        cls.delete_user = Permission.objects.get(codename='delete_user')
+        cls.group.permissions.add(cls.change_user)
+        cls.user.groups.add(cls.group)
+        cls.user.user_permissions.add(cls.view_user)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_user(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def test_permissions_are_loaded_in_one_query_and_cached(self):
+        user = self.get_user()
+        with self.assertNumQueries(1):
+            self.assertTrue(user.has_perm('account.change_user'))
+            self.assertTrue(user.has_perm('account.view_user'))
+            self.assertFalse(user.has_perm('account.delete_user'))
+            self.assertTrue(user.has_module_perms('account'))
+
+        user = self.get_user()
+        with self.assertNumQueries(0):
+            self.assertEqual(user.get_all_permissions(), {'account.change_user', 'account.view_user'})
+
+    def test_cache_is_invalidated_on_m2m_changes(self):
+        self.assertFalse(self.get_user().has_perm('account.delete_user'))
+        self.group.permissions.add(self.delete_user)
+        self.assertTrue(self.get_user().has_perm('account.delete_user'))
+
+        self.user.groups.remove(self.group)
+        self.assertEqual(self.get_user().get_all_permissions(), {'account.view_user'})
+
+        self.view_user.user_set.clear()
+        self.assertEqual(self.get_user().get_all_permissions(), set())
+
+        self.user.user_permissions.add(self.delete_user)
+        self.user.is_active = False
+        self.user.save()
+        self.assertFalse(self.get_user().has_perm('account.delete_user'))
+
+    def test_token_user_checks_permissions_without_the_user_row(self):
+        self.get_user().get_all_permissions()
+        user = ClaimsUser(AccessToken.for_user(self.user))
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perms(['account.change_user', 'account.view_user']))
+            self.assertFalse(user.has_perm('account.delete_user'))
+
+    def test_admin_pages_without_n_plus_one(self):
+        admin = User.objects.create_superuser(username='admin', email='admin@user.com', password='secret')
+        self.client.force_login(admin)
+        urls = [reverse('admin:auth_permission_changelist'),
+                reverse('admin:auth_permission_changelist') + '?q=user',
+                reverse('admin:account_user_changelist'),
+                reverse('admin:account_user_change', args=[self.user.pk])]
+        for url in urls:
+            with self.subTest(url=url), self.assertNoNPlusOne():
+                response = self.client.get(url, HTTP_HOST='localhost')
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class TestNormalizeUsers(TestCase):
+    def plant(self, user, email, phone):
+        # stored the way clients sent it, before account.models normalized
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE account_user SET email = %s, phone = %s WHERE id = %s', [email, phone, user.pk])
+
+    def test_backfill_in_batches(self):
+        users = [User.objects.create_user(username='user%d' % i, email='user%d@x.com' % i) for i in range(5)]
+        self.plant(users[0], 'User0@X.com', '01777333777')
+        self.plant(users[1], 'user1@x.com', '8801999888777')
+        self.plant(users[3], 'USER4@x.com', '')  # clashes with users[4]
+
+        out = StringIO()
+        call_command('normalize_users', batch_size=2, dry_run=True, stdout=out)
+        self.assertIn('Would normalize 2 of 5 users.', out.getvalue())
+        self.assertEqual(User.objects.filter(email__in=['User0@X.com']).count(), 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command('normalize_users', batch_size=2, stdout=out)
+        statements = [query['sql'].split()[0] for query in queries.captured_queries
+                      if 'SAVEPOINT' not in query['sql']]
+        # the clashes, then per batch a read and, for the first, its update
+        self.assertEqual(statements, ['SELECT', 'SELECT', 'UPDATE', 'SELECT', 'SELECT', 'SELECT'])
+        self.assertIn('Normalized 2 of 5 users.', out.getvalue())
+        self.assertIn('pk %d' % users[3].pk, out.getvalue())
+        rows = dict(User.objects.filter(pk__in=[user.pk for user in users[:4]]).values_list('email', 'phone'))
+        self.assertEqual(rows, {'user0@x.com': '+8801777333777', 'user1@x.com': '+8801999888777',
+                                'user2@x.com': '', 'USER4@x.com': ''})
+
+
+class TestActivityTracker(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(username='user%d' % i, email='user%d@x.com' % i,
+                                              password='password%d' % i) for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        self.tracker = activity.ActivityTracker()
+        patcher = mock.patch.object(activity, 'tracker', self.tracker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_requests_are_written_behind(self):
+        user = self.users[0]
+        response = self.client.post(reverse('token_obtain_pair'), {'username': 'user0', 'password': 'password0'},
+                                    HTTP_HOST='localhost')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/ping/', HTTP_AUTHORIZATION='Bearer ' + response.json()['access'],
+                            HTTP_HOST='localhost')
+        self.assertFalse([query for query in queries.captured_queries if 'UPDATE "account_user"' in query['sql']])
+        user.refresh_from_db()
+        self.assertIsNone(user.last_seen)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.tracker.flush(), 1)
+        user.refresh_from_db()
+        self.assertIsNotNone(user.last_seen)
+
+    def test_a_login_invalidates_password_reset_tokens(self):
+        user = self.users[0]
+        token = default_token_generator.make_token(user)
+        with self.assertNumQueries(2):
+            response = self.client.post(reverse('token_obtain_pair'),
+                                        {'username': 'user0', 'password': 'password0'}, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertIsNotNone(user.last_login)
+        self.assertFalse(default_token_generator.check_token(user, token))
+
+        token = default_token_generator.make_token(self.users[1])
+        self.client.force_login(self.users[1])
+        self.users[1].refresh_from_db()
+        self.assertFalse(default_token_generator.check_token(self.users[1], token))
+
+    def test_at_most_one_write_per_user_per_interval(self):
+        user_ids = [user.pk for user in self.users]
+        for user_id in user_ids:
+            self.assertTrue(self.tracker.record(user_id, 'last_seen'))
+        self.assertFalse(self.tracker.record(user_ids[0], 'last_seen'))
+        with self.assertNumQueries(1):
+            self.assertEqual(self.tracker.flush(), 3)
+
+        with self.assertNumQueries(0):
+            self.assertFalse(self.tracker.record(user_ids[0], 'last_seen'))
+            self.assertEqual(self.tracker.flush(), 0)
+
+        # another worker: recorded there, but claimed here already
+        other = activity.ActivityTracker()
+        self.assertTrue(other.record(user_ids[0], 'last_seen'))
+        with self.assertNumQueries(0):
+            self.assertEqual(other.flush(), 0)
+
+        with override_settings(ACCOUNT_ACTIVITY_INTERVAL=0):
+            self.assertTrue(self.tracker.record(user_ids[0], 'last_seen'))
+            self.assertEqual(self.tracker.flush(), 1)
+
+    def test_failed_writes_are_retried(self):
+        self.tracker.batch_size = 1
+        for user in self.users:
+            self.tracker.record(user.pk, 'last_seen')
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=[1, DatabaseError('gone')]):
+            with self.assertRaises(DatabaseError):
+                self.tracker.flush()
+
+        # put back and unclaimed, so another worker could write them too
+        self.assertEqual(self.tracker.flush(), 2)
+        self.assertEqual(User.objects.filter(last_seen__isnull=False).count(), 2)
+
+
+class TestAccountTasks(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='harry', email='harry@hogwarts.edu', password='alohomora')
+
+    def test_welcome_email_is_sent_after_registration(self):
+        data = {'username': 'ron', 'email': 'ron@hogwarts.edu', 'password': 'SuperSecrete'}
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('users-list'), data, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(mail.outbox), 0)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual([message.to for message in mail.outbox], [['ron@hogwarts.edu']])
+
+    def test_mail_server_errors_are_retried_on_workers_only(self):
+        task = tasks.send_welcome_email
+        with mock.patch('account.tasks.mail.send_mail', side_effect=SMTPException('down')) as send_mail:
+            result = task.delay(self.user.pk)
+        self.assertTrue(result.failed())
+        self.assertEqual(send_mail.call_count, 1)
+
+        task.push_request(called_directly=False, is_eager=False, retries=0, id='task-id', args=[self.user.pk], kwargs={})
+        self.addCleanup(task.pop_request)
+        with mock.patch.object(task, 'apply_async') as apply_async:
+            with self.assertRaises(Retry):
+                task.retry(exc=SMTPException('down'), countdown=30)
+        self.assertEqual(apply_async.call_count, 1)
+
+    def test_password_reset(self):
+        inactive = User.objects.create_user(username='tom', email='tom@riddle.com', is_active=False)
+        request = RequestFactory().post('/')
+        user_admin = UserAdmin(User, admin_site)
+        with mock.patch.object(user_admin, 'message_user'), self.captureOnCommitCallbacks(execute=True):
+            user_admin.send_password_reset(request, User.objects.filter(pk__in=[self.user.pk, inactive.pk]))
+        self.assertEqual([message.to for message in mail.outbox], [['harry@hogwarts.edu']])
+
+        uid, token = re.search(r'/reset-password/([^/]+)/([^/]+)/', mail.outbox[0].body).groups()
+        url = reverse('users-reset-password')
+        response = self.client.post(url, {'uid': uid, 'token': token, 'password': 'harry'}, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("'password'", response.json()['detail'])
+
+        response = self.client.post(url, {'uid': uid, 'token': token, 'password': 'expelliarmus'},
+                                    HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('expelliarmus'))
+
+        response = self.client.post(url, {'uid': uid, 'token': token, 'password': 'wingardium'}, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,163 @@
+"""
+Stateless access tokens.
+
+Tokens issued by ``account.serializers.TokenObtainPairSerializer`` carry
+the claims in ``TOKEN_USER_CLAIMS`` and an auth stamp, so authentication
+can build a ``ClaimsUser`` without loading the user row.
+
+The stamp is an HMAC of the fields whose change has to revoke outstanding
+tokens (password, is_active, is_staff, is_superuser). The current stamp of
+each user lives in the cache and is dropped by the user signals, so
+checking a token is one cache get; only the first request after a change
+reads the row again.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import PermissionsMixin
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.crypto import salted_hmac
+from rest_framework_simplejwt.models import TokenUser
+
+AUTH_STAMP_KEY = 'account:auth_stamp:%s'
+AUTH_STAMP_CLAIM = 'ver'
+AUTH_STAMP_FIELDS = ('password', 'is_active', 'is_staff', 'is_superuser')
+TOKEN_USER_CLAIMS = ('username', 'email', 'is_staff', 'is_superuser')
+
+# stamp of a user that no longer exists
+REVOKED = '-'
+
+User = get_user_model()
+
+
+def make_auth_stamp(password, is_active, is_staff, is_superuser):
+    value = '%s:%d:%d:%d' % (password, is_active, is_staff, is_superuser)
+    return salted_hmac('account.tokens.auth_stamp', value, algorithm='sha256').hexdigest()[:16]
+
+
+def get_claims(user):
+    claims = {claim: getattr(user, claim) for claim in TOKEN_USER_CLAIMS}
+    claims[AUTH_STAMP_CLAIM] = make_auth_stamp(*(getattr(user, field) for field in AUTH_STAMP_FIELDS))
+    return claims
+
+
+def get_timeout():
+    return getattr(settings, 'ACCOUNT_CACHE_TIMEOUT', 300)
+
+
+def get_auth_stamp(user_id):
+    # read from the primary, a lagging replica would bring back a revoked stamp
+    key = AUTH_STAMP_KEY % user_id
+    stamp = cache.get(key)
+    if stamp is None:
+        row = User.objects.using(DEFAULT_DB_ALIAS).filter(pk=user_id).values_list(*AUTH_STAMP_FIELDS).first()
+        stamp = make_auth_stamp(*row) if row else REVOKED
+        cache.set(key, stamp, get_timeout())
+    return stamp
+
+
+async def aget_auth_stamp(user_id):
+    key = AUTH_STAMP_KEY % user_id
+    stamp = await cache.aget(key)
+    if stamp is None:
+        row = await User.objects.using(DEFAULT_DB_ALIAS).filter(pk=user_id).values_list(*AUTH_STAMP_FIELDS).afirst()
+        stamp = make_auth_stamp(*row) if row else REVOKED
+        await cache.aset(key, stamp, get_timeout())
+    return stamp
+
+
+def forget_auth_stamp(user_id):
+    cache.delete(AUTH_STAMP_KEY % user_id)
+    _users.pop(user_id)
+
+
+def forget_auth_stamps(user_ids):
+    cache.delete_many([AUTH_STAMP_KEY % user_id for user_id in user_ids])
+    for user_id in user_ids:
+        _users.pop(user_id)
+
+
+class TTLCache:
+    """
+    Small thread-safe LRU whose entries expire after ``ttl`` seconds.
+    """
+    def __init__(self, maxsize=1024, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+_users = TTLCache(ttl=getattr(settings, 'TOKEN_USER_CACHE_TTL', 30))
+
+
+class ClaimsUser(TokenUser):
+    """
+    ``request.user`` for tokens that carry an auth stamp. ``pk``,
+    ``username``, ``email``, ``is_staff`` and ``is_superuser`` come from
+    the token; any other field needs the row from ``get_user()``, which is
+    cached in-process for ``TOKEN_USER_CACHE_TTL`` seconds and may be that
+    much behind. Load the user from the database where that matters.
+    """
+    def get_user(self):
+        user = _users.get(self.pk)
+        if user is None:
+            user = User.objects.get(pk=self.pk)
+            _users.set(self.pk, user)
+        return user
+
+    async def aget_user(self):
+        user = _users.get(self.pk)
+        if user is None:
+            user = await User.objects.aget(pk=self.pk)
+            _users.set(self.pk, user)
+        return user
+
+    @property
+    def groups(self):
+        return self.get_user().groups
+
+    @property
+    def user_permissions(self):
+        return self.get_user().user_permissions
+
+    def get_group_permissions(self, obj=None):
+        return self.get_user().get_group_permissions(obj)
+
+    # the rest go through the auth backends with the token's pk and
+    # is_superuser, the cached permission set needs no user row
+    get_all_permissions = PermissionsMixin.get_all_permissions
+    aget_all_permissions = PermissionsMixin.aget_all_permissions
+    has_perm = PermissionsMixin.has_perm
+    ahas_perm = PermissionsMixin.ahas_perm
+    has_perms = PermissionsMixin.has_perms
+    ahas_perms = PermissionsMixin.ahas_perms
+    has_module_perms = PermissionsMixin.has_module_perms
+    ahas_module_perms = PermissionsMixin.ahas_module_perms
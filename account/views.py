@@ -1,35 +1,157 @@
 from django.contrib.auth import get_user_model
-from rest_framework import viewsets, filters
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import AllowAny
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
-from account.serializers import UserSerializer
+from account import cache, tasks
+from account.bulk import BulkUserService
+from account.search import UserSearchFilter
+from account.serializers import PasswordResetSerializer, UserSerializer
+from account.tokens import ClaimsUser
 from projectx.permissions import IsOwnAccount
+from projectx.utils import KeysetPagination, StreamingListModelMixin
+from projectx.views import AsyncAPIViewMixin, SparseFieldsMixin
 
 User = get_user_model()
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(AsyncAPIViewMixin, SparseFieldsMixin, StreamingListModelMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
-    filter_backends = [filters.SearchFilter]
-    search_fields = ('=username', '=email', '=phone',
+    # ?fields= / ?omit= on the list
+    sparse_fields = ('id', 'username', 'email', 'first_name', 'last_name', 'phone')
+    filter_backends = [UserSearchFilter]
+    # without a search backend: username__iexact uses the UPPER(username)
+    # index, email and phone are stored normalized and matched exactly
+    search_fields = ('=username', 'email__exact', 'phone__exact',
                      'first_name', 'last_name')
 
     def get_permissions(self):
-        if self.action == 'create':
+        if self.action in ('create', 'reset_password'):
             self.permission_classes = (AllowAny,)
 
         elif self.action in ('update', 'partial_update', 'destroy'):
             self.permission_classes = (IsOwnAccount,)
 
+        elif self.action == 'bulk':
+            self.permission_classes = (IsAdminUser,)
+
         return super().get_permissions()
 
+    @property
+    def paginator(self):
+        """
+        Clients opt into keyset pagination by sending a ``cursor`` query
+        parameter (empty for the first page); everyone else keeps the
+        default page number pagination. Search results are ordered by rank,
+        which is not unique and can't be seeked, so they are page numbered.
+        """
+        if not hasattr(self, '_paginator'):
+            if KeysetPagination.cursor_query_param in self.request.query_params:
+                if self.request.query_params.get(api_settings.SEARCH_PARAM):
+                    raise ValidationError({KeysetPagination.cursor_query_param: [
+                        _('Search results can not be paged with a cursor.')]})
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
+
+    def perform_create(self, serializer):
+        user = serializer.save()
+        tasks.send_welcome_email.delay_on_commit(user.pk)
+
+    def list(self, request, *args, **kwargs):
+        list_ = super().list
+        return cache.cached_response(
+            request, cache.users_list_key(request),
+            lambda: list_(request, *args, **kwargs))
+
+    async def alist(self, request, *args, **kwargs):
+        alist = super().alist
+        return await cache.acached_response(
+            request, await cache.ausers_list_key(request),
+            lambda: alist(request, *args, **kwargs))
+
+    def get_object_key(self):
+        """
+        Cache key of the user in the URL. Keyed by the normalized pk, so
+        ``/users/01/`` shares the entry of ``/users/1/``, and with it its
+        invalidation.
+        """
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            pk = User._meta.pk.to_python(self.kwargs[lookup_url_kwarg])
+        except DjangoValidationError:
+            raise NotFound
+        return cache.user_key(pk)
+
+    def retrieve(self, request, *args, **kwargs):
+        return cache.cached_response(
+            request, self.get_object_key(),
+            lambda: Response(self.get_serializer(self.get_object()).data))
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return await cache.acached_response(
+            request, self.get_object_key(),
+            self._aretrieve)
+
+    async def _aretrieve(self):
+        instance = await self.aget_object()
+        return Response(self.get_serializer(instance).data)
+
     @action(detail=False, methods=['get'])
     def me(self, request):
         """
         Get the authenticated user's details.
         """
-        serializer = self.get_serializer(request.user)
-        return Response(serializer.data)
+        return cache.cached_response(
+            request, cache.user_key(request.user.pk),
+            lambda: Response(self.get_serializer(self._get_me()).data))
+
+    def _get_me(self):
+        user = self.request.user
+        if isinstance(user, ClaimsUser):
+            user = self.get_queryset().get(pk=user.pk)
+        return user
+
+    async def ame(self, request):
+        return await cache.acached_response(
+            request, cache.user_key(request.user.pk),
+            self._ame)
+
+    async def _ame(self):
+        user = self.request.user
+        if isinstance(user, ClaimsUser):
+            user = await self.get_queryset().aget(pk=user.pk)
+        return Response(self.get_serializer(user).data)
+
+    @action(detail=False, methods=['post', 'patch', 'delete'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Staff only. Create (POST), partially update (PATCH, records need an
+        ``id``) or delete (DELETE, a list of ids) many users at once.
+        Answers with one result per record, see ``account.bulk``.
+        """
+        service = BulkUserService(request.user)
+        operation = {
+            'POST': service.create,
+            'PATCH': service.update,
+            'DELETE': service.delete,
+        }[request.method]
+        return Response(operation(request.data))
+
+    @action(detail=False, methods=['post'], url_path='reset-password')
+    def reset_password(self, request):
+        """
+        Set a new password with the ``uid`` and ``token`` of a password
+        reset email. Outstanding tokens of the user are revoked.
+        """
+        serializer = PasswordResetSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,77 @@
+"""
+Users created per second through POST /users/ one record at a time versus
+one POST /users/bulk/ with all of them.
+
+Runs inside a transaction that is rolled back at the end. Password hashing
+dominates both paths with the default hasher, ``--fast-hasher`` switches to
+MD5 to compare just the request/validation/insert overhead:
+
+    python benchmarks/bulk_users.py --users 2000 --fast-hasher
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'projectx.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.db import transaction  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+from django.urls import reverse  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+User = get_user_model()
+
+
+def make_records(prefix, count):
+    return [{'username': '%s_%d' % (prefix, i), 'email': '%s_%d@example.com' % (prefix, i),
+             'password': 'secret-%d' % i, 'first_name': 'Bench', 'last_name': str(i)}
+            for i in range(count)]
+
+
+def single(client, records):
+    started = time.perf_counter()
+    for record in records:
+        response = client.post(reverse('users-list'), record, format='json')
+        assert response.status_code == 201, response.content
+    return len(records) / (time.perf_counter() - started)
+
+
+def bulk(client, records):
+    started = time.perf_counter()
+    response = client.post(reverse('users-bulk'), records, format='json')
+    assert all(result['status'] == 'created' for result in response.json()), response.content
+    return len(records) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--fast-hasher', action='store_true')
+    args = parser.parse_args()
+
+    hashers = ['django.contrib.auth.hashers.MD5PasswordHasher'] if args.fast_hasher else None
+    with override_settings(**({'PASSWORD_HASHERS': hashers} if hashers else {}),
+                           ALLOWED_HOSTS=['*'], BULK_MAX_RECORDS=args.users):
+        with transaction.atomic():
+            admin = User.objects.create(username='bench_admin', email='bench_admin@example.com', is_staff=True)
+            client = APIClient()
+            client.force_authenticate(admin)
+
+            single_rate = single(client, make_records('single', args.users))
+            bulk_rate = bulk(client, make_records('bulk', args.users))
+            transaction.set_rollback(True)
+
+    print('users:  %d, hasher: %s' % (args.users, 'md5' if args.fast_hasher else 'default'))
+    print('single: %8.1f users/s' % single_rate)
+    print('bulk:   %8.1f users/s (%.1fx)' % (bulk_rate, bulk_rate / single_rate))
+
+
+if __name__ == '__main__':
+    main()
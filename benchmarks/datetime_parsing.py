@@ -0,0 +1,90 @@
+"""
+Values per second parsed by DRF's DateTimeField and DateField against the
+projectx.fields ones, with the DATETIME_INPUT_FORMATS of the settings,
+over a mix of the timestamps our clients send:
+
+    python benchmarks/datetime_parsing.py
+    python benchmarks/datetime_parsing.py --values 50000 --repeat 7
+
+Both fields must return the same value (or the same error) for every
+input, the script checks that before timing.
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'projectx.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from rest_framework import serializers  # noqa: E402
+from rest_framework.exceptions import ValidationError  # noqa: E402
+
+from projectx import fields  # noqa: E402
+
+# (label, share of the mix, template over a random datetime)
+MIX = (
+    ('ISO, JS toISOString', 40, lambda d: d.strftime('%Y-%m-%dT%H:%M:%S.') + '%03dZ' % (d.microsecond // 1000)),
+    ('ISO, offset', 10, lambda d: d.strftime('%Y-%m-%dT%H:%M:%S+06:00')),
+    ('ISO date', 15, lambda d: d.strftime('%Y-%m-%d')),
+    ('dd/mm/yyyy hh:mm', 15, lambda d: d.strftime('%d/%m/%Y %H:%M')),
+    ('dd/mm/yyyy', 10, lambda d: d.strftime('%d/%m/%Y')),
+    ('yyyy-mm-dd hh:mm:ss', 8, lambda d: d.strftime('%Y-%m-%d %H:%M:%S')),
+    ('invalid', 2, lambda d: d.strftime('%d.%m.%Y')),
+)
+
+
+def make_values(count, seed=0):
+    rng = random.Random(seed)
+    start = datetime.datetime(2020, 1, 1)
+    templates = [template for _, share, template in MIX for _ in range(share)]
+    values = []
+    for _ in range(count):
+        moment = start + datetime.timedelta(seconds=rng.uniform(0, 5 * 365 * 86400))
+        values.append(rng.choice(templates)(moment))
+    return values
+
+
+def parse_all(field, values):
+    results = []
+    for value in values:
+        try:
+            results.append(field.to_internal_value(value))
+        except ValidationError as error:
+            results.append(error.detail)
+    return results
+
+
+def rate(field, values, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        parse_all(field, values)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return len(values) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--values', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    values = make_values(args.values)
+    print('%d values: %s' % (len(values), ', '.join('%s %d%%' % (label, share) for label, share, _ in MIX)))
+    for label, drf_field, field in (('DateTimeField', serializers.DateTimeField(), fields.DateTimeField()),
+                                    ('DateField', serializers.DateField(), fields.DateField())):
+        assert parse_all(drf_field, values) == parse_all(field, values), label
+        before, now = rate(drf_field, values, args.repeat), rate(field, values, args.repeat)
+        print('%-14s DRF %10.0f values/s  projectx %10.0f values/s  x%.1f' % (label, before, now, now / before))
+
+
+if __name__ == '__main__':
+    main()
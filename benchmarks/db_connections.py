@@ -0,0 +1,80 @@
+"""
+Requests per second of a one-query request with a new connection per
+request (SQL_CONN_MAX_AGE=0), persistent connections (SQL_CONN_MAX_AGE=60)
+and the psycopg pool (SQL_POOL=True, PostgreSQL only).
+
+Each mode runs in its own process with the settings taken from the
+environment, like a worker would, and simulates requests by sending
+request_started/request_finished around the query, which is where Django
+opens and closes connections. Point it at the docker-compose database:
+
+    SQL_ENGINE=django.db.backends.postgresql SQL_HOST=localhost \\
+        python benchmarks/db_connections.py --threads 8 --requests 2000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'projectx.settings')
+
+MODES = {
+    'new connection': {'SQL_CONN_MAX_AGE': '0', 'SQL_POOL': 'False'},
+    'persistent': {'SQL_CONN_MAX_AGE': '60', 'SQL_POOL': 'False'},
+    'pool': {'SQL_CONN_MAX_AGE': '0', 'SQL_POOL': 'True'},
+}
+
+
+def worker(requests):
+    from django.core.signals import request_finished, request_started
+    from django.db import connection
+
+    for _ in range(requests):
+        request_started.send(sender=None)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        request_finished.send(sender=None)
+    connection.close()
+
+
+def child(threads, requests):
+    import django
+    django.setup()
+
+    per_thread = requests // threads
+    workers = [threading.Thread(target=worker, args=(per_thread,)) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    print(per_thread * threads / (time.perf_counter() - started))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args.threads, args.requests)
+
+    engine = os.environ.get('SQL_ENGINE', 'django.db.backends.sqlite3')
+    print('engine: %s, %d threads, %d requests' % (engine, args.threads, args.requests))
+    for mode, env in MODES.items():
+        if env['SQL_POOL'] == 'True' and 'postgresql' not in engine:
+            print('%-15s skipped, needs PostgreSQL' % mode)
+            continue
+        output = subprocess.run(
+            [sys.executable, __file__, '--child', '--threads', str(args.threads), '--requests', str(args.requests)],
+            env={**os.environ, **env}, capture_output=True, text=True, check=True).stdout
+        print('%-15s %8.1f requests/s' % (mode, float(output.split()[-1])))
+
+
+if __name__ == '__main__':
+    main()
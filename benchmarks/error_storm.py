@@ -0,0 +1,62 @@
+"""
+Throughput of projectx.exceptions.custom_exception_handler during a storm
+of identical unhandled errors (the database being down), with every error
+logged with its traceback and a traceback in every response (how it
+behaved before) versus the defaults: aggregated logging, no tracebacks.
+
+Errors go through the configured logging handlers (logs/info.log):
+
+    python benchmarks/error_storm.py --errors 20000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'projectx.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import OperationalError  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+
+from projectx.exceptions import custom_exception_handler  # noqa: E402
+
+
+def query():
+    raise OperationalError('connection to server at "db" (172.18.0.2), port 5432 failed: Connection refused')
+
+
+def view():
+    return query()
+
+
+def storm(count):
+    started = time.perf_counter()
+    for _ in range(count):
+        try:
+            view()
+        except Exception as exc:
+            custom_exception_handler(exc, {'view': None})
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--errors', type=int, default=20000)
+    args = parser.parse_args()
+
+    with override_settings(DEBUG=False, ERROR_TRACEBACK_SAMPLE_RATE=1.0, ERROR_LOG_WINDOW=0):
+        every = storm(args.errors)
+    with override_settings(DEBUG=False, ERROR_TRACEBACK_SAMPLE_RATE=0.0, ERROR_LOG_WINDOW=60):
+        aggregated = storm(args.errors)
+
+    print('log + traceback every error: %9.1f errors/s' % every)
+    print('aggregated, no tracebacks:   %9.1f errors/s (%.1fx)' % (aggregated, aggregated / every))
+
+
+if __name__ == '__main__':
+    main()
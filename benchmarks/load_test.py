@@ -0,0 +1,119 @@
+"""
+Requests per second and latency of runserver against gunicorn (threaded
+WSGI workers and uvicorn ASGI workers, settings from gunicorn.conf.py) for
+/api/ping/ and a static file. 'gunicorn gthread async' forces the async
+views (ASYNC_VIEWS) onto the threaded workers, to compare with the sync
+views they run by default.
+
+Starts each server on a local port with SQLite, then runs keep-alive
+client threads against it for a fixed time:
+
+    python benchmarks/load_test.py --connections 16 --seconds 10
+"""
+import argparse
+import http.client
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GTHREAD = [sys.executable, '-m', 'gunicorn', 'projectx.wsgi', '-b', '127.0.0.1:{port}']
+# name -> (command, extra environment)
+SERVERS = {
+    'runserver': ([sys.executable, 'manage.py', 'runserver', '--noreload', '127.0.0.1:{port}'], {}),
+    'gunicorn gthread': (GTHREAD, {}),
+    'gunicorn gthread async': (GTHREAD, {'ASYNC_VIEWS': 'True'}),
+    'gunicorn uvicorn': ([sys.executable, '-m', 'gunicorn', 'projectx.asgi', '-b', '127.0.0.1:{port}',
+                          '-k', 'uvicorn.workers.UvicornWorker'], {}),
+}
+PATHS = {
+    'ping': '/api/ping/',
+    'static': '/static/admin/css/base.css',
+}
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', PATHS['ping'])
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server on port %d did not start' % port)
+
+
+def client(port, path, deadline, latencies, errors):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            connection.request('GET', path, headers={'Accept-Encoding': 'gzip, br'})
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+            if response.will_close:
+                connection.close()
+        except (OSError, http.client.HTTPException):
+            # server side keep-alive timeout or worker recycled, reconnect
+            connection.close()
+            continue
+        latencies.append(time.perf_counter() - started)
+    connection.close()
+
+
+def load(port, path, connections, seconds):
+    latencies, errors = [], []
+    deadline = time.monotonic() + seconds
+    threads = [threading.Thread(target=client, args=(port, path, deadline, latencies, errors))
+               for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    return (len(latencies) / seconds,
+            statistics.median(latencies) * 1000,
+            latencies[int(len(latencies) * 0.99) - 1] * 1000,
+            len(errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--connections', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--servers', nargs='+', default=list(SERVERS), choices=list(SERVERS))
+    args = parser.parse_args()
+
+    env = {**os.environ, 'DEBUG': 'False', 'DJANGO_ALLOWED_HOSTS': '127.0.0.1',
+           'SQL_ENGINE': os.environ.get('SQL_ENGINE', 'django.db.backends.sqlite3')}
+    subprocess.run([sys.executable, 'manage.py', 'collectstatic', '--noinput', '-v0'],
+                   cwd=BASE_DIR, env=env, check=True)
+
+    print('%d connections, %ss per run, %d cores' % (args.connections, args.seconds, os.cpu_count()))
+    for name in args.servers:
+        command, extra_env = SERVERS[name]
+        command = [part.format(port=args.port) for part in command]
+        server = subprocess.Popen(command, cwd=BASE_DIR, env={**env, **extra_env},
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for(args.port)
+            for label, path in PATHS.items():
+                rps, p50, p99, errors = load(args.port, path, args.connections, args.seconds)
+                print('%-22s %-7s %8.1f req/s  p50 %6.1f ms  p99 %6.1f ms  %d errors'
+                      % (name, label, rps, p50, p99, errors))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Per-call latency of logger.info() with the file handler written on the
+calling thread (RotatingFileHandlerMakeDir) versus handed to the writer
+thread (QueueingHandler).
+
+    python benchmarks/logging_latency.py --threads 8 --records 20000
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from projectx.logging import QueueingHandler, RotatingFileHandlerMakeDir  # noqa: E402
+
+FORMAT = '[%(asctime)s] %(levelname)s %(message)s [%(name)s:%(lineno)s]'
+MESSAGE = ' == method=%s path=%s status=%s duration=%s user=%s'
+
+
+def run(handler, threads, records):
+    logger = logging.Logger('benchmark')
+    handler.setFormatter(logging.Formatter(FORMAT))
+    logger.addHandler(handler)
+    timings = [[] for _ in range(threads)]
+
+    def worker(samples):
+        for i in range(records):
+            started = time.perf_counter_ns()
+            logger.info(MESSAGE, 'GET', '/api/v1/account/api/users/', 200, 0.0123, i)
+            samples.append(time.perf_counter_ns() - started)
+
+    workers = [threading.Thread(target=worker, args=(samples,)) for samples in timings]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    handler.close()
+
+    samples = sorted(sample for thread_samples in timings for sample in thread_samples)
+    return {
+        'p50': samples[len(samples) // 2] / 1000,
+        'p99': samples[int(len(samples) * 0.99)] / 1000,
+        'max': samples[-1] / 1000,
+        'mean': statistics.mean(samples) / 1000,
+        'records/s': len(samples) / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--max-bytes', type=int, default=5 * 1024 * 1024)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        options = {'maxBytes': args.max_bytes, 'backupCount': 10}
+        results = {
+            'sync': run(RotatingFileHandlerMakeDir(os.path.join(tmp, 'sync', 'info.log'), **options),
+                        args.threads, args.records),
+            'queued': run(QueueingHandler(filename=os.path.join(tmp, 'queued', 'info.log'),
+                                          overflow='block', **options),
+                          args.threads, args.records),
+        }
+
+    print('%-8s %10s %10s %10s %10s %12s' % ('handler', 'p50 us', 'p99 us', 'max us', 'mean us', 'records/s'))
+    for name, result in results.items():
+        print('%-8s %10.1f %10.1f %10.1f %10.1f %12.0f' % (
+            name, result['p50'], result['p99'], result['max'], result['mean'], result['records/s']))
+
+
+if __name__ == '__main__':
+    main()
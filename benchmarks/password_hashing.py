@@ -0,0 +1,60 @@
+"""
+Logins per second (password verifications with the default hasher) done
+inline on request threads versus through the account.hashing process pool.
+
+    python benchmarks/password_hashing.py --workers 4 --threads 16 --logins 64
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'projectx.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth import hashers  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+
+from account import hashing  # noqa: E402
+
+
+def run(threads, logins, encoded):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        results = list(executor.map(lambda _: hashing.verify_password('secret', encoded), range(logins)))
+    elapsed = time.perf_counter() - started
+    assert all(is_correct for is_correct, _ in results)
+    return logins / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--logins', type=int, default=64)
+    args = parser.parse_args()
+
+    encoded = hashers.make_password('secret')
+    print('hasher: %s' % encoded.split('$', 2)[:2])
+
+    with override_settings(PASSWORD_HASHING_WORKERS=0, PASSWORD_HASHING_MAX_PENDING=args.threads):
+        hashing.shutdown()
+        inline = run(args.threads, args.logins, encoded)
+
+    with override_settings(PASSWORD_HASHING_WORKERS=args.workers, PASSWORD_HASHING_MAX_PENDING=args.threads):
+        hashing.shutdown()
+        run(args.workers, args.workers, encoded)  # start the workers
+        pooled = run(args.threads, args.logins, encoded)
+        hashing.shutdown()
+
+    print('inline: %7.1f logins/s' % inline)
+    print('pool:   %7.1f logins/s, %.1f per worker core (%d workers)' % (pooled, pooled / args.workers, args.workers))
+
+
+if __name__ == '__main__':
+    main()
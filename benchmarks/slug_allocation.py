@@ -0,0 +1,103 @@
+"""
+Slug allocation for records sharing a few common base names: the former
+random-suffix loop, projectx.utils.generate_slug per insert, and
+generate_slugs with bulk_create for a batch.
+
+Uses a temporary table that is dropped at the end:
+
+    python benchmarks/slug_allocation.py --single 5000 --bulk 100000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'projectx.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection, models, transaction  # noqa: E402
+from django.utils.crypto import get_random_string  # noqa: E402
+
+from projectx.utils import generate_slug, generate_slugs, slugify_value  # noqa: E402
+
+BASE_NAMES = ['Dhaka Office', 'Chittagong Office', 'Sylhet Office', 'Khulna Office', 'Rajshahi Office']
+
+
+class SlugRecord(models.Model):
+    slug = models.SlugField(max_length=100, unique=True)
+
+    class Meta:
+        app_label = 'benchmarks'
+
+
+def legacy_generate_slug(instance, value):
+    slug = slugify_value(value)
+    unique_slug = slug
+    while SlugRecord.objects.filter(slug=unique_slug).exists():
+        unique_slug = slug + '-' + get_random_string(length=4)
+    return unique_slug
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def insert_one_by_one(generate, count):
+    queries = QueryCounter()
+    started = time.perf_counter()
+    with connection.execute_wrapper(queries):
+        for i in range(count):
+            record = SlugRecord()
+            record.slug = generate(record, BASE_NAMES[i % len(BASE_NAMES)])
+            record.save()
+    return count / (time.perf_counter() - started), queries.count / count
+
+
+def insert_bulk(count, batch_size=5000):
+    queries = QueryCounter()
+    started = time.perf_counter()
+    with connection.execute_wrapper(queries):
+        for start in range(0, count, batch_size):
+            values = [BASE_NAMES[i % len(BASE_NAMES)] for i in range(start, min(start + batch_size, count))]
+            SlugRecord.objects.bulk_create(
+                [SlugRecord(slug=slug) for slug in generate_slugs(SlugRecord, values)], batch_size=1000)
+    return count / (time.perf_counter() - started), queries.count / count
+
+
+def run(label, func, *args):
+    with connection.schema_editor() as editor:
+        editor.create_model(SlugRecord)
+    try:
+        with transaction.atomic():
+            rate, queries = func(*args)
+            assert SlugRecord.objects.values('slug').distinct().count() == args[-1]
+            transaction.set_rollback(True)
+    finally:
+        with connection.schema_editor() as editor:
+            editor.delete_model(SlugRecord)
+    print('%-22s %9.1f records/s %6.3f queries/record' % (label, rate, queries))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--single', type=int, default=5000)
+    parser.add_argument('--bulk', type=int, default=100000)
+    args = parser.parse_args()
+
+    print('%s, %d base names' % (connection.vendor, len(BASE_NAMES)))
+    run('random suffix loop', insert_one_by_one, legacy_generate_slug, args.single)
+    run('generate_slug', insert_one_by_one, generate_slug, args.single)
+    run('generate_slugs (bulk)', insert_bulk, args.bulk)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Compare ``?search=`` latency of account.search.UserSearchFilter against
+DRF's SearchFilter with the original search_fields: the count and the
+first page of 20, as the paginated list runs them.
+
+Creates synthetic users inside a transaction that is rolled back at the
+end, so it can be pointed at a development database:
+
+    python benchmarks/user_search.py --users 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'projectx.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.db import transaction  # noqa: E402
+from rest_framework import filters  # noqa: E402
+from rest_framework.request import Request  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+
+from account.search import UserSearchFilter  # noqa: E402
+
+User = get_user_model()
+
+FIRST_NAMES = ['Rahim', 'Karim', 'Abdul', 'Nusrat', 'Farhana', 'Tanvir', 'Sadia', 'Imran', 'Ayesha', 'Rafiq']
+LAST_NAMES = ['Islam', 'Hossain', 'Ahmed', 'Rahman', 'Khan', 'Chowdhury', 'Akter', 'Begum', 'Uddin', 'Sarkar']
+QUERIES = ['rahim', 'khan', 'user_4242', 'user_4242@example.com', 'farh', 'sadia akter', '01712345678']
+
+
+class SearchView:
+    search_fields = ('=username', '=email', '=phone', 'first_name', 'last_name')
+
+
+def create_users(count, batch_size=10000):
+    rng = random.Random(42)
+    for start in range(0, count, batch_size):
+        User.objects.bulk_create([
+            User(username='user_%d' % i,
+                 email='user_%d@example.com' % i,
+                 first_name=rng.choice(FIRST_NAMES),
+                 last_name=rng.choice(LAST_NAMES),
+                 phone='017%08d' % i,
+                 password='!')
+            for i in range(start, min(start + batch_size, count))
+        ])
+
+
+def measure(backend, query, repeat):
+    request = Request(APIRequestFactory().get('/', {'search': query}))
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        queryset = backend.filter_queryset(request, User.objects.all(), SearchView())
+        # what a list page runs: the count, then the first page
+        queryset.count()
+        list(queryset[:20])
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), max(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with transaction.atomic():
+        started = time.perf_counter()
+        create_users(args.users)
+        print('created %d users in %.1fs' % (args.users, time.perf_counter() - started))
+
+        print('%-24s %22s %22s' % ('query', 'SearchFilter ms', 'UserSearchFilter ms'))
+        for query in QUERIES:
+            old = measure(filters.SearchFilter(), query, args.repeat)
+            new = measure(UserSearchFilter(), query, args.repeat)
+            print('%-24s %10.2f (max %7.2f) %10.2f (max %7.2f)' % (query, *old, *new))
+
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
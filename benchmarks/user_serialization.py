@@ -0,0 +1,120 @@
+"""
+Rows per second for a 10k user list: fetch, serialize and render to JSON.
+
+  - model instances through DRF's UserSerializer and JSONRenderer (before)
+  - values() rows through the compiled read plan, DRF's json renderer
+  - values() rows through the compiled read plan, orjson renderer (now)
+
+Also times GET /users/?cursor=&length=1000 (the keyset pagination page
+size limit) end to end, before and now, with the response cache cleared
+for every request. Runs inside a transaction that is rolled back at the
+end:
+
+    python benchmarks/user_serialization.py --users 10000
+    python benchmarks/user_serialization.py --fields id,email   # sparse fieldset
+"""
+import argparse
+import os
+import sys
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'projectx.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.db import transaction  # noqa: E402
+from django.urls import reverse  # noqa: E402
+from rest_framework import renderers  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from account.serializers import UserSerializer  # noqa: E402
+from account.views import UserViewSet  # noqa: E402
+from projectx.renderers import JSONRenderer, orjson  # noqa: E402
+
+User = get_user_model()
+
+
+def instances(queryset):
+    return renderers.JSONRenderer().render(UserSerializer(list(queryset), many=True).data)
+
+
+def plan_json(queryset):
+    plan = UserSerializer.get_read_plan()
+    return renderers.JSONRenderer().render(plan.serialize(plan.narrow(queryset)))
+
+
+def plan_orjson(queryset):
+    plan = UserSerializer.get_read_plan()
+    return JSONRenderer().render(plan.serialize(plan.narrow(queryset)))
+
+
+def measure(func, queryset, count, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        content = func(queryset.all())
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return count / best, len(content)
+
+
+def page_rate(client, repeat, fields=None):
+    url = reverse('users-list') + '?cursor=&length=1000' + ('&fields=' + fields if fields else '')
+    best = None
+    for _ in range(repeat + 1):
+        cache.clear()
+        started = time.perf_counter()
+        response = client.get(url)
+        elapsed = time.perf_counter() - started
+        assert response.status_code == 200 and len(response.json()['data']) == 1000, response.content[:200]
+        best = elapsed if best is None else min(best, elapsed)
+    return 1000 / best, '%d bytes, %s' % (len(response.content), response['Server-Timing'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--fields', help='?fields= for the endpoint timing, e.g. id,email')
+    args = parser.parse_args()
+
+    with transaction.atomic():
+        User.objects.bulk_create(
+            [User(username='bench_%06d' % i, email='bench_%06d@example.com' % i, password='!',
+                  first_name='Bench', last_name=str(i), phone='+88017%08d' % i)
+             for i in range(args.users)], batch_size=2000)
+        queryset = User.objects.filter(username__startswith='bench_')
+        count = queryset.count()
+
+        expected = instances(queryset)
+        assert plan_json(queryset) == expected and plan_orjson(queryset) == expected
+
+        print('%d users, orjson %s' % (count, orjson.__version__ if orjson else 'not installed'))
+        for label, func in (('DRF serializer, json', instances),
+                            ('read plan, json', plan_json),
+                            ('read plan, orjson', plan_orjson)):
+            rate, size = measure(func, queryset, count, args.repeat)
+            print('%-22s %10.0f rows/s  %d bytes' % (label, rate, size))
+
+        client = APIClient(HTTP_HOST='localhost')
+        client.force_authenticate(User.objects.get(username='bench_000000'))
+        with mock.patch.object(UserViewSet, 'get_read_plan', return_value=None), \
+                mock.patch.object(UserViewSet, 'renderer_classes', [renderers.JSONRenderer]):
+            before = page_rate(client, args.repeat)
+        now = page_rate(client, args.repeat)
+        results = [('GET 1000 rows, before', before), ('GET 1000 rows, now', now)]
+        if args.fields:
+            results.append(('GET 1000 rows, fields', page_rate(client, args.repeat, args.fields)))
+        for label, (rate, timing) in results:
+            print('%-22s %10.0f rows/s  %s' % (label, rate, timing))
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+gunicorn settings for production, read from the working directory:
+
+    gunicorn projectx.wsgi                       # threaded WSGI workers
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn projectx.asgi
+
+Every value can be overridden from the environment. ``kill -HUP`` on the
+master reloads gracefully: new workers are started with fresh code and
+settings before the old ones finish their requests and exit. With
+GUNICORN_PRELOAD=True the application is imported once in the master, so
+workers fork faster and share memory, but a HUP no longer picks up code
+changes; restart the container instead.
+"""
+import multiprocessing
+import os
+
+
+def env_bool(name, default):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:%s' % os.environ.get('PORT', '8000'))
+
+# one worker per core; threads overlap the database and cache round trips
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# recycle workers now and then, jittered so they don't all restart at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+preload_app = env_bool('GUNICORN_PRELOAD', False)
+
+# heartbeat files on tmpfs, a slow overlay filesystem can get workers killed
+worker_tmp_dir = os.environ.get('GUNICORN_WORKER_TMP_DIR', '/dev/shm' if os.path.isdir('/dev/shm') else None)
+
+# the application writes its own access log (projectx.logging)
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+forwarded_allow_ips = os.environ.get('GUNICORN_FORWARDED_ALLOW_IPS', '127.0.0.1')
@@ -0,0 +1,4 @@
+# loaded with Django, so shared_task binds to the projectx app
+from projectx.celery import app as celery_app
+
+__all__ = ('celery_app',)
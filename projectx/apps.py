@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class ProjectxConfig(AppConfig):
+    name = 'projectx'
+
+    def ready(self):
+        # connection_created receivers, connected before the first query
+        from projectx import instrumentation, metrics  # noqa: F401
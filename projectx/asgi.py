@@ -9,8 +9,22 @@ https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.conf import settings
+
+from projectx.handlers import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'projectx.settings')
+# native async views (projectx.views.AsyncAPIViewMixin) only pay off here
+os.environ.setdefault('ASYNC_VIEWS', 'True')
+
+# what get_asgi_application() does, with the handler from projectx.handlers
+django.setup(set_prefix=False)
+
+application = ASGIHandler()
+
+if settings.ASYNC_VIEWS:
+    # WhiteNoiseMiddleware is sync only and left out, see projectx.static
+    from projectx.static import StaticFilesApplication
 
-application = get_asgi_application()
+    application = StaticFilesApplication(application)
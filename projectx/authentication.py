@@ -0,0 +1,125 @@
+from asgiref.sync import sync_to_async
+from django.utils.translation import gettext_lazy as _
+from rest_framework import authentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt import authentication as jwt_authentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from account import tokens
+from projectx import db_router
+
+
+class SessionAuthentication(authentication.SessionAuthentication):
+    """
+    Session authentication with an ``aauthenticate`` that loads the user
+    through ``request.auser()`` (async ORM) instead of a thread hop.
+    Both report the user to the replica routing (``db_router.route_user``).
+    """
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            db_router.route_user(result[0])
+        return result
+
+    async def aauthenticate(self, request):
+        auser = getattr(request._request, 'auser', None)
+        if auser is None:
+            return await sync_to_async(self.authenticate)(request)
+
+        user = await auser()
+        if not user or not user.is_active:
+            return None
+
+        self.enforce_csrf(request)
+        await db_router.aroute_user(user)
+        return (user, None)
+
+
+class JWTAuthentication(jwt_authentication.JWTAuthentication):
+    """
+    simplejwt's JWTAuthentication with an ``aauthenticate`` counterpart
+    that looks the user up with the async ORM. Both report the user to the
+    replica routing (``db_router.route_user``).
+    """
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            db_router.route_user(result[0])
+        return result
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        user = await self.aget_user(validated_token)
+        await db_router.aroute_user(user)
+        return user, validated_token
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    def check_user(self, user, validated_token):
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+    async def aget_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        self.check_user(user, validated_token)
+        return user
+
+
+class TokenUserAuthentication(JWTAuthentication):
+    """
+    Builds ``request.user`` from the token claims (``account.tokens``)
+    instead of loading the user row. The token's auth stamp is compared
+    with the user's current one, a single cache lookup, so a password
+    change, deactivation or deletion still revokes it.
+
+    Tokens without a stamp take the regular database lookup.
+    """
+    def get_user(self, validated_token):
+        if tokens.AUTH_STAMP_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+
+        user_id = self.get_user_id(validated_token)
+        self.check_auth_stamp(validated_token, tokens.get_auth_stamp(user_id))
+        return tokens.ClaimsUser(validated_token)
+
+    async def aget_user(self, validated_token):
+        if tokens.AUTH_STAMP_CLAIM not in validated_token:
+            return await super().aget_user(validated_token)
+
+        user_id = self.get_user_id(validated_token)
+        self.check_auth_stamp(validated_token, await tokens.aget_auth_stamp(user_id))
+        return tokens.ClaimsUser(validated_token)
+
+    def check_auth_stamp(self, validated_token, stamp):
+        if stamp == tokens.REVOKED:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if validated_token[tokens.AUTH_STAMP_CLAIM] != stamp:
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
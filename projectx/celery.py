@@ -0,0 +1,82 @@
+"""
+Celery application for work that should not hold up a response: emails,
+exports, anything talking to a slow third party. Workers are started with
+
+    celery -A projectx worker -l info
+
+and read the ``CELERY_*`` settings. The broker is Redis (``REDIS_URL``);
+without it tasks run eagerly, in the calling process, on an in-memory
+broker, which is what tests and local runs get. Eager tasks are not
+retried: the retries would run right away, inside the request, so a
+failing eager task fails at once (and is logged).
+
+Tasks sent while a request is handled carry its id in a ``request_id``
+message header, and the worker sets it for the duration of the task, so
+the task's log lines share the request id of the request that queued it.
+Enqueue with ``delay_on_commit()`` from code that writes, or the worker
+may look for rows that are not committed yet.
+"""
+import os
+
+from celery import Celery, signals
+from celery.contrib.django.task import DjangoTask
+
+from projectx.logging import local
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'projectx.settings')
+
+REQUEST_ID_HEADER = 'request_id'
+
+
+class Task(DjangoTask):
+    def retry(self, *args, **kwargs):
+        if self.request.is_eager:
+            # no backoff when eager, give up instead of retrying in the request
+            kwargs['max_retries'] = self.request.retries
+        return super().retry(*args, **kwargs)
+
+
+app = Celery('projectx', task_cls=Task)
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
+
+
+@signals.before_task_publish.connect(dispatch_uid='projectx_propagate_request_id')
+def propagate_request_id(headers=None, **kwargs):
+    request_id = getattr(local, 'request_id', None)
+    if request_id is not None and headers is not None:
+        headers.setdefault(REQUEST_ID_HEADER, request_id)
+
+
+def get_request_id(task):
+    """
+    The request id a task was sent with: a message header on workers, in
+    ``headers`` when applied locally with ``apply(headers=...)``.
+    """
+    request_id = task.request.get(REQUEST_ID_HEADER)
+    if request_id is None:
+        request_id = (task.request.headers or {}).get(REQUEST_ID_HEADER)
+    return request_id
+
+
+@signals.task_prerun.connect(dispatch_uid='projectx_bind_request_id')
+def bind_request_id(task=None, **kwargs):
+    request_id = get_request_id(task)
+    if request_id is not None:
+        # eager tasks run inside the request, put its id back afterwards
+        task.request.previous_request_id = getattr(local, 'request_id', None)
+        local.request_id = request_id
+
+
+@signals.task_postrun.connect(dispatch_uid='projectx_unbind_request_id')
+def unbind_request_id(task=None, **kwargs):
+    if get_request_id(task) is None:
+        return
+    previous = task.request.get('previous_request_id')
+    if previous is not None:
+        local.request_id = previous
+    else:
+        try:
+            del local.request_id
+        except AttributeError:
+            pass
@@ -0,0 +1,161 @@
+"""
+Date and datetime input parsing for DRF fields.
+
+DRF tries each of ``DATETIME_INPUT_FORMATS`` in order with ``strptime``
+until one accepts the value, so a timestamp in one of the last formats
+pays for a dozen failed ``strptime`` calls first. ``FormatParser`` gives
+the same answer (the first format that accepts the value) with at most
+one call in the common case:
+
+  - the *shape* of a value is the value with its digits replaced by 9
+    ('25/10/2006 14:30' -> '99/99/9999 99:99'). Every format has a
+    pattern matching the shapes it can possibly accept, and all of them
+    are joined in one regular expression, in order; one match finds the
+    first format that can accept the value, and the formats before it
+    cannot. Shapes no format can accept are rejected without parsing.
+  - the format found for a shape is cached, so the next value of that
+    shape skips the regular expression too.
+  - shapes whose values ``datetime.fromisoformat`` parses to the same
+    result as their format (the ISO 8601 ones) are parsed with it, a
+    C function that is much faster than ``strptime``.
+
+When the format found fails on the value (31/02/2024), the remaining
+formats are tried like DRF does. Values with non-ASCII digits, which
+``strptime`` accepts, always take that path.
+
+Parsers are shared per list of formats through ``get_parser``; DRF deep
+copies the fields of every serializer instance, so anything cached on a
+field would be thrown away with each request.
+"""
+import datetime
+import functools
+import re
+
+from rest_framework import ISO_8601
+
+SHAPE = str.maketrans('0123456789', '9999999999')
+# shape patterns of the strptime directives, each accepting at least what
+# strptime accepts for it
+DIRECTIVES = {
+    'd': '(?:99?| 9)',
+    'm': '99?',
+    'y': '99',
+    'Y': '9999',
+    'H': '99?',
+    'M': '99?',
+    'S': '99?',
+    'f': '9{1,6}',
+    'z': '(?:Z|[+-]99:?99(?::?99(?:\\.9{1,6})?)?)',
+    '%': '%',
+}
+ANY = '.*'
+DIRECTIVE = re.compile(r'%(.)|(\s+)')
+MAX_SHAPES = 256
+MAX_SHAPE_LENGTH = 64
+
+
+def shape_pattern(input_format):
+    """
+    A regular expression matching the shape of every value ``strptime``
+    could accept for ``input_format``, or of anything when unsure.
+    """
+    if input_format.lower() == ISO_8601:
+        return ANY
+    parts, position = [], 0
+    for match in DIRECTIVE.finditer(input_format):
+        parts.append(re.escape(input_format[position:match.start()].translate(SHAPE)))
+        position = match.end()
+        if match.group(2):
+            # strptime matches whitespace in the format with \s+
+            parts.append(r'\s+')
+        elif match.group(1) in DIRECTIVES:
+            parts.append(DIRECTIVES[match.group(1)])
+        else:
+            return ANY
+    parts.append(re.escape(input_format[position:].translate(SHAPE)))
+    return ''.join(parts)
+
+
+class FormatParser:
+    """
+    Parses values with the first of ``formats`` that accepts them:
+    ``strptime`` patterns, or ``ISO_8601`` for ``iso_parser`` (Django's
+    ``parse_datetime`` or ``parse_date``). Raises ValueError when none does.
+    """
+    def __init__(self, formats, iso_parser):
+        self.formats = tuple(formats)
+        self.iso_parser = iso_parser
+        self.pattern = re.compile('|'.join('(%s)' % shape_pattern(f) for f in self.formats), re.IGNORECASE)
+        # shape -> (index of its format, parse with fromisoformat)
+        self.shapes = {}
+
+    def parse_with(self, value, input_format):
+        try:
+            if input_format.lower() == ISO_8601:
+                return self.iso_parser(value)
+            return datetime.datetime.strptime(value, input_format)
+        except (ValueError, TypeError):
+            return None
+
+    def parse(self, value):
+        if not isinstance(value, str) or not value.isascii() or len(value) > MAX_SHAPE_LENGTH:
+            return self.scan(value, 0)
+
+        shape = value.translate(SHAPE)
+        cached = self.shapes.get(shape)
+        if cached is None:
+            match = self.pattern.fullmatch(shape)
+            index, fast = (match.lastindex - 1 if match and match.lastindex else len(self.formats)), None
+        else:
+            index, fast = cached
+            if fast:
+                try:
+                    return datetime.datetime.fromisoformat(value)
+                except ValueError:
+                    pass
+
+        if index == len(self.formats):
+            if cached is None and len(self.shapes) < MAX_SHAPES:
+                self.shapes[shape] = (index, False)
+            raise ValueError('%r matches none of the input formats' % (value,))
+
+        parsed = self.parse_with(value, self.formats[index])
+        if parsed is None:
+            # the format fits the shape but not the value, try the rest
+            return self.scan(value, index + 1)
+        if cached is None and len(self.shapes) < MAX_SHAPES:
+            self.shapes[shape] = (index, self.is_isoformat(value, self.formats[index], parsed))
+        return parsed
+
+    def scan(self, value, start):
+        for input_format in self.formats[start:]:
+            parsed = self.parse_with(value, input_format)
+            if parsed is not None:
+                return parsed
+        raise ValueError('%r matches none of the input formats' % (value,))
+
+    @staticmethod
+    def is_isoformat(value, input_format, parsed):
+        """
+        Whether ``fromisoformat`` parses ``value`` exactly like
+        ``input_format`` did, so it can parse this shape instead.
+        """
+        if input_format.lower() == ISO_8601:
+            return False
+        try:
+            iso = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return False
+        return iso == parsed and iso.utcoffset() == parsed.utcoffset()
+
+
+@functools.lru_cache(maxsize=64)
+def _get_parser(formats, iso_parser):
+    return FormatParser(formats, iso_parser)
+
+
+def get_parser(formats, iso_parser):
+    """
+    The shared ``FormatParser`` of ``formats``.
+    """
+    return _get_parser(tuple(formats), iso_parser)
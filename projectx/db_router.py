@@ -0,0 +1,288 @@
+"""
+Read replica routing.
+
+Replicas are the ``replica_*`` aliases in ``DATABASES`` (``SQL_REPLICAS``
+in settings). ``ReplicaRoutingMiddleware`` lets reads of safe requests
+(GET/HEAD/OPTIONS) go to a replica; everything else, and every read after
+the request wrote something, goes to ``default`` (read-your-writes). A
+write also pins the client's next requests to ``default`` for
+``REPLICA_PIN_SECONDS`` while the replicas catch up: through a short lived
+cookie, and for an authenticated user through a cache key as well, which
+covers clients that don't keep cookies (JWT) and the user's other clients.
+Authentication (``projectx.authentication``) reports the user with
+``route_user``; reads done before that, authentication's own, can still
+go to a replica.
+
+Replicas are checked every ``REPLICA_CHECK_INTERVAL`` seconds; one that
+fails the check or lags more than ``REPLICA_MAX_LAG`` seconds is skipped
+until it passes again. With no healthy replica reads go to ``default``.
+"""
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+from asgiref.local import Local
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+REPLICA_PREFIX = 'replica'
+PIN_COOKIE = 'db_pin'
+PIN_KEY = 'projectx:db_pin:%s'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+LAG_QUERIES = {
+    'postgresql': (
+        "SELECT CASE WHEN pg_is_in_recovery() "
+        "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+        "ELSE 0 END"),
+}
+
+_state = Local()
+
+
+class RoutingState:
+    def __init__(self, use_replicas):
+        self.use_replicas = use_replicas
+        self.wrote = False
+        self.user_id = None
+
+
+def get_replicas():
+    return [alias for alias in settings.DATABASES if alias.startswith(REPLICA_PREFIX)]
+
+
+class DelayedCalls:
+    """
+    Calls functions after a delay, all of them on one background thread
+    rather than a timer thread each.
+    """
+    def __init__(self):
+        # (due, sequence, func, args), a heap
+        self._calls = []
+        self._condition = threading.Condition()
+        self._counter = itertools.count()
+        self._pid = None
+
+    def call_later(self, delay, func, *args):
+        with self._condition:
+            # forked workers (gunicorn --preload) don't inherit the thread
+            if self._pid != os.getpid():
+                self._calls = []
+                threading.Thread(target=self._run, name='after-replication', daemon=True).start()
+                self._pid = os.getpid()
+            heapq.heappush(self._calls, (time.monotonic() + delay, next(self._counter), func, args))
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._calls or self._calls[0][0] > time.monotonic():
+                    self._condition.wait(self._calls[0][0] - time.monotonic() if self._calls else None)
+                _, _, func, args = heapq.heappop(self._calls)
+            try:
+                func(*args)
+            except Exception:
+                logger.exception('delayed call to %r failed', func)
+
+
+delayed_calls = DelayedCalls()
+
+
+def route_user(user):
+    """
+    Tells the routing of the current request who made it: a user who wrote
+    in the last ``REPLICA_PIN_SECONDS`` reads from ``default``.
+    """
+    state = getattr(_state, 'routing', None)
+    if state is None or not user.is_authenticated or not get_replicas():
+        return
+    state.user_id = user.pk
+    if state.use_replicas and cache.get(PIN_KEY % user.pk):
+        state.use_replicas = False
+
+
+async def aroute_user(user):
+    state = getattr(_state, 'routing', None)
+    if state is None or not user.is_authenticated or not get_replicas():
+        return
+    state.user_id = user.pk
+    if state.use_replicas and await cache.aget(PIN_KEY % user.pk):
+        state.use_replicas = False
+
+
+def after_replication(func, *args):
+    """
+    Call ``func`` now and again once the replicas caught up, for cache
+    invalidation: a request served by a lagging replica may have cached
+    the old data in between.
+    """
+    func(*args)
+    if get_replicas():
+        delayed_calls.call_later(getattr(settings, 'REPLICA_MAX_LAG', 5), func, *args)
+
+
+class ReplicaRouter:
+    def __init__(self, replicas=None):
+        self.replicas = get_replicas() if replicas is None else list(replicas)
+        self.selection = getattr(settings, 'REPLICA_SELECTION', 'round_robin')
+        self.check_interval = getattr(settings, 'REPLICA_CHECK_INTERVAL', 5)
+        self.max_lag = getattr(settings, 'REPLICA_MAX_LAG', 5)
+        self.lags = {}
+        self.checked_at = None
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+
+    def db_for_read(self, model, **hints):
+        state = getattr(_state, 'routing', None)
+        if state is None or not state.use_replicas or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # reads inside a transaction have to see its writes
+            return DEFAULT_DB_ALIAS
+        return self.choose_replica() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = getattr(_state, 'routing', None)
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as default
+        return True
+
+    def choose_replica(self):
+        lags = self.get_lags()
+        if not lags:
+            return None
+        if self.selection == 'least_lag':
+            return min(lags, key=lags.get)
+        healthy = sorted(lags)
+        return healthy[next(self._counter) % len(healthy)]
+
+    def get_lags(self):
+        """
+        Returns ``{alias: lag}`` of the healthy replicas as of the last
+        check. When that is older than ``check_interval`` a new check is
+        started in the background; routing may happen in async code, so it
+        must not query itself. Until the first check finished reads go to
+        ``default``.
+        """
+        if self.checked_at is None or time.monotonic() - self.checked_at >= self.check_interval:
+            if self._lock.acquire(blocking=False):
+                threading.Thread(target=self.refresh, name='replica-check', daemon=True).start()
+        return self.lags
+
+    def refresh(self):
+        """
+        Checks the replicas, the caller has to hold ``_lock``.
+        """
+        try:
+            self.lags = self.check_replicas()
+            self.checked_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def check_replicas(self):
+        lags = {}
+        for alias in self.replicas:
+            connection = connections[alias]
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(LAG_QUERIES.get(connection.vendor, 'SELECT 0'))
+                    lag = float(cursor.fetchone()[0])
+            except DatabaseError as e:
+                logger.warning('replica %s is unavailable: %s', alias, e)
+                continue
+            finally:
+                # connections are per thread, don't leave this one behind
+                connection.close()
+            if lag > self.max_lag:
+                logger.warning('replica %s lags %.1fs behind, skipping it', alias, lag)
+                continue
+            lags[alias] = lag
+        return lags
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Sets up the routing state for ``ReplicaRouter``, see the module
+    docstring. Runs natively under both WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = self.process_request(request)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            self.reset(state)
+            raise
+        if state.wrote and state.user_id is not None:
+            cache.set(PIN_KEY % state.user_id, True, self.pin_seconds)
+        return self.process_response(state, response)
+
+    async def __acall__(self, request):
+        state = self.process_request(request)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            self.reset(state)
+            raise
+        if state.wrote and state.user_id is not None:
+            await cache.aset(PIN_KEY % state.user_id, True, self.pin_seconds)
+        return self.process_response(state, response)
+
+    def process_request(self, request):
+        use_replicas = request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES
+        # an object, so writes seen in sync_to_async threads are visible here
+        _state.routing = state = RoutingState(use_replicas)
+        return state
+
+    def process_response(self, state, response):
+        if state.wrote:
+            response.set_cookie(PIN_COOKIE, '1', max_age=self.pin_seconds, httponly=True, samesite='Lax')
+        if response.streaming:
+            # the content is read from the database while it is sent, keep
+            # routing it until it is consumed or closed
+            if response.is_async:
+                response.streaming_content = self.astreaming_content(state, response.streaming_content)
+            else:
+                response.streaming_content = self.streaming_content(state, response.streaming_content)
+        else:
+            self.reset(state)
+        return response
+
+    def streaming_content(self, state, content):
+        try:
+            yield from content
+        finally:
+            self.reset(state)
+
+    async def astreaming_content(self, state, content):
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            self.reset(state)
+
+    def reset(self, state):
+        if getattr(_state, 'routing', None) is state:
+            _state.routing = None
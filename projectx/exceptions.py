@@ -1,6 +1,11 @@
 import logging
+import random
+import threading
+import time
 import traceback
+from collections import Counter, OrderedDict
 
+from django.conf import settings
 from rest_framework import status
 from rest_framework.exceptions import ValidationError, ErrorDetail
 from rest_framework.response import Response
@@ -10,6 +15,91 @@ from rest_framework.views import exception_handler
 logger = logging.getLogger(__name__)
 
 
+class ErrorAggregator:
+    """
+    Counts unhandled exceptions by signature (type, message, view) so an
+    error storm logs each distinct error once per window instead of once
+    per request. The next occurrence after the window logs it again with
+    the number of repeats it suppressed.
+    """
+    def __init__(self, max_signatures=1000):
+        self.max_signatures = max_signatures
+        self._windows = OrderedDict()
+        self._totals = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, signature, window):
+        """
+        Returns ``(should_log, suppressed)``, ``suppressed`` being the
+        repeats since the signature was last logged.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._totals[signature[0]] += 1
+            entry = self._windows.get(signature)
+            if entry is not None and now - entry[0] < window:
+                entry[1] += 1
+                return False, entry[1]
+
+            self._windows[signature] = [now, 0]
+            self._windows.move_to_end(signature)
+            while len(self._windows) > self.max_signatures:
+                self._windows.popitem(last=False)
+            return True, entry[1] if entry else 0
+
+    def get_stats(self):
+        """
+        Unhandled exceptions of this process by type.
+        """
+        with self._lock:
+            return dict(self._totals)
+
+
+errors = ErrorAggregator()
+
+
+def error_payload(status_code, error, detail):
+    """
+    The normalized error body.
+    """
+    return {
+        "success": False,
+        "status_code": status_code,
+        "error": error,
+        "detail": detail,
+    }
+
+
+def format_traceback(exc):
+    """
+    The last lines of the traceback, only formatting the innermost frames
+    they come from.
+    """
+    lines = traceback.format_exception(type(exc), exc, exc.__traceback__, limit=-2, chain=False)
+    return ''.join(lines).splitlines()[-5:]
+
+
+def should_format_traceback():
+    if settings.DEBUG:
+        return True
+    rate = getattr(settings, 'ERROR_TRACEBACK_SAMPLE_RATE', 0.0)
+    return rate > 0 and random.random() < rate
+
+
+def log_exception(exc, context):
+    view = context.get('view')
+    signature = (type(exc).__qualname__, str(exc)[:200], type(view).__name__ if view else None)
+    window = getattr(settings, 'ERROR_LOG_WINDOW', 60)
+    should_log, suppressed = errors.record(signature, window)
+    if not should_log:
+        return
+
+    if suppressed:
+        logger.error('%s: %s repeated %d times in the last %s seconds', signature[0], signature[1],
+                     suppressed, window)
+    logger.exception(exc)
+
+
 def custom_exception_handler(exc, context):
     """
     Custom exception handler that standardizes error responses
@@ -58,24 +148,13 @@ def custom_exception_handler(exc, context):
             detail = str(exc.detail) if hasattr(exc, 'detail') else str(exc)
 
         # Normalize the output
-        response.data = {
-            "success": False,
-            "status_code": response.status_code,
-            "error": response.status_text,
-            "detail": detail,
-        }
+        response.data = error_payload(response.status_code, response.status_text, detail)
 
     else:
         # Unhandled exceptions (500, runtime errors, etc.)
-        logger.exception(exc)
-        response = Response(
-            {
-                "success": False,
-                "status_code": status.HTTP_500_INTERNAL_SERVER_ERROR,
-                "error": "Internal Server Error",
-                "detail": str(exc),
-                "traceback": traceback.format_exc().splitlines()[-5:],  # last few lines for dev
-            },
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-        )
+        log_exception(exc, context)
+        data = error_payload(status.HTTP_500_INTERNAL_SERVER_ERROR, "Internal Server Error", str(exc))
+        # last few lines for dev, formatted in DEBUG or for a sample of errors
+        data["traceback"] = format_traceback(exc) if should_format_traceback() else None
+        response = Response(data, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     return response
@@ -0,0 +1,42 @@
+"""
+DRF date and datetime fields parsing their input with
+``projectx.datetime_parsing``: same formats, same results and errors,
+without trying the input formats one ``strptime`` call at a time.
+``projectx.serializers.ModelSerializer`` maps model date and datetime
+fields to these.
+"""
+import datetime
+
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+from rest_framework.utils import humanize_datetime
+
+from projectx.datetime_parsing import get_parser
+
+
+class DateTimeField(serializers.DateTimeField):
+    def to_internal_value(self, value):
+        if not isinstance(value, str):
+            return super().to_internal_value(value)
+
+        input_formats = getattr(self, 'input_formats', api_settings.DATETIME_INPUT_FORMATS)
+        try:
+            parsed = get_parser(input_formats, parse_datetime).parse(value)
+        except ValueError:
+            self.fail('invalid', format=humanize_datetime.datetime_formats(input_formats))
+        return self.enforce_timezone(parsed)
+
+
+class DateField(serializers.DateField):
+    def to_internal_value(self, value):
+        if not isinstance(value, str):
+            return super().to_internal_value(value)
+
+        input_formats = getattr(self, 'input_formats', api_settings.DATE_INPUT_FORMATS)
+        try:
+            parsed = get_parser(input_formats, parse_date).parse(value)
+        except ValueError:
+            self.fail('invalid', format=humanize_datetime.date_formats(input_formats))
+        # strptime formats give datetimes, the ISO 8601 one a date
+        return parsed.date() if isinstance(parsed, datetime.datetime) else parsed
@@ -0,0 +1,103 @@
+"""
+Django's ASGI handler, without the thread hops of its housekeeping.
+
+``ASGIHandler.handle`` sends ``request_started`` and closes the response
+(which sends ``request_finished``) through ``sync_to_async``: two hops to
+the request's sync thread, the only two left on a request that doesn't
+touch the database. Django's receivers behind them reset and close the
+database connections of the thread they run in, and under ASGI every
+request gets a thread of its own (``ThreadSensitiveContext``) that has no
+connections when the request starts. So ``request_started`` is sent on
+the event loop, and the response is closed in the request's thread only
+if the request opened a connection there.
+
+That holds under an ASGI server. Nested in ``async_to_sync`` sync code
+runs in the caller's thread instead, use Django's handler there.
+"""
+import asyncio
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.core import signals
+from django.core.exceptions import RequestAborted
+from django.core.handlers import asgi
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.urls import set_script_prefix
+
+# aliases of the connections opened while serving the current request
+_opened = ContextVar('projectx_handlers_opened')
+
+
+@receiver(connection_created, dispatch_uid='projectx_handlers_connection_created')
+def record_connection(sender, connection, **kwargs):
+    opened = _opened.get(None)
+    if opened is not None:
+        opened.append(connection.alias)
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    async def handle(self, scope, receive, send):
+        """
+        ``django.core.handlers.asgi.ASGIHandler.handle`` (Django 5.2), with
+        the two hops above taken out.
+        """
+        try:
+            body_file = await self.read_body(receive)
+        except RequestAborted:
+            return
+        set_script_prefix(asgi.get_script_prefix(scope))
+        # the list is shared with the tasks and threads started from here
+        opened = []
+        token = _opened.set(opened)
+        try:
+            signals.request_started.send(sender=self.__class__, scope=scope)
+            request, error_response = self.create_request(scope, body_file)
+            if request is None:
+                body_file.close()
+                await self.send_response(error_response, send)
+                error_response.close()
+                return
+
+            async def process_request(request, send):
+                response = await self.run_get_response(request)
+                try:
+                    await self.send_response(response, send)
+                except asyncio.CancelledError:
+                    pass
+                return response
+
+            tasks = [
+                asyncio.create_task(self.listen_for_disconnect(receive)),
+                asyncio.create_task(process_request(request, send)),
+            ]
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in tasks:
+                if task.done():
+                    try:
+                        task.result()
+                    except RequestAborted:
+                        pass
+                    except AssertionError:
+                        body_file.close()
+                        raise
+                else:
+                    task.cancel()
+                    try:
+                        await task
+                    except asyncio.CancelledError:
+                        pass
+
+            try:
+                response = tasks[1].result()
+            except asyncio.CancelledError:
+                await signals.request_finished.asend(sender=self.__class__)
+            else:
+                if opened:
+                    # close_old_connections() has to run where they were opened
+                    await sync_to_async(response.close)()
+                else:
+                    response.close()
+            body_file.close()
+        finally:
+            _opened.reset(token)
@@ -0,0 +1,204 @@
+"""
+Per-request performance counters: queries run, time spent in the
+database, serializing and rendering, and response size.
+
+``InstrumentationMiddleware`` opens a ``RequestMetrics`` for each request.
+Queries are counted by an execute wrapper installed on every database
+connection, serializers (``projectx.serializers``) and renderers
+(``projectx.renderers``) add their time through ``timer``. The totals go
+to a ``Server-Timing`` header and to latency histograms per view, served
+on /api/metrics/. Outside a request all of it is a no-op.
+"""
+import bisect
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.local import Local
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# seconds, upper bounds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SERVER_TIMING_SETTING = 'SERVER_TIMING'
+
+_local = Local()
+
+
+class RequestMetrics:
+    __slots__ = ('started_ns', 'queries', 'db_ns', 'serialize_ns', 'render_ns')
+
+    def __init__(self):
+        self.started_ns = time.perf_counter_ns()
+        self.queries = 0
+        self.db_ns = 0
+        self.serialize_ns = 0
+        self.render_ns = 0
+
+
+def current():
+    """
+    The ``RequestMetrics`` of the request being served, None outside one.
+    """
+    return getattr(_local, 'metrics', None)
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = getattr(_local, 'metrics', None)
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter_ns()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_ns += time.perf_counter_ns() - started
+        metrics.queries += 1
+
+
+@receiver(connection_created, dispatch_uid='projectx_instrumentation_connection_created')
+def install_query_recorder(sender, connection, **kwargs):
+    # the wrapper object outlives reconnects, add the recorder only once
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class timer:
+    """
+    Adds the time spent in the block to ``<name>_ns`` of the current
+    request. Queries run inside the block (lazy querysets evaluated while
+    serializing) are counted as database time only.
+    """
+    __slots__ = ('attribute', 'metrics', 'started', 'db_ns')
+
+    def __init__(self, name):
+        self.attribute = name + '_ns'
+
+    def __enter__(self):
+        self.metrics = metrics = getattr(_local, 'metrics', None)
+        if metrics is not None:
+            self.started = time.perf_counter_ns()
+            self.db_ns = metrics.db_ns
+        return self
+
+    def __exit__(self, *exc_info):
+        metrics = self.metrics
+        if metrics is not None:
+            elapsed = time.perf_counter_ns() - self.started - (metrics.db_ns - self.db_ns)
+            setattr(metrics, self.attribute, getattr(metrics, self.attribute) + elapsed)
+
+
+class Histogram:
+    """
+    Cumulative latency histograms keyed by label values, in Prometheus'
+    bucket layout.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._series = defaultdict(lambda: [[0] * (len(self.buckets) + 1), 0.0])
+        self._lock = threading.Lock()
+
+    def observe(self, key, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series[key]
+            series[0][index] += 1
+            series[1] += value
+
+    def snapshot(self):
+        """
+        {key: ([cumulative count per bucket, +Inf last], sum)}
+        """
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+        snapshot = {}
+        for key, (counts, total) in series.items():
+            cumulative, running = [], 0
+            for count in counts:
+                running += count
+                cumulative.append(running)
+            snapshot[key] = (cumulative, total)
+        return snapshot
+
+
+class RequestStats:
+    """
+    Process wide totals per (view, method): a latency histogram plus
+    counters for queries, database time and response bytes.
+    """
+    def __init__(self):
+        self.latency = Histogram()
+        self._totals = defaultdict(lambda: [0, 0, 0])
+        self._lock = threading.Lock()
+
+    def record(self, key, duration, metrics, response_bytes):
+        self.latency.observe(key, duration)
+        with self._lock:
+            totals = self._totals[key]
+            totals[0] += metrics.queries
+            totals[1] += metrics.db_ns
+            totals[2] += response_bytes or 0
+
+    def get_totals(self):
+        with self._lock:
+            return {key: tuple(totals) for key, totals in self._totals.items()}
+
+
+stats = RequestStats()
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route or 'unnamed'
+
+
+def format_server_timing(metrics, total_ns):
+    return ('db;dur=%.3f;desc="%d queries", serialize;dur=%.3f, render;dur=%.3f, total;dur=%.3f' % (
+        metrics.db_ns / 1e6, metrics.queries, metrics.serialize_ns / 1e6,
+        metrics.render_ns / 1e6, total_ns / 1e6))
+
+
+class InstrumentationMiddleware:
+    """
+    Collects the ``RequestMetrics`` of every request, adds the
+    ``Server-Timing`` header (``SERVER_TIMING``) and records the request
+    in ``stats``. Runs natively under both WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.server_timing = getattr(settings, SERVER_TIMING_SETTING, True)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = _local.metrics = RequestMetrics()
+        try:
+            response = self.get_response(request)
+        finally:
+            del _local.metrics
+        return self.process_response(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = _local.metrics = RequestMetrics()
+        try:
+            response = await self.get_response(request)
+        finally:
+            del _local.metrics
+        return self.process_response(request, response, metrics)
+
+    def process_response(self, request, response, metrics):
+        total_ns = time.perf_counter_ns() - metrics.started_ns
+        response_bytes = None if response.streaming else len(response.content)
+        stats.record((get_view_name(request), request.method), total_ns / 1e9, metrics, response_bytes)
+        if self.server_timing:
+            response['Server-Timing'] = format_server_timing(metrics, total_ns)
+        return response
@@ -1,11 +1,23 @@
+import atexit
+import copy
 import errno
+import glob
+import gzip
 import logging.handlers
 import os
+import queue
+import random
+import shutil
+import threading
 import time
+from datetime import datetime, timezone
 
+import json_log_formatter
 import uuid
 
-from django.utils.deprecation import MiddlewareMixin
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils.functional import SimpleLazyObject, empty
+from django.utils.module_loading import import_string
 from django.conf import settings
 
 try:
@@ -13,9 +25,15 @@ try:
 except ImportError:
     from threading import local as Local
 
+try:
+    import fcntl
+except ImportError:  # not on Windows, rotation is then only safe in one process
+    fcntl = None
+
 local = Local()
 
 logger = logging.getLogger(__name__)
+access_logger = logging.getLogger('projectx.access')
 
 REQUEST_ID_HEADER_SETTING = 'LOG_REQUEST_ID_HEADER'
 LOG_REQUESTS_SETTING = 'LOG_REQUESTS'
@@ -24,6 +42,12 @@ LOG_USER_ATTRIBUTE_SETTING = 'LOG_USER_ATTRIBUTE'
 DEFAULT_NO_REQUEST_ID = "none"  # Used if no request ID is available
 REQUEST_ID_RESPONSE_HEADER_SETTING = 'REQUEST_ID_RESPONSE_HEADER'
 GENERATE_REQUEST_ID_IF_NOT_IN_HEADER_SETTING = 'GENERATE_REQUEST_ID_IF_NOT_IN_HEADER'
+LOG_REQUESTS_IGNORE_PATHS_SETTING = 'LOG_REQUESTS_IGNORE_PATHS'
+LOG_SAMPLE_RATES_SETTING = 'LOG_SAMPLE_RATES'
+LOG_SAMPLE_PATH_RATES_SETTING = 'LOG_SAMPLE_PATH_RATES'
+# favicon, admin and ping requests are not logged
+DEFAULT_IGNORE_PATHS = ('favicon', 'api/superAmdin', 'api/ping', 'api/metrics')
+ACCESS_LOG_FIELDS = ('request_id', 'method', 'path', 'status', 'duration_ms', 'user', 'query', 'bytes')
 
 
 def mkdir_p(path):
@@ -39,6 +63,28 @@ def mkdir_p(path):
             else:
                 raise
 
+
+def _size(path):
+    try:
+        return os.stat(path).st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return time.time()
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
 # its duplicate function from utils.misc
 # adding here to avoid circular import
 def _convert_to_bool_(param, nullable=False):
@@ -71,56 +117,463 @@ class RotatingFileHandlerMakeDir(logging.handlers.RotatingFileHandler):
         super().__init__(filename, mode, maxBytes, backupCount, encoding,
                          delay)
 
+    def emit_batch(self, records):
+        """
+        Write a batch of records with a single flush at the end. Rollover
+        is checked against the formatted size, so each record is formatted
+        once (``shouldRollover`` would format it a second time).
+        """
+        self.acquire()
+        try:
+            for record in records:
+                try:
+                    msg = self.format(record) + self.terminator
+                    if self.stream is None:
+                        self.stream = self._open()
+                    if self.maxBytes > 0 and self.stream.tell() + len(msg) >= self.maxBytes:
+                        self.doRollover()
+                        if self.stream is None:
+                            self.stream = self._open()
+                    self.stream.write(msg)
+                except Exception:
+                    self.handleError(record)
+            if self.stream is not None:
+                self.stream.flush()
+        finally:
+            self.release()
+
+
+class ConcurrentRotatingFileHandler(RotatingFileHandlerMakeDir):
+    """
+    ``RotatingFileHandlerMakeDir`` for a file shared by several processes
+    (the gunicorn workers).
+
+    Every batch is written and flushed under an exclusive ``flock`` of
+    ``<filename>.lock``, after reopening the file if another process rotated
+    it (its inode changed). The file is rotated before a write that would
+    take it past ``maxBytes``, or when an ``interval`` (seconds, aligned to
+    UTC: 86400 rotates at midnight UTC) has begun since its last write. It
+    is renamed to ``<filename>.<UTC time of the rotation>``, so segments are
+    never renamed again nor overwritten by another process.
+
+    A background thread gzips rotated segments, then deletes the oldest
+    ones beyond ``backupCount`` or while the log takes more than
+    ``maxTotalBytes`` on disk, rotated segments and current file together.
+    """
+    # a segment left uncompressed this long was orphaned by a dead process
+    ORPHAN_AGE = 60
 
-class RequestIDMiddleware(MiddlewareMixin):
-    def __init__(self, get_response=None):
+    def __init__(self,
+                 filename,
+                 mode='a',
+                 maxBytes=0,
+                 backupCount=0,
+                 encoding=None,
+                 delay=False,
+                 interval=0,
+                 maxTotalBytes=0,
+                 compress=True):
+        super().__init__(filename, mode, maxBytes, backupCount, encoding, delay)
+        self.interval = interval
+        self.maxTotalBytes = maxTotalBytes
+        self.compress = compress
+        self._lock_file = None
+        self._lock_pid = None
+        self._compressor = None
+        self._compressor_pid = None
+        self._compressor_queue = None
+
+    def emit(self, record):
+        self.emit_batch([record])
+
+    def emit_batch(self, records):
+        messages = []
+        for record in records:
+            try:
+                messages.append(self.format(record) + self.terminator)
+            except Exception:
+                self.handleError(record)
+        if not messages:
+            return
+        data = ''.join(messages)
+
+        self.acquire()
+        try:
+            self._lock()
+            try:
+                self._reopen_if_rotated()
+                if self._should_rotate(len(data)):
+                    self.doRollover()
+                self.stream.write(data)
+                self.stream.flush()
+            finally:
+                self._unlock()
+        except Exception:
+            self.handleError(records[-1])
+        finally:
+            self.release()
+
+    def _lock(self):
+        # a forked process shares the parent's open file, and its flock
+        if self._lock_pid != os.getpid():
+            self._lock_file = open(self.baseFilename + '.lock', 'a')
+            self._lock_pid = os.getpid()
+        if fcntl is not None:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+
+    def _unlock(self):
+        if fcntl is not None:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _reopen_if_rotated(self):
+        if self.stream is not None:
+            try:
+                current = os.stat(self.baseFilename).st_ino
+            except FileNotFoundError:
+                current = None
+            if current != os.fstat(self.stream.fileno()).st_ino:
+                self.stream.close()
+                self.stream = None
+        if self.stream is None:
+            self.stream = self._open()
+
+    def _should_rotate(self, size):
+        stat = os.fstat(self.stream.fileno())
+        if not stat.st_size:
+            return False
+        if self.maxBytes > 0 and stat.st_size + size > self.maxBytes:
+            return True
+        return self.interval > 0 and stat.st_mtime // self.interval < time.time() // self.interval
+
+    def shouldRollover(self, record):
+        # emit() decides, holding the file lock
+        return False
+
+    def doRollover(self):
+        """
+        Rename the current file to a new segment and reopen. Called with
+        the file lock held.
+        """
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        segment = '%s.%s' % (self.baseFilename, datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S-%f'))
+        os.rename(self.baseFilename, segment)
+        self.stream = self._open()
+        self._submit(segment)
+
+    def get_segments(self):
+        """
+        Rotated segments, compressed or not, oldest first.
+        """
+        return sorted(path for path in glob.glob(glob.escape(self.baseFilename) + '.*')
+                      if not path.endswith(('.lock', '.tmp')))
+
+    def _submit(self, segment):
+        if self._compressor_pid != os.getpid():
+            self._compressor_queue = queue.Queue()
+            self._compressor = threading.Thread(target=self._run_compressor, args=(self._compressor_queue,),
+                                                name='log-compressor', daemon=True)
+            self._compressor.start()
+            self._compressor_pid = os.getpid()
+        self._compressor_queue.put(segment)
+
+    def _run_compressor(self, segments):
+        while True:
+            segment = segments.get()
+            if segment is None:
+                return
+            if self.compress:
+                for path in [segment] + self._get_orphans():
+                    try:
+                        self._compress(path)
+                    except OSError:
+                        # compressed or deleted by another process meanwhile
+                        pass
+            self._enforce_budget()
+
+    def _get_orphans(self):
+        orphans = []
+        for path in self.get_segments():
+            if not path.endswith('.gz') and time.time() - _mtime(path) > self.ORPHAN_AGE:
+                orphans.append(path)
+        return orphans
+
+    def _compress(self, segment):
+        temporary = segment + '.gz.tmp'
+        try:
+            # claims the segment, unless another process is compressing it
+            fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            return
+        try:
+            with open(segment, 'rb') as source, os.fdopen(fd, 'wb') as raw, \
+                    gzip.GzipFile(fileobj=raw, mode='wb') as target:
+                shutil.copyfileobj(source, target)
+            os.rename(temporary, segment + '.gz')
+            os.unlink(segment)
+        except OSError:
+            _unlink(temporary)
+            raise
+
+    def _enforce_budget(self):
+        segments = [(path, _size(path)) for path in self.get_segments()]
+        if self.backupCount > 0 and len(segments) > self.backupCount:
+            for path, _ in segments[:-self.backupCount]:
+                _unlink(path)
+            segments = segments[-self.backupCount:]
+        if self.maxTotalBytes > 0:
+            total = sum(size for _, size in segments) + _size(self.baseFilename)
+            for path, size in segments:
+                if total <= self.maxTotalBytes:
+                    break
+                _unlink(path)
+                total -= size
+
+    def close(self):
+        if self._compressor_pid == os.getpid() and self._compressor.is_alive():
+            self._compressor_queue.put(None)
+            self._compressor.join(timeout=60)
+        if self._lock_pid == os.getpid():
+            self._lock_file.close()
+            self._lock_pid = None
+        super().close()
+
+
+class QueueingHandler(logging.Handler):
+    """
+    Takes log records off the calling thread. Records are put on a bounded
+    queue and a writer thread hands them in batches to the target handler
+    (``emit_batch`` when it has one), so disk stalls and rotations never
+    add to request latency.
+
+    When the queue is full, ``overflow='drop'`` discards the record and
+    counts it in ``dropped`` (a warning with the count is written with the
+    next batch), ``overflow='block'`` waits for room instead.
+
+    Any extra keyword arguments are passed to ``target_class``.
+    """
+    def __init__(self,
+                 target_class='projectx.logging.RotatingFileHandlerMakeDir',
+                 queue_size=10000,
+                 batch_size=500,
+                 overflow='drop',
+                 **target_kwargs):
+        super().__init__()
+        self.target = import_string(target_class)(**target_kwargs)
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.block = overflow == 'block'
+        self.dropped = 0
+        self._reported_dropped = 0
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._writer_lock = threading.Lock()
+        atexit.register(self.close)
+
+    def setFormatter(self, fmt):
+        super().setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    def _ensure_writer(self):
+        # forked workers (gunicorn --preload) don't inherit the thread
+        if self._pid == os.getpid():
+            return
+        with self._writer_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(self.queue_size)
+            self._thread = threading.Thread(target=self._run, args=(self._queue,),
+                                            name='log-writer', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        """
+        Resolve everything that depends on the calling thread or on objects
+        that may change later: message arguments and exception info.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = (self.formatter or logging._defaultFormatter).formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        try:
+            self._ensure_writer()
+            record = self.prepare(record)
+            if self.block:
+                self._queue.put(record)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def _run(self, records_queue):
+        while True:
+            batch = [records_queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(records_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            records = [record for record in batch if record is not None]
+            dropped = self.dropped
+            if dropped != self._reported_dropped:
+                records.append(logging.makeLogRecord({
+                    'name': __name__,
+                    'levelno': logging.WARNING,
+                    'levelname': logging.getLevelName(logging.WARNING),
+                    'msg': 'log queue full, %d records dropped so far' % dropped,
+                }))
+                self._reported_dropped = dropped
+            self._write(records)
+
+            if None in batch:
+                return
+
+    def _write(self, records):
+        if not records:
+            return
+        emit_batch = getattr(self.target, 'emit_batch', None)
+        if emit_batch is not None:
+            emit_batch(records)
+        else:
+            for record in records:
+                self.target.handle(record)
+
+    def flush(self):
+        self.target.flush()
+
+    def close(self):
+        with self._writer_lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                self._queue.put(None)
+                self._thread.join(timeout=10)
+            self._pid = None
+        self.target.close()
+        super().close()
+
+
+class RequestIDMiddleware:
+    """
+    Tags every request with an id (see ``RequestIDFilter``) and writes one
+    access log record per response to the ``projectx.access`` logger.
+
+    Access records carry the fields of ``ACCESS_LOG_FIELDS`` as ``extra``,
+    so ``AccessLogFormatter`` can write them as fixed-schema JSON. Records
+    are sampled by status class (``LOG_SAMPLE_RATES``) and path prefix
+    (``LOG_SAMPLE_PATH_RATES``); the effective rate is the product of both.
+
+    All settings are read once, when the middleware is created. Runs
+    natively under both WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.request_id_header = getattr(settings, REQUEST_ID_HEADER_SETTING, None)
+        self.generate_request_id_if_not_in_header = getattr(
+            settings, GENERATE_REQUEST_ID_IF_NOT_IN_HEADER_SETTING, False)
+        self.no_request_id = getattr(settings, LOG_REQUESTS_NO_SETTING, DEFAULT_NO_REQUEST_ID)
+        self.response_header = getattr(settings, REQUEST_ID_RESPONSE_HEADER_SETTING, False)
+        self.log_requests = getattr(settings, LOG_REQUESTS_SETTING, False)
+        self.user_attribute = getattr(settings, LOG_USER_ATTRIBUTE_SETTING, False)
+        self.ignore_paths = tuple(getattr(settings, LOG_REQUESTS_IGNORE_PATHS_SETTING,
+                                          DEFAULT_IGNORE_PATHS))
+        self.sample_rates = dict(getattr(settings, LOG_SAMPLE_RATES_SETTING, {}))
+        # longest prefix first, so the most specific rule wins
+        self.sample_path_rates = sorted(
+            getattr(settings, LOG_SAMPLE_PATH_RATES_SETTING, {}).items(),
+            key=lambda item: len(item[0]), reverse=True)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        self.process_request(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        self.process_request(request)
+        return self.process_response(request, await self.get_response(request))
 
     def process_request(self, request):
         request_id = self._get_request_id(request)
         local.request_id = request_id
         request.id = request_id
-        request.start_time = time.time()
+        request.start_time = time.perf_counter()
 
-    def get_log_message(self, request, response, request_response_duration):
+    def get_user_id(self, request):
         user = getattr(request, 'user', None)
-        user_attribute = getattr(settings, LOG_USER_ATTRIBUTE_SETTING, False)
-        if user_attribute:
-            user_id = getattr(user, user_attribute, None)
+        if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+            # never load the user (a query, not allowed under ASGI) just to log it
+            return None
+        if self.user_attribute:
+            return getattr(user, self.user_attribute, None)
+        return getattr(user, 'pk', None) or getattr(user, 'id', None)
+
+    def get_log_fields(self, request, response, request_response_duration):
+        if response.streaming:
+            response_bytes = None
         else:
-            user_id = getattr(user, 'pk', None) or getattr(user, 'id', None)
-        message = ' == method=%s path=%s status=%s duration=%s' % (request.method, request.path, response.status_code, request_response_duration)
-        if user_id:
-            message += ' user=' + str(user_id)
-        if request.GET:
-            message += ' query=' + str(request.GET.urlencode())
-        return message
+            response_bytes = len(response.content)
+        return {
+            'request_id': getattr(request, 'id', self.no_request_id),
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(request_response_duration * 1000, 3),
+            'user': self.get_user_id(request) or None,
+            'query': request.META.get('QUERY_STRING') or None,
+            'bytes': response_bytes,
+        }
+
+    def should_log(self, request, response):
+        path = request.path
+        if any(ignored in path for ignored in self.ignore_paths):
+            return False
+
+        rate = self.sample_rates.get('%dxx' % (response.status_code // 100), 1.0)
+        for prefix, path_rate in self.sample_path_rates:
+            if path.startswith(prefix):
+                rate *= path_rate
+                break
+        return rate >= 1.0 or random.random() < rate
 
     def process_response(self, request, response):
-        if getattr(settings, REQUEST_ID_RESPONSE_HEADER_SETTING, False) and getattr(request, 'id', None):
-            response[getattr(settings, REQUEST_ID_RESPONSE_HEADER_SETTING)] = request.id
-
-        if not getattr(settings, LOG_REQUESTS_SETTING, False):
-            return response
-
-        # Don't log favicon
-        if 'favicon' in request.path:
-            return response
-
-        # don't log admin paths
-        if 'api/superAmdin' in request.path:
-            return response
+        if self.response_header and getattr(request, 'id', None):
+            response[self.response_header] = request.id
 
-        # don't log ping api
-        if 'api/ping' in request.path:
+        if not self.log_requests:
             return response
 
         try:
-            request_response_duration = time.time() - request.start_time
-        except Exception:
+            request_response_duration = time.perf_counter() - request.start_time
+        except AttributeError:
             request_response_duration = -1
 
-        logger.info(self.get_log_message(request, response, request_response_duration))
+        if self.should_log(request, response):
+            fields = self.get_log_fields(request, response, request_response_duration)
+            message = ' == method=%s path=%s status=%s duration=%s'
+            args = [fields['method'], fields['path'], fields['status'], request_response_duration]
+            if fields['user']:
+                message += ' user=%s'
+                args.append(fields['user'])
+            if fields['query']:
+                message += ' query=%s'
+                args.append(fields['query'])
+            access_logger.info(message, *args, extra=fields)
 
         try:
             del local.request_id
@@ -131,21 +584,19 @@ class RequestIDMiddleware(MiddlewareMixin):
         return response
 
     def _get_request_id(self, request):
-        request_id_header = getattr(settings, REQUEST_ID_HEADER_SETTING, None)
-        generate_request_if_not_in_header = getattr(settings, GENERATE_REQUEST_ID_IF_NOT_IN_HEADER_SETTING, False)
-
-        if request_id_header:
+        if self.request_id_header:
             # fallback to NO_REQUEST_ID if settings asked to use the
             # header request_id but none provided
-            default_request_id = getattr(settings, LOG_REQUESTS_NO_SETTING, DEFAULT_NO_REQUEST_ID)
+            request_id = request.META.get(self.request_id_header)
+            if request_id:
+                return request_id
 
             # unless the setting GENERATE_REQUEST_ID_IF_NOT_IN_HEADER
             # was set, in which case generate an id as normal if it wasn't
             # passed in via the header
-            if generate_request_if_not_in_header:
-                default_request_id = self._generate_id()
-
-            return request.META.get(request_id_header, default_request_id)
+            if self.generate_request_id_if_not_in_header:
+                return self._generate_id()
+            return self.no_request_id
 
         return self._generate_id()
 
@@ -154,12 +605,35 @@ class RequestIDMiddleware(MiddlewareMixin):
 
 
 class RequestIDFilter(logging.Filter):
+    _default_request_id = None
+
     def filter(self, record):
-        default_request_id = getattr(settings, LOG_REQUESTS_NO_SETTING, DEFAULT_NO_REQUEST_ID)
-        record.request_id = getattr(local, 'request_id', default_request_id)
+        if self._default_request_id is None:
+            self._default_request_id = getattr(settings, LOG_REQUESTS_NO_SETTING, DEFAULT_NO_REQUEST_ID)
+        record.request_id = getattr(local, 'request_id', self._default_request_id)
         return True
 
 
+class AccessLogFormatter(json_log_formatter.JSONFormatter):
+    """
+    One JSON object per access record with a fixed set of keys, in the
+    order of ``ACCESS_LOG_FIELDS``. Records that are not access records
+    keep their message and level.
+    """
+    def json_record(self, message, extra, record):
+        json_record = {'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat()}
+        if 'method' in extra:
+            for field in ACCESS_LOG_FIELDS:
+                json_record[field] = extra.get(field)
+        else:
+            json_record['level'] = record.levelname
+            json_record['request_id'] = extra.get('request_id')
+            json_record['message'] = message
+            if record.exc_text:
+                json_record['exc_info'] = record.exc_text
+        return json_record
+
+
 class IgnoreMissingFormatter(logging.Formatter):
     def format(self, record):
         if not hasattr(record, 'request_id'):
@@ -0,0 +1,141 @@
+"""
+Cold start of a worker: interpreter start to a WSGI application ready to
+serve, measured in fresh processes because this process has already paid
+for it.
+
+    python manage.py profile_startup                 # current settings
+    python manage.py profile_startup --compare       # full vs API_ONLY
+    python manage.py profile_startup --top 30 --runs 10
+
+Phases are settings (reading .env included), apps ready (django.setup())
+and application (WSGI handler with its middleware, URLconf resolved). RSS
+is the resident size once the application is loaded. The import table
+comes from one extra run with ``python -X importtime`` and lists the
+packages and modules taking the most time.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# runs in the child process, prints the phase timings as JSON
+CHILD = '''
+import json, os, resource, time
+started = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'projectx.settings')
+from django.conf import settings
+settings.INSTALLED_APPS
+configured = time.perf_counter()
+import django
+django.setup()
+ready = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
+get_wsgi_application()
+get_resolver().url_patterns
+loaded = time.perf_counter()
+rss = 0
+with open('/proc/self/status') as status:
+    for line in status:
+        if line.startswith('VmRSS:'):
+            rss = int(line.split()[1])
+print(json.dumps({
+    'settings': configured - started,
+    'apps ready': ready - configured,
+    'application': loaded - ready,
+    'rss_kb': rss or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'modules': len(__import__('sys').modules),
+}))
+'''
+
+PHASES = ('settings', 'apps ready', 'application')
+
+
+def parse_importtime(output):
+    """
+    (self time per top level package, cumulative time per module) in
+    microseconds from ``-X importtime`` output.
+    """
+    packages, modules = Counter(), {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        packages[name.split('.')[0]] += int(own)
+        modules[name] = max(modules.get(name, 0), int(cumulative))
+    return packages, modules
+
+
+class Command(BaseCommand):
+    help = 'Measure worker cold start: import time per module, app ready time and RSS.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Processes started per profile.')
+        parser.add_argument('--top', type=int, default=15, help='Packages and modules listed.')
+        parser.add_argument('--api-only', action='store_true', help='Profile with API_ONLY=True.')
+        parser.add_argument('--compare', action='store_true', help='Profile the full and the API_ONLY settings.')
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            profiles = [('full', 'False'), ('API_ONLY', 'True')]
+        elif options['api_only']:
+            profiles = [('API_ONLY', 'True')]
+        else:
+            profiles = [('API_ONLY' if getattr(settings, 'API_ONLY', False) else 'full', None)]
+
+        results = {}
+        for name, api_only in profiles:
+            env = dict(os.environ)
+            if api_only is not None:
+                env['API_ONLY'] = api_only
+            results[name] = self.profile(name, env, options['runs'], options['top'])
+
+        if len(results) > 1:
+            (full_name, full), (lean_name, lean) = results.items()
+            self.stdout.write('\n%s vs %s: cold start %.1f ms -> %.1f ms (%.0f%%), RSS %.1f MB -> %.1f MB (%.0f%%)' % (
+                full_name, lean_name,
+                full['total'] * 1000, lean['total'] * 1000, (lean['total'] / full['total'] - 1) * 100,
+                full['rss_kb'] / 1024, lean['rss_kb'] / 1024, (lean['rss_kb'] / full['rss_kb'] - 1) * 100))
+
+    def run_child(self, env, *flags):
+        started = time.perf_counter()
+        process = subprocess.run([sys.executable, *flags, '-c', CHILD], env=env, cwd=settings.BASE_DIR,
+                                 capture_output=True, text=True)
+        elapsed = time.perf_counter() - started
+        if process.returncode:
+            raise RuntimeError(process.stderr.strip().splitlines()[-1] if process.stderr else 'startup failed')
+        return elapsed, json.loads(process.stdout.strip().splitlines()[-1]), process.stderr
+
+    def profile(self, name, env, runs, top):
+        samples = [self.run_child(env) for _ in range(runs)]
+        _, _, importtime = self.run_child(env, '-X', 'importtime')
+        packages, modules = parse_importtime(importtime)
+
+        def median(key):
+            return statistics.median(result[key] for _, result, _ in samples)
+
+        summary = {phase: median(phase) for phase in PHASES}
+        summary['total'] = statistics.median(elapsed for elapsed, _, _ in samples)
+        summary['rss_kb'] = median('rss_kb')
+
+        self.stdout.write(self.style.MIGRATE_HEADING('%s (median of %d runs)' % (name, runs)))
+        self.stdout.write('  process start to exit  %8.1f ms' % (summary['total'] * 1000))
+        for phase in PHASES:
+            self.stdout.write('  %-22s %8.1f ms' % (phase, summary[phase] * 1000))
+        self.stdout.write('  RSS                    %8.1f MB' % (summary['rss_kb'] / 1024))
+        self.stdout.write('  modules loaded         %8d' % median('modules'))
+
+        self.stdout.write('  slowest packages (self time, -X importtime)')
+        for package, micros in packages.most_common(top):
+            self.stdout.write('    %-40s %8.1f ms' % (package, micros / 1000))
+        self.stdout.write('  slowest modules (cumulative)')
+        for module, micros in sorted(modules.items(), key=lambda item: -item[1])[:top]:
+            self.stdout.write('    %-40s %8.1f ms' % (module, micros / 1000))
+        return summary
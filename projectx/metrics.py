@@ -0,0 +1,132 @@
+"""
+Prometheus text exposition on /api/metrics/.
+
+Everything here is per process: with several workers a scrape only sees
+the worker that answered it, so scrape each worker or sum the series.
+Scrapes need ``Authorization: Bearer <METRICS_TOKEN>``; without a token
+the endpoint is only served with ``DEBUG`` on, and is a 404 otherwise.
+"""
+import hmac
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+from account import cache as account_cache
+from projectx.exceptions import errors
+from projectx.instrumentation import stats as request_stats
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# psycopg_pool stat -> (metric, type, help)
+POOL_STATS = {
+    'pool_size': ('db_pool_connections', 'gauge', 'Connections currently managed by the pool.'),
+    'pool_available': ('db_pool_connections_idle', 'gauge', 'Idle connections in the pool.'),
+    'pool_max': ('db_pool_connections_max', 'gauge', 'Maximum size of the pool.'),
+    'requests_waiting': ('db_pool_requests_waiting', 'gauge', 'Requests waiting for a connection right now.'),
+    'requests_num': ('db_pool_requests_total', 'counter', 'Connections requested from the pool.'),
+    'requests_queued': ('db_pool_requests_queued_total', 'counter', 'Requests that had to wait for a connection.'),
+    'requests_wait_ms': ('db_pool_requests_wait_ms_total', 'counter', 'Total time spent waiting for a connection.'),
+    'requests_errors': ('db_pool_requests_errors_total', 'counter', 'Requests that timed out or failed.'),
+    'connections_num': ('db_pool_connections_opened_total', 'counter', 'Connections opened by the pool.'),
+    'connections_lost': ('db_pool_connections_lost_total', 'counter', 'Connections found broken on return.'),
+}
+
+_connections_opened = Counter()
+_lock = threading.Lock()
+
+
+@receiver(connection_created, dispatch_uid='projectx_metrics_connection_created')
+def count_connection(sender, connection, **kwargs):
+    with _lock:
+        _connections_opened[connection.alias] += 1
+
+
+def collect_database():
+    with _lock:
+        opened = dict(_connections_opened)
+    yield ('db_connections_opened_total', 'counter',
+           'Database connections opened by Django, pooled connections not included.',
+           [({'alias': alias}, count) for alias, count in opened.items()])
+
+    pools = []
+    for alias in connections:
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is not None:
+            pools.append((alias, pool.get_stats()))
+    if not pools:
+        return
+
+    yield ('db_pool_connections_in_use', 'gauge', 'Connections checked out of the pool.',
+           [({'alias': alias}, stats.get('pool_size', 0) - stats.get('pool_available', 0))
+            for alias, stats in pools])
+    for stat, (name, kind, help_text) in POOL_STATS.items():
+        yield name, kind, help_text, [({'alias': alias}, stats.get(stat, 0)) for alias, stats in pools]
+
+
+def collect_account_cache():
+    stats = account_cache.get_stats()
+    yield ('account_cache_requests_total', 'counter', 'Account cache lookups by result.',
+           [({'result': 'hit'}, stats['hits']), ({'result': 'miss'}, stats['misses'])])
+
+
+def collect_errors():
+    yield ('unhandled_errors_total', 'counter', 'Unhandled API exceptions by type.',
+           [({'type': name}, count) for name, count in sorted(errors.get_stats().items())])
+
+
+def collect_requests():
+    latency = request_stats.latency
+    histogram = []
+    for (view, method), (counts, total) in sorted(latency.snapshot().items()):
+        labels = {'view': view, 'method': method}
+        for bound, count in zip(latency.buckets + ('+Inf',), counts):
+            histogram.append(('_bucket', {**labels, 'le': bound}, count))
+        histogram.append(('_sum', labels, total))
+        histogram.append(('_count', labels, counts[-1]))
+    yield 'request_duration_seconds', 'histogram', 'Request latency by view.', histogram
+
+    totals = sorted(request_stats.get_totals().items())
+    yield ('request_queries_total', 'counter', 'Database queries run by requests, by view.',
+           [({'view': view, 'method': method}, queries) for (view, method), (queries, _, _) in totals])
+    yield ('request_db_seconds_total', 'counter', 'Time requests spent in the database, by view.',
+           [({'view': view, 'method': method}, db_ns / 1e9) for (view, method), (_, db_ns, _) in totals])
+    yield ('response_bytes_total', 'counter', 'Response body bytes, streamed responses not included.',
+           [({'view': view, 'method': method}, size) for (view, method), (_, _, size) in totals])
+
+
+collectors = [collect_database, collect_account_cache, collect_errors, collect_requests]
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (key, str(value).replace('\\', r'\\').replace('"', r'\"'))
+                             for key, value in labels.items())
+
+
+def render():
+    lines = []
+    for collect in collectors:
+        for name, kind, help_text, samples in collect():
+            name = 'projectx_' + name
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, kind))
+            # histogram samples are (suffix, labels, value)
+            for sample in samples:
+                suffix, labels, value = sample if len(sample) == 3 else ('',) + sample
+                lines.append('%s%s%s %s' % (name, suffix, format_labels(labels), value))
+    return '\n'.join(lines) + '\n'
+
+
+def metrics(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token and not settings.DEBUG:
+        raise Http404
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer ' + token):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
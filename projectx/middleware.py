@@ -0,0 +1,70 @@
+"""
+Django's own middleware, with hooks that run on the event loop under ASGI.
+
+``MiddlewareMixin`` is async capable, but in async mode it calls
+``process_request`` and ``process_response`` through ``sync_to_async``,
+and the handler adapts ``process_view`` the same way: one hop to the sync
+thread per hook, a dozen per request with the stack in settings. These
+hooks only read and set headers, cookies and lazy attributes, so they run
+inline; only a session that has to be saved goes to the thread. Under
+WSGI they are Django's classes unchanged.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import middleware as auth
+from django.contrib.messages import middleware as messages
+from django.contrib.sessions import middleware as sessions
+from django.middleware import clickjacking, common, csrf, security
+
+
+class InlineHooksMixin:
+    async def __acall__(self, request):
+        response = None
+        if hasattr(self, 'process_request'):
+            response = self.process_request(request)
+        response = response or await self.get_response(request)
+        if hasattr(self, 'process_response'):
+            response = await self.aprocess_response(request, response)
+        return response
+
+    async def aprocess_response(self, request, response):
+        return self.process_response(request, response)
+
+
+class SecurityMiddleware(InlineHooksMixin, security.SecurityMiddleware):
+    pass
+
+
+class SessionMiddleware(InlineHooksMixin, sessions.SessionMiddleware):
+    async def aprocess_response(self, request, response):
+        if request.session.modified or settings.SESSION_SAVE_EVERY_REQUEST:
+            # writes to the session store
+            return await sync_to_async(self.process_response, thread_sensitive=True)(request, response)
+        return self.process_response(request, response)
+
+
+class CommonMiddleware(InlineHooksMixin, common.CommonMiddleware):
+    pass
+
+
+class CsrfViewMiddleware(InlineHooksMixin, csrf.CsrfViewMiddleware):
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if self.async_mode:
+            # picked up by the handler instead of the sync method
+            self.process_view = self.aprocess_view
+
+    async def aprocess_view(self, request, callback, callback_args, callback_kwargs):
+        return csrf.CsrfViewMiddleware.process_view(self, request, callback, callback_args, callback_kwargs)
+
+
+class AuthenticationMiddleware(InlineHooksMixin, auth.AuthenticationMiddleware):
+    pass
+
+
+class MessageMiddleware(InlineHooksMixin, messages.MessageMiddleware):
+    pass
+
+
+class XFrameOptionsMiddleware(InlineHooksMixin, clickjacking.XFrameOptionsMiddleware):
+    pass
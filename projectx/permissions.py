@@ -3,4 +3,5 @@ from rest_framework import permissions
 
 class IsOwnAccount(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        return obj == request.user
+        # request.user may be a token user, compare by primary key
+        return obj.pk == request.user.pk
@@ -0,0 +1,142 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from rest_framework import serializers
+
+from projectx import fields as projectx_fields
+from projectx.instrumentation import timer
+
+# field classes whose representation of a database value is the value
+PASSTHROUGH_FIELDS = {
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.EmailField,
+    serializers.IntegerField,
+    serializers.RegexField,
+    serializers.SlugField,
+    serializers.URLField,
+}
+
+
+class ReadPlan:
+    """
+    Read only serialization of a ``ModelSerializer`` straight from
+    ``values()`` rows: the columns to fetch and, per output field, its
+    column and the representation function for values that are not
+    returned as is. Built once per serializer class by ``get_read_plan``.
+    """
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self.columns = tuple(column for _, column, _ in self.fields)
+        self.converters = tuple((name, convert) for name, _, convert in self.fields if convert is not None)
+        # rows of exactly these columns already are the output
+        self.passthrough = (not self.converters
+                            and all(name == column for name, column, _ in self.fields))
+        self._subsets = {}
+
+    def subset(self, names):
+        """
+        The plan for only the output fields in ``names``.
+        """
+        names = frozenset(names)
+        plan = self._subsets.get(names)
+        if plan is None:
+            plan = self._subsets[names] = ReadPlan(field for field in self.fields if field[0] in names)
+        return plan
+
+    def narrow(self, queryset, extra=()):
+        """
+        ``queryset.values()`` of the plan's columns plus ``extra`` ones
+        (the ordering fields a cursor paginator reads from each row).
+        """
+        extra = tuple(column for column in extra if column not in self.columns)
+        return queryset.values(*self.columns, *extra)
+
+    def serialize(self, rows):
+        with timer('serialize'):
+            rows = list(rows)
+            if self.passthrough and (not rows or len(rows[0]) == len(self.columns)):
+                return rows
+
+            fields = [(name, column) for name, column, _ in self.fields]
+            data = [{name: row[column] for name, column in fields} for row in rows]
+            for name, convert in self.converters:
+                for item in data:
+                    value = item[name]
+                    if value is not None:
+                        item[name] = convert(value)
+            return data
+
+
+class ListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with timer('serialize'):
+            return super().data
+
+
+class ModelSerializer(serializers.ModelSerializer):
+    """
+    ModelSerializer whose ``data`` (and that of its ``many=True`` list)
+    is counted as serializer time in the request metrics.
+
+    ``get_read_plan`` compiles the readable fields into a ``ReadPlan``
+    that list views use to serialize ``values()`` rows instead of model
+    instances. A ``fields`` argument keeps only the named fields.
+
+    Model date and datetime fields map to the ``projectx.fields`` ones.
+    """
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        models.DateTimeField: projectx_fields.DateTimeField,
+        models.DateField: projectx_fields.DateField,
+    }
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @property
+    def data(self):
+        with timer('serialize'):
+            return super().data
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        serializer = super().many_init(*args, **kwargs)
+        # unless the subclass asked for its own Meta.list_serializer_class
+        if type(serializer) is serializers.ListSerializer:
+            serializer.__class__ = ListSerializer
+        return serializer
+
+    @classmethod
+    def get_read_plan(cls):
+        """
+        The ``ReadPlan`` of this serializer, or None when a field (method
+        fields, relations, dotted sources, properties) or an overridden
+        ``to_representation`` needs model instances.
+        """
+        if '_read_plan' not in cls.__dict__:
+            cls._read_plan = cls._build_read_plan()
+        return cls._read_plan
+
+    @classmethod
+    def _build_read_plan(cls):
+        if cls.to_representation is not serializers.Serializer.to_representation:
+            return None
+
+        model = cls.Meta.model
+        fields = []
+        for field in cls().fields.values():
+            if field.write_only:
+                continue
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                return None
+            if not model_field.concrete or model_field.is_relation:
+                return None
+            convert = None if type(field) in PASSTHROUGH_FIELDS else field.to_representation
+            fields.append((field.field_name, model_field.attname, convert))
+        return ReadPlan(fields)
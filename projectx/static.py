@@ -0,0 +1,61 @@
+"""
+Static files for the ASGI application.
+
+``WhiteNoiseMiddleware`` is sync only, so under ASGI it is left out of
+``MIDDLEWARE`` (it would move every request into a thread) and
+``StaticFilesApplication`` serves ``STATIC_ROOT`` in front of Django
+instead, with the same files, headers and precompressed variants:
+WhiteNoise's middleware only does the lookup here.
+"""
+from asgiref.sync import sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class StaticFilesApplication:
+    chunk_size = 64 * 1024
+
+    def __init__(self, application):
+        self.application = application
+        self.whitenoise = WhiteNoiseMiddleware()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            static_file = self.find_file(scope)
+            if static_file is not None:
+                return await self.serve(static_file, scope, send)
+        await self.application(scope, receive, send)
+
+    def find_file(self, scope):
+        path = scope['path']
+        root_path = scope.get('root_path', '')
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        if self.whitenoise.autorefresh:
+            return self.whitenoise.find_file(path)
+        return self.whitenoise.files.get(path)
+
+    async def serve(self, static_file, scope, send):
+        # WhiteNoise reads the request headers the WSGI way
+        environ = {'HTTP_' + name.decode('latin-1').upper().replace('-', '_'): value.decode('latin-1')
+                   for name, value in scope['headers']}
+        response = static_file.get_response(scope['method'], environ)
+        await send({
+            'type': 'http.response.start',
+            'status': int(response.status),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in response.headers],
+        })
+        if response.file is None:
+            return await send({'type': 'http.response.body', 'body': b''})
+
+        # reads of a (cold) file may block, keep them off the event loop
+        read = sync_to_async(response.file.read, thread_sensitive=False)
+        try:
+            while True:
+                chunk = await read(self.chunk_size)
+                more_body = len(chunk) == self.chunk_size
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': more_body})
+                if not more_body:
+                    break
+        finally:
+            response.file.close()
@@ -0,0 +1,94 @@
+"""
+Test helpers.
+
+``QueryAssertionsMixin.assertNoNPlusOne`` fails a test when the same query
+shape runs again and again inside a block, the signature of a relation or
+lookup done once per row:
+
+    class TestUserViewSet(QueryAssertionsMixin, APITestCase):
+        def test_list(self):
+            with self.assertNoNPlusOne():
+                self.client.get(reverse('users-list'))
+
+``async_views()`` rebuilds the URLconf with ``ASYNC_VIEWS`` on, to test
+the native async handlers the way ``projectx.asgi`` serves them.
+
+``DiscoverRunner`` (``TEST_RUNNER``) keeps background writers from
+touching the test database: user activity (``account.activity``) is only
+written when a test flushes it.
+"""
+import importlib
+import re
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.test import override_settings, runner
+from django.urls import clear_url_caches
+
+IN_LIST = re.compile(r'IN \((?:%s|\?)(?:, (?:%s|\?))*\)')
+WHITESPACE = re.compile(r'\s+')
+IGNORED_PREFIXES = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+def normalize_sql(sql):
+    """
+    The shape of a query: parameters are already placeholders, IN lists
+    of any length collapse to one.
+    """
+    return IN_LIST.sub('IN (...)', WHITESPACE.sub(' ', sql.strip()))
+
+
+class QueryShapeRecorder:
+    def __init__(self):
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.lstrip().upper().startswith(IGNORED_PREFIXES):
+            self.shapes[normalize_sql(sql)] += 1
+        return execute(sql, params, many, context)
+
+
+class QueryAssertionsMixin:
+    @contextmanager
+    def assertNoNPlusOne(self, threshold=3, using=None):
+        """
+        Fails when any query shape runs ``threshold`` times or more inside
+        the block, on the ``using`` aliases (all databases by default).
+        """
+        recorder = QueryShapeRecorder()
+        aliases = [using] if isinstance(using, str) else (using or list(connections))
+        with ExitStack() as stack:
+            for alias in aliases:
+                stack.enter_context(connections[alias].execute_wrapper(recorder))
+            yield recorder
+
+        repeated = [(count, shape) for shape, count in recorder.shapes.items() if count >= threshold]
+        if repeated:
+            self.fail('N+1 queries, repeated %d times or more:\n%s' % (threshold, '\n'.join(
+                '%4dx %s' % (count, shape) for count, shape in sorted(repeated, reverse=True))))
+
+
+class DiscoverRunner(runner.DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.ACCOUNT_ACTIVITY_FLUSH_INTERVAL = 0
+
+
+def _reload_urlconfs():
+    # views pick sync or async dispatch in as_view(), when the URLconf is
+    # imported; included URLconfs first
+    for name in ('account.urls', settings.ROOT_URLCONF):
+        importlib.reload(importlib.import_module(name))
+    clear_url_caches()
+
+
+@contextmanager
+def async_views():
+    try:
+        with override_settings(ASYNC_VIEWS=True):
+            _reload_urlconfs()
+            yield
+    finally:
+        _reload_urlconfs()
@@ -0,0 +1,690 @@
+import asyncio
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
+
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.signals import request_finished
+from django.db import DatabaseError
+from django.db.backends.signals import connection_created
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework import renderers, serializers, viewsets
+from rest_framework.exceptions import ErrorDetail, NotFound
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from projectx import celery_app, fields
+from projectx.celery import propagate_request_id
+from projectx.datetime_parsing import FormatParser
+from projectx.db_router import (PIN_COOKIE, PIN_KEY, DelayedCalls, ReplicaRouter, ReplicaRoutingMiddleware,
+                                route_user)
+from projectx.exceptions import ErrorAggregator, custom_exception_handler, errors
+from projectx.handlers import ASGIHandler
+from projectx.instrumentation import Histogram, InstrumentationMiddleware, stats, timer
+from projectx.logging import (ACCESS_LOG_FIELDS, AccessLogFormatter, ConcurrentRotatingFileHandler,
+                              QueueingHandler, local)
+from projectx.management.commands.profile_startup import parse_importtime
+from projectx.metrics import CONTENT_TYPE, render
+from projectx.renderers import JSONRenderer
+from projectx.serializers import ModelSerializer
+from projectx.static import StaticFilesApplication
+from projectx.testing import QueryAssertionsMixin, async_views
+from projectx.utils import (SLUG_CANDIDATES, StreamingListModelMixin, generate_slug, generate_slugs,
+                            save_with_slug)
+from projectx.views import SparseFieldsMixin
+
+User = get_user_model()
+
+
+class TestQueueingHandler(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp.name, 'logs', 'info.log')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_handler(self, **kwargs):
+        handler = QueueingHandler(filename=self.filename, **kwargs)
+        handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        self.addCleanup(handler.close)
+        return handler
+
+    def make_record(self, msg, *args):
+        return logging.makeLogRecord({'msg': msg, 'args': args, 'levelno': logging.INFO,
+                                      'levelname': 'INFO'})
+
+    def read_lines(self):
+        with open(self.filename) as f:
+            return f.read().splitlines()
+
+    def test_writes_every_record_on_close(self):
+        handler = self.make_handler(maxBytes=1024, backupCount=100)
+        for i in range(500):
+            handler.handle(self.make_record('record %s', i))
+        handler.close()
+
+        lines = []
+        for name in os.listdir(os.path.dirname(self.filename)):
+            with open(os.path.join(os.path.dirname(self.filename), name)) as f:
+                lines += f.read().splitlines()
+        self.assertEqual(len(lines), 500)
+        self.assertIn('INFO record 499', lines)
+
+    def test_drops_and_counts_records_when_queue_is_full(self):
+        handler = self.make_handler(queue_size=2)
+        release = threading.Event()
+        emit_batch = handler.target.emit_batch
+
+        def slow_emit_batch(records):
+            release.wait(5)
+            emit_batch(records)
+
+        with mock.patch.object(handler.target, 'emit_batch', slow_emit_batch):
+            for i in range(10):
+                handler.handle(self.make_record('record %s', i))
+            self.assertGreater(handler.dropped, 0)
+            release.set()
+            handler.close()
+
+        lines = self.read_lines()
+        self.assertEqual(len([line for line in lines if line.startswith('INFO')]), 10 - handler.dropped)
+        self.assertIn('WARNING log queue full, %d records dropped so far' % handler.dropped, lines)
+
+
+class TestConcurrentRotatingFileHandler(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.filename = os.path.join(self.tmp.name, 'logs', 'info.log')
+
+    def make_handler(self, **kwargs):
+        handler = ConcurrentRotatingFileHandler(self.filename, delay=True, **kwargs)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self.addCleanup(handler.close)
+        return handler
+
+    def write(self, handler, worker, count, batch_size=25):
+        for start in range(0, count, batch_size):
+            handler.emit_batch([logging.makeLogRecord({'msg': 'worker %d record %05d %s' % (worker, i, 'x' * 40)})
+                                for i in range(start, min(start + batch_size, count))])
+
+    def read_segments(self, handler):
+        contents = []
+        for path in handler.get_segments():
+            opener = gzip.open if path.endswith('.gz') else open
+            with opener(path, 'rt') as f:
+                contents.append(f.read())
+        return contents
+
+    def test_processes_share_the_file_and_its_rotation(self):
+        # created before the fork, like in gunicorn --preload workers
+        handler = self.make_handler(maxBytes=20000, backupCount=1000)
+
+        def worker(number):
+            self.write(handler, number, 1000)
+            handler.close()
+
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=worker, args=(number,)) for number in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(60)
+            self.assertEqual(process.exitcode, 0)
+
+        segments = self.read_segments(handler)
+        self.assertGreater(len(segments), 10)
+        self.assertTrue(all(path.endswith('.gz') for path in handler.get_segments()))
+        self.assertTrue(all(len(segment) <= 20000 for segment in segments))
+        with open(self.filename) as f:
+            lines = ''.join(segments + [f.read()]).splitlines()
+        expected = ['worker %d record %05d %s' % (number, i, 'x' * 40) for number in range(4) for i in range(1000)]
+        self.assertEqual(sorted(lines), expected)
+
+    def test_rotates_by_time(self):
+        handler = self.make_handler(interval=3600)
+        self.write(handler, 0, 10)
+        earlier = time.time() - 3600
+        os.utime(self.filename, (earlier, earlier))
+        self.write(handler, 0, 10)
+        handler.close()
+        self.assertEqual(len(handler.get_segments()), 1)
+
+    def test_keeps_the_disk_budget(self):
+        handler = self.make_handler(maxBytes=1000, maxTotalBytes=3000, compress=False)
+        self.write(handler, 0, 400, batch_size=5)
+        handler.close()
+        sizes = [os.path.getsize(path) for path in handler.get_segments()]
+        self.assertLessEqual(sum(sizes) + os.path.getsize(self.filename), 3000 + 1000)
+        with open(self.filename) as f:
+            self.assertIn('record 00399', f.read())
+
+
+@override_settings(LOG_REQUESTS_IGNORE_PATHS=(), REQUEST_ID_RESPONSE_HEADER='X-Request-ID')
+class TestRequestIDMiddleware(SimpleTestCase):
+    def test_access_record_has_fixed_json_schema(self):
+        with self.assertLogs('projectx.access', 'INFO') as logs:
+            response = self.client.get('/api/ping/', {'verbose': 1})
+
+        record = logs.records[0]
+        self.assertEqual(record.request_id, response['X-Request-ID'])
+        self.assertEqual((record.method, record.path, record.status, record.query),
+                         ('GET', '/api/ping/', 200, 'verbose=1'))
+        self.assertEqual(record.bytes, len(response.content))
+
+        json_record = json.loads(AccessLogFormatter().format(record))
+        self.assertEqual(list(json_record), ['time', *ACCESS_LOG_FIELDS])
+
+    @override_settings(LOG_SAMPLE_RATES={'2xx': 0.0}, LOG_SAMPLE_PATH_RATES={'/api/': 1.0})
+    def test_sampling_by_status_class(self):
+        with self.assertNoLogs('projectx.access', 'INFO'):
+            self.client.get('/api/ping/')
+
+        with self.assertLogs('projectx.access', 'INFO'):
+            self.client.get('/api/nothing-here/')
+
+    @override_settings(LOG_SAMPLE_PATH_RATES={'/api/': 1.0, '/api/ping/': 0.0})
+    def test_sampling_by_longest_path_prefix(self):
+        with self.assertNoLogs('projectx.access', 'INFO'):
+            self.client.get('/api/ping/')
+
+
+@celery_app.task
+def current_request_id():
+    return getattr(local, 'request_id', None)
+
+
+class TestCeleryRequestID(SimpleTestCase):
+    def tearDown(self):
+        try:
+            del local.request_id
+        except AttributeError:
+            pass
+
+    def test_request_id_travels_with_the_task(self):
+        local.request_id = 'abc'
+        headers = {}
+        propagate_request_id(headers=headers)
+        self.assertEqual(headers, {'request_id': 'abc'})
+
+        # as a worker receives it, then inside a request (eager)
+        del local.request_id
+        self.assertEqual(current_request_id.apply(headers=headers).get(), 'abc')
+        self.assertFalse(hasattr(local, 'request_id'))
+        local.request_id = 'outer'
+        self.assertEqual(current_request_id.apply(headers=headers).get(), 'abc')
+        self.assertEqual(local.request_id, 'outer')
+        self.assertEqual(current_request_id.delay().get(), 'outer')
+
+
+class TestMetrics(SimpleTestCase):
+    @override_settings(DEBUG=True)
+    def test_prometheus_text_format(self):
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response['Content-Type'], CONTENT_TYPE)
+        lines = response.content.decode().splitlines()
+        self.assertIn('# TYPE projectx_account_cache_requests_total counter', lines)
+        self.assertTrue(any(line.startswith('projectx_account_cache_requests_total{result="hit"} ')
+                            for line in lines))
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_is_required_when_set(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        response = self.client.get('/api/metrics/', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_disabled_without_token_outside_debug(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 404)
+
+
+class TestReplicaRouter(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter(replicas=['replica_0', 'replica_1'])
+        self.lags = {'replica_0': 3.0, 'replica_1': 0.5}
+        patcher = mock.patch.object(self.router, 'check_replicas', side_effect=lambda: dict(self.lags))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.refresh()
+
+    def refresh(self):
+        self.router._lock.acquire()
+        self.router.refresh()
+
+    def route(self, request, write=False):
+        aliases = []
+
+        def get_response(request):
+            aliases.append(self.router.db_for_read(None))
+            aliases.append(self.router.db_for_read(None))
+            if write:
+                self.router.db_for_write(None)
+                aliases.append(self.router.db_for_read(None))
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(get_response)(request)
+        return aliases, response
+
+    def test_safe_requests_read_from_replicas_until_they_write(self):
+        aliases, response = self.route(RequestFactory().get('/'), write=True)
+        self.assertEqual(aliases, ['replica_0', 'replica_1', 'default'])
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        request = RequestFactory().get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.assertEqual(self.route(request)[0], ['default', 'default'])
+        self.assertEqual(self.route(RequestFactory().post('/'))[0], ['default', 'default'])
+        self.assertEqual(self.router.db_for_read(None), 'default')
+
+    def test_least_lag_and_fallback(self):
+        self.router.selection = 'least_lag'
+        self.assertEqual(self.route(RequestFactory().get('/'))[0], ['replica_1', 'replica_1'])
+
+        self.lags = {}
+        self.refresh()
+        self.assertEqual(self.route(RequestFactory().get('/'))[0], ['default', 'default'])
+
+    def test_streaming_responses_are_routed_until_closed(self):
+        def stream():
+            yield self.router.db_for_read(None)
+
+        response = ReplicaRoutingMiddleware(lambda request: StreamingHttpResponse(stream()))(
+            RequestFactory().get('/'))
+        self.assertEqual(b''.join(response), b'replica_0')
+        response.close()
+        self.assertEqual(self.router.db_for_read(None), 'default')
+
+    async def test_async_streaming_responses_are_routed_until_consumed(self):
+        async def stream():
+            yield self.router.db_for_read(None)
+
+        async def get_response(request):
+            return StreamingHttpResponse(stream())
+
+        response = await ReplicaRoutingMiddleware(get_response)(RequestFactory().get('/'))
+        self.assertEqual(b''.join([chunk async for chunk in response]), b'replica_0')
+        self.assertEqual(self.router.db_for_read(None), 'default')
+
+    def test_writes_pin_the_user_on_every_client(self):
+        user = mock.Mock(pk=7, is_authenticated=True)
+        self.addCleanup(cache.delete, PIN_KEY % user.pk)
+        aliases = []
+
+        def write(request):
+            route_user(user)
+            self.router.db_for_write(None)
+            return HttpResponse()
+
+        def read(request):
+            aliases.append(self.router.db_for_read(None))
+            route_user(user)  # authenticated, by a token: no cookie
+            aliases.append(self.router.db_for_read(None))
+            return HttpResponse()
+
+        with mock.patch('projectx.db_router.get_replicas', return_value=self.router.replicas):
+            ReplicaRoutingMiddleware(write)(RequestFactory().post('/'))
+            ReplicaRoutingMiddleware(read)(RequestFactory().get('/'))
+        self.assertEqual(aliases, ['replica_0', 'default'])
+
+    def test_delayed_calls_share_a_thread(self):
+        calls = DelayedCalls()
+        done = threading.Event()
+        results = []
+        threads = threading.active_count()
+        calls.call_later(0.05, results.append, 2)
+        calls.call_later(0, results.append, 1)
+        calls.call_later(0.1, done.set)
+        self.assertEqual(threading.active_count(), threads + 1)
+        self.assertTrue(done.wait(5))
+        self.assertEqual(results, [1, 2])
+
+
+class TestSlugAllocation(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for username in ('rahim', 'rahim-1', 'rahim-7', 'rahim-khan', 'karim'):
+            User.objects.create(username=username, email='%s@user.com' % username)
+
+    def test_generate_slug_in_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(generate_slug(User(), 'Sadia', field='username'), 'sadia')
+        with self.assertNumQueries(1):
+            slug = generate_slug(User(), 'Rahim', field='username')
+        self.assertRegex(slug, r'^rahim-[a-z0-9]{4}$')
+
+    def test_generate_slugs_for_a_batch(self):
+        with self.assertNumQueries(1):
+            slugs = generate_slugs(User, ['Rahim', 'Sadia', 'sadia', 'Rahim  Khan'], field='username')
+        self.assertEqual(len(set(slugs)), 4)
+        self.assertEqual(slugs[1], 'sadia')
+        self.assertRegex(slugs[2], r'^sadia-[a-z0-9]{4}$')
+        self.assertRegex(slugs[3], r'^rahim-khan-[a-z0-9]{4}$')
+
+    def test_generate_slug_grows_the_suffix_when_candidates_are_taken(self):
+        suffixes = ['1'] * SLUG_CANDIDATES + ['9'] * SLUG_CANDIDATES
+        with mock.patch('projectx.utils.get_random_string', side_effect=suffixes):
+            self.assertEqual(generate_slug(User(), 'Rahim', field='username'), 'rahim-9')
+
+    def test_save_with_slug_retries_when_the_slug_was_taken(self):
+        user = User(email='karim2@user.com')
+        with mock.patch('projectx.utils.generate_slug', side_effect=['karim', 'karim-x1y2']):
+            save_with_slug(user, 'Karim', field='username')
+        self.assertEqual(user.username, 'karim-x1y2')
+
+
+@override_settings(DEBUG=False, ERROR_TRACEBACK_SAMPLE_RATE=0.0, ERROR_LOG_WINDOW=60)
+class TestExceptionHandler(SimpleTestCase):
+    def handle(self, exc):
+        try:
+            raise exc
+        except Exception as e:
+            return custom_exception_handler(e, {'view': None})
+
+    def test_error_storm_is_logged_once_without_tracebacks(self):
+        before = errors.get_stats().get('DatabaseError', 0)
+        with mock.patch('traceback.format_exception') as format_exception, \
+                self.assertLogs('projectx.exceptions') as logs:
+            for _ in range(5000):
+                response = self.handle(DatabaseError('storm: connection refused'))
+
+        format_exception.assert_not_called()
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(errors.get_stats()['DatabaseError'] - before, 5000)
+        self.assertEqual(response.status_code, 500)
+        self.assertIsNone(response.data['traceback'])
+
+    @override_settings(DEBUG=True)
+    def test_traceback_in_debug(self):
+        with self.assertLogs('projectx.exceptions'):
+            response = self.handle(RuntimeError('debug: boom'))
+        self.assertEqual(response.data['traceback'][-1], 'RuntimeError: debug: boom')
+
+    def test_repeats_are_reported_after_the_window(self):
+        aggregator = ErrorAggregator()
+        signature = ('RuntimeError', 'boom', None)
+        with mock.patch('time.monotonic', side_effect=[0, 1, 2, 61]):
+            results = [aggregator.record(signature, 60) for _ in range(4)]
+        self.assertEqual(results, [(True, 0), (False, 1), (False, 2), (True, 2)])
+
+    def test_handled_errors_are_normalized(self):
+        response = self.handle(NotFound())
+        self.assertEqual(response.data, {'success': False, 'status_code': 404,
+                                         'error': 'Not Found', 'detail': 'Not found.'})
+        response.data['detail'] = 'changed'
+        self.assertEqual(self.handle(NotFound()).data['detail'], 'Not found.')
+
+
+def serve_asgi(application, path, method='GET', body=b''):
+    """
+    One request through an ASGI application, on an event loop of its own
+    as under an ASGI server: (status, headers, body).
+    """
+    async def request():
+        communicator = ApplicationCommunicator(application, {
+            'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'root_path': '',
+            'headers': [(b'host', b'testserver'), (b'content-type', b'application/json'),
+                        (b'content-length', str(len(body)).encode())],
+        })
+        await communicator.send_input({'type': 'http.request', 'body': body})
+        start = await communicator.receive_output()
+        content = b''
+        while True:
+            message = await communicator.receive_output()
+            content += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        await communicator.wait()
+        return start['status'], dict(start['headers']), content
+
+    return asyncio.run(request())
+
+
+class TestASGIHandler(SimpleTestCase):
+    databases = {'default'}
+
+    def test_middleware_is_not_adapted(self):
+        # Django logs each sync only middleware it wraps in sync_to_async (DEBUG on)
+        code = ('from unittest import mock\n'
+                'from django.core.handlers import base\n'
+                'with mock.patch.object(base.logger, "debug") as debug:\n'
+                '    import projectx.asgi\n'
+                'for call in debug.call_args_list:\n'
+                '    print(call.args[0] % call.args[1:])\n')
+        env = {**os.environ, 'DEBUG': 'True', 'ASYNC_VIEWS': 'True'}
+        result = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True, check=True)
+        self.assertNotIn('Asynchronous handler adapted for middleware', result.stdout)
+
+    def serve(self, path, **kwargs):
+        threads = {}
+
+        def record(name):
+            def receiver(**kwargs):
+                threads.setdefault(name, threading.get_ident())
+            return receiver
+
+        opened, finished = record('opened'), record('finished')
+        connection_created.connect(opened)
+        request_finished.connect(finished)
+        try:
+            status, headers, content = serve_asgi(ASGIHandler(), path, **kwargs)
+        finally:
+            connection_created.disconnect(opened)
+            request_finished.disconnect(finished)
+        return status, threads
+
+    def test_ping_stays_on_the_event_loop(self):
+        # a sync_to_async() anywhere on the way would start the request's thread
+        middleware = [path for path in settings.MIDDLEWARE if not path.startswith('whitenoise.')]
+        with override_settings(MIDDLEWARE=middleware), async_views(), \
+                mock.patch.object(threading.Thread, 'start', autospec=True,
+                                  side_effect=threading.Thread.start) as start:
+            status, headers, content = serve_asgi(ASGIHandler(), '/api/ping/')
+        self.assertEqual(status, 200)
+        start.assert_not_called()
+
+    def test_response_closed_on_the_event_loop(self):
+        status, threads = self.serve('/api/ping/')
+        self.assertEqual(status, 200)
+        self.assertEqual(threads, {'finished': threading.get_ident()})
+
+    def test_response_closed_where_connections_were_opened(self):
+        status, threads = self.serve('/api/v1/token/', method='POST',
+                                     body=b'{"username": "nobody", "password": "nothing"}')
+        self.assertEqual(status, 401)
+        self.assertNotEqual(threads['opened'], threading.get_ident())
+        self.assertEqual(threads['finished'], threads['opened'])
+
+
+@override_settings(WHITENOISE_AUTOREFRESH=True)
+class TestStaticFilesApplication(SimpleTestCase):
+    def test_serves_static_files(self):
+        application = StaticFilesApplication(get_asgi_application())
+        status, headers, content = serve_asgi(application, '/static/admin/css/base.css')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b'content-type'], b'text/css; charset="utf-8"')
+        self.assertEqual(int(headers[b'content-length']), len(content))
+        self.assertIn(b'DJANGO Admin styles', content)
+
+    def test_passes_other_paths_on(self):
+        application = StaticFilesApplication(get_asgi_application())
+        status, headers, content = serve_asgi(application, '/api/ping/')
+        self.assertEqual(status, 200)
+
+
+class TestProfileStartup(SimpleTestCase):
+    def test_parse_importtime(self):
+        packages, modules = parse_importtime(
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       100 |        100 |     django.utils\n'
+            'import time:       250 |        350 |   django\n'
+            'import time:        40 |        390 | projectx.settings\n'
+        )
+        self.assertEqual(packages, {'django': 350, 'projectx': 40})
+        self.assertEqual(modules['django'], 350)
+        self.assertEqual(modules['projectx.settings'], 390)
+
+    def test_api_only_profile_starts(self):
+        # a fresh process boots the API_ONLY settings and URLconf
+        out = StringIO()
+        call_command('profile_startup', api_only=True, runs=1, top=3, stdout=out)
+        output = out.getvalue()
+        self.assertIn('API_ONLY (median of 1 runs)', output)
+        self.assertIn('apps ready', output)
+        self.assertIn('slowest modules', output)
+
+
+class TestInstrumentation(QueryAssertionsMixin, TestCase):
+    def test_request_metrics(self):
+        def view(request):
+            User.objects.count()
+            with timer('render'):
+                content = b'{}'
+            return HttpResponse(content)
+
+        request = RequestFactory().get('/')
+        response = InstrumentationMiddleware(view)(request)
+        self.assertTrue(response['Server-Timing'].startswith('db;dur='))
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+        self.assertGreater(stats.get_totals()[('unmatched', 'GET')][0], 0)
+        self.assertIn('projectx_request_duration_seconds_bucket{view="unmatched",method="GET",le="+Inf"}', render())
+
+    def test_timer_outside_request_is_noop(self):
+        with timer('serialize'):
+            User.objects.count()
+
+    def test_histogram_is_cumulative(self):
+        histogram = Histogram(buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 5.0):
+            histogram.observe('view', value)
+        counts, total = histogram.snapshot()['view']
+        self.assertEqual(counts, [1, 3, 4])
+        self.assertAlmostEqual(total, 6.05)
+
+    def test_assert_no_n_plus_one(self):
+        users = [User.objects.create(username='user-%d' % i, email='user-%d@x.com' % i) for i in range(3)]
+        with self.assertNoNPlusOne():
+            list(User.objects.filter(pk__in=[user.pk for user in users]))
+        with self.assertRaisesMessage(AssertionError, '3x SELECT'):
+            with self.assertNoNPlusOne():
+                for user in users:
+                    User.objects.get(pk=user.pk)
+
+
+class TestFastSerialization(TestCase):
+    def test_read_plan_matches_serializer(self):
+        class UserSerializer(ModelSerializer):
+            class Meta:
+                model = User
+                fields = ('id', 'username', 'password', 'date_joined', 'is_active')
+                extra_kwargs = {'password': {'write_only': True}}
+
+        User.objects.create(username='rahim', email='rahim@x.com')
+        User.objects.create(username='karim', email='karim@x.com')
+        plan = UserSerializer.get_read_plan()
+        self.assertEqual(plan.columns, ('id', 'username', 'date_joined', 'is_active'))
+        queryset = User.objects.order_by('username')
+        self.assertEqual(plan.serialize(plan.narrow(queryset, extra=['email'])),
+                         UserSerializer(queryset, many=True).data)
+
+    def test_no_read_plan_for_computed_fields(self):
+        class UserSerializer(ModelSerializer):
+            name = serializers.SerializerMethodField()
+
+            class Meta:
+                model = User
+                fields = ('id', 'name')
+
+            def get_name(self, user):
+                return user.get_full_name()
+
+        self.assertIsNone(UserSerializer.get_read_plan())
+
+    def test_json_renderer_matches_drf(self):
+        data = {'name': 'ঢাকা\u2028', 'at': timezone.now(), 'error': ErrorDetail('bad'), 'none': None, 1: [1.5, True]}
+        self.assertEqual(JSONRenderer().render(data), renderers.JSONRenderer().render(data))
+        self.assertEqual(JSONRenderer().render(data, 'application/json; indent=4'),
+                         renderers.JSONRenderer().render(data, 'application/json; indent=4'))
+
+    def test_sparse_fields_defer_columns_without_read_plan(self):
+        class UserSerializer(ModelSerializer):
+            name = serializers.SerializerMethodField()
+
+            class Meta:
+                model = User
+                fields = ('id', 'email', 'name')
+
+            def get_name(self, user):
+                return user.username.title()
+
+        class UserViewSet(SparseFieldsMixin, StreamingListModelMixin, viewsets.GenericViewSet):
+            queryset = User.objects.all()
+            serializer_class = UserSerializer
+            pagination_class = None
+
+        user = User.objects.create(username='rahim', email='rahim@x.com')
+        request = APIRequestFactory().get('/', {'fields': 'id,email'})
+        force_authenticate(request, user)
+        with self.assertNumQueries(1) as queries:
+            response = UserViewSet.as_view({'get': 'list'})(request)
+        self.assertEqual(response.data, [{'id': user.pk, 'email': 'rahim@x.com'}])
+        self.assertNotIn('password', queries.captured_queries[0]['sql'])
+
+
+class TestDatetimeParsing(SimpleTestCase):
+    VALUES = ['2024-01-23T18:00:00.000Z', '2024-01-23T18:00:00Z', '2024-01-23T18:00:00+06:00',
+              '2024-01-23 18:00', '2024-01-23', '25/10/2006 14:30:59.0002', '5/1/2006', '25/10/06 14:30',
+              '31/02/2024', '2024-02-31', '24/13/2006', '25.10.2006', '২০২৪-01-23', '', 'now']
+
+    def parse(self, field, value):
+        try:
+            return field.to_internal_value(value)
+        except serializers.ValidationError as error:
+            return error.detail
+
+    def test_fields_match_drf(self):
+        for drf_field, field in ((serializers.DateTimeField(), fields.DateTimeField()),
+                                 (serializers.DateField(), fields.DateField())):
+            for value in self.VALUES * 2:  # the second time from the shape cache
+                with self.subTest(field=type(field).__name__, value=value):
+                    self.assertEqual(self.parse(field, value), self.parse(drf_field, value))
+
+    def test_first_accepting_format_wins(self):
+        parser = FormatParser(['%d/%m/%Y', '%m/%d/%Y'], None)
+        self.assertEqual(parser.parse('10/25/2006').month, 10)  # only %m/%d/%Y accepts it
+        self.assertEqual(parser.parse('05/04/2006').month, 4)   # both do, the first wins
+        with self.assertRaises(ValueError):
+            parser.parse('10.25.2006')
+
+    def test_iso_shapes_use_fromisoformat(self):
+        parser = FormatParser(['%d/%m/%Y', '%Y-%m-%dT%H:%M:%S.%f%z'], None)
+        parser.parse('2024-01-23T18:00:00.000Z')
+        parser.parse('23/01/2024')
+        self.assertEqual(parser.shapes, {'9999-99-99T99:99:99.999Z': (1, True), '99/99/9999': (0, False)})
+        with mock.patch('projectx.datetime_parsing.datetime.datetime') as datetime:
+            datetime.fromisoformat.return_value = 'parsed'
+            self.assertEqual(parser.parse('2025-02-03T04:05:06.789Z'), 'parsed')
+            datetime.strptime.assert_not_called()
+
+    def test_model_serializer_uses_the_fields(self):
+        class UserSerializer(ModelSerializer):
+            class Meta:
+                model = User
+                fields = ('date_joined',)
+
+        self.assertIsInstance(UserSerializer().fields['date_joined'], fields.DateTimeField)
@@ -13,11 +13,12 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.apps import apps
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-from projectx.views import ping
+from projectx.metrics import metrics
+from projectx.views import PingView
 
 api_v1_urls = [
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
@@ -26,7 +27,13 @@ api_v1_urls = [
 ]
 
 urlpatterns = [
-    path('api/ping/', ping),
-    path('api/superAmdin/', admin.site.urls),  # url is incorrect intentionally
+    path('api/ping/', PingView.as_view()),
+    path('api/metrics/', metrics),
     path('api/v1/', include(api_v1_urls)),
 ]
+
+# not installed on API_ONLY workers
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+
+    urlpatterns.append(path('api/superAmdin/', admin.site.urls))  # url is incorrect intentionally
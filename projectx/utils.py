@@ -1,31 +1,135 @@
+import hashlib
+import json
 import re
 from collections import OrderedDict
 
+from asgiref.sync import sync_to_async
+from django.core import signing
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
 from django.core.validators import RegexValidator
+from django.db import DatabaseError, IntegrityError, connections, transaction
 from django.db.models import Model
+from django.http import StreamingHttpResponse
 from django.utils.crypto import get_random_string
 from django.utils.translation import gettext_lazy as _
-from rest_framework import pagination
-from rest_framework.pagination import _positive_int
+from rest_framework import mixins, pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, _positive_int
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
+from projectx.renderers import NDJSONRenderer, dumps
 from utils.misc import convert_to_bool
 
 
-def generate_slug(instance: Model, value: str) -> str:
-    slug = re.sub(r'[-\s]+', '-', value.lower()).strip()
+def slugify_value(value: str) -> str:
+    return re.sub(r'[-\s]+', '-', value.lower()).strip()
 
-    model = instance.__class__
-    unique_slug = slug
-    while model.objects.filter(slug=unique_slug).exists():
-        unique_slug = slug + '-' + get_random_string(length=4)
-    return unique_slug
+
+# random suffixes tried per slug and query, the suffix doubles in length
+# each round in the unlikely case all candidates are taken
+SLUG_CANDIDATES = 8
+SLUG_SUFFIX_LENGTH = 4
+SLUG_SUFFIX_CHARS = 'abcdefghijklmnopqrstuvwxyz0123456789'
+SLUG_ROUNDS = 3
+
+
+def _with_suffix(base: str, suffix: str, max_length=None) -> str:
+    if not suffix:
+        return base[:max_length]
+    tail = '-' + suffix
+    if max_length:
+        base = base[:max_length - len(tail)]
+    return base + tail
+
+
+def _slug_candidates(base: str, suffix_length: int, max_length=None) -> list:
+    suffixes = [get_random_string(suffix_length, SLUG_SUFFIX_CHARS) for _ in range(SLUG_CANDIDATES)]
+    return [_with_suffix(base, suffix, max_length) for suffix in ['', *suffixes]]
+
+
+def generate_slug(instance: Model, value: str, field: str = 'slug') -> str:
+    """
+    A slug for ``value`` that is not used by any ``instance.__class__``
+    row: the plain slug if free, else ``<slug>-<random suffix>``. All
+    candidates are checked with one query on the slug's unique index, so
+    the cost does not grow with the number of similar slugs. Concurrent
+    inserts can still pick the same slug, save through ``save_with_slug``
+    to retry on the unique index.
+    """
+    return generate_slugs(instance.__class__, [value], field)[0]
+
+
+def generate_slugs(model, values, field: str = 'slug', chunk_size: int = 500) -> list:
+    """
+    Unique slugs for a batch of new rows, one query per ``chunk_size``
+    values, also unique within the batch.
+    """
+    max_length = model._meta.get_field(field).max_length
+    manager = model._default_manager
+    slugs = [None] * len(values)
+    allocated = set()
+
+    for start in range(0, len(values), chunk_size):
+        pending = list(range(start, min(start + chunk_size, len(values))))
+        suffix_length = SLUG_SUFFIX_LENGTH
+        for _ in range(SLUG_ROUNDS):
+            candidates = {index: _slug_candidates(slugify_value(values[index]), suffix_length, max_length)
+                          for index in pending}
+            taken = set(manager.filter(**{
+                field + '__in': {slug for options in candidates.values() for slug in options}
+            }).values_list(field, flat=True))
+
+            for index in pending:
+                for slug in candidates[index]:
+                    if slug not in taken and slug not in allocated:
+                        slugs[index] = slug
+                        allocated.add(slug)
+                        break
+            pending = [index for index in pending if slugs[index] is None]
+            if not pending:
+                break
+            suffix_length *= 2
+        else:
+            raise IntegrityError('no free slug found for %r' % values[pending[0]])
+    return slugs
+
+
+def save_with_slug(instance: Model, value: str, field: str = 'slug', attempts: int = 5, **save_kwargs):
+    """
+    Saves ``instance`` with a generated slug, taking the next free one when
+    a concurrent insert claimed it first.
+    """
+    for attempt in range(attempts):
+        setattr(instance, field, generate_slug(instance, value, field))
+        try:
+            with transaction.atomic():
+                instance.save(**save_kwargs)
+            return instance
+        except IntegrityError:
+            if attempt == attempts - 1:
+                raise
 
 
 phone_regex = RegexValidator(
     regex=r'^(?:\+88|88)?(0(1|9)[3-9]\d{7,10})$',
     message=_("Must be a valid phone number of bangladesh"))
 
+BD_COUNTRY_CODE = '+88'
+
+
+def normalize_phone(value):
+    """
+    E.164 form ('+8801777333777') of a number ``phone_regex`` accepts in
+    any of its forms ('01777333777', '8801777333777', '+8801777333777').
+    Anything else is returned as is, for the validator to reject.
+    """
+    if not isinstance(value, str):
+        return value
+    match = phone_regex.regex.match(value)
+    return BD_COUNTRY_CODE + match.group(1) if match else value
+
 
 class PageNumberPagination10(pagination.PageNumberPagination):
     page_size_query_param = 'page_size'
@@ -52,6 +156,9 @@ class LimitOffsetPagination10v2(pagination.LimitOffsetPagination):
     default_limit = 10
     max_limit = 999999
 
+    # "send all" requests are streamed in chunks of this many rows
+    stream_chunk_size = 2000
+
     def get_limit(self, request):
         if self.limit_query_param:
             try:
@@ -64,11 +171,110 @@ class LimitOffsetPagination10v2(pagination.LimitOffsetPagination):
                 pass
 
         # send all data if request is from app
-        if request.headers.get('fromApp') and convert_to_bool(request.headers.get('fromApp')):
+        if self.is_send_all(request):
             return self.max_limit
 
         return self.default_limit
 
+    def is_send_all(self, request):
+        return bool(request.headers.get('fromApp')) and convert_to_bool(request.headers.get('fromApp'))
+
+    def wants_stream(self, request):
+        """
+        Stream the response instead of paginating when the app asks for
+        everything and did not pass an explicit ``length``.
+        """
+        return (self.limit_query_param not in request.query_params
+                and self.is_send_all(request))
+
+    def get_streaming_response(self, queryset, serialize, request):
+        """
+        Iterate the queryset with a server side cursor and ``serialize``
+        it chunk by chunk (a list of rows in, a list of dicts out), so
+        memory stays flat whatever the result size.
+
+        Responds with NDJSON (one object per line) when content negotiation
+        picked ``NDJSONRenderer``, otherwise with the usual
+        ``recordsTotal``/``recordsFiltered``/``data`` envelope streamed as
+        a chunked JSON document. Under ASGI the body is an async iterator,
+        as Django would otherwise read a sync one into memory first.
+        """
+        offset = self.get_offset(request)
+        if offset:
+            queryset = queryset[offset:]
+
+        if isinstance(getattr(request, '_request', request), ASGIRequest):
+            chunks = self._aiter_chunks(queryset, serialize)
+            stream_ndjson, stream_json = self._astream_ndjson, self._astream_json
+        else:
+            chunks = self._iter_chunks(queryset, serialize)
+            stream_ndjson, stream_json = self._stream_ndjson, self._stream_json
+
+        renderer = getattr(request, 'accepted_renderer', None)
+        if isinstance(renderer, NDJSONRenderer):
+            content = stream_ndjson(chunks)
+            content_type = renderer.media_type
+        else:
+            content = stream_json(chunks)
+            content_type = 'application/json'
+        return StreamingHttpResponse(content, content_type=content_type)
+
+    def _iter_chunks(self, queryset, serialize):
+        chunk = []
+        for obj in queryset.iterator(chunk_size=self.stream_chunk_size):
+            chunk.append(obj)
+            if len(chunk) == self.stream_chunk_size:
+                yield serialize(chunk)
+                chunk = []
+        if chunk:
+            yield serialize(chunk)
+
+    async def _aiter_chunks(self, queryset, serialize):
+        chunk = []
+        async for obj in queryset.aiterator(chunk_size=self.stream_chunk_size):
+            chunk.append(obj)
+            if len(chunk) == self.stream_chunk_size:
+                yield serialize(chunk)
+                chunk = []
+        if chunk:
+            yield serialize(chunk)
+
+    # recordsFiltered goes last: it is only known once every row is out,
+    # which saves a COUNT(*) and lets the first bytes leave immediately
+    json_head = '{"recordsTotal":0,"data":['
+    json_tail = '],"recordsFiltered":%d}'
+
+    def _ndjson_rows(self, rows):
+        return ''.join(dumps(row) + '\n' for row in rows)
+
+    def _json_rows(self, rows, count):
+        chunk = ','.join(dumps(row) for row in rows)
+        return chunk if not count else ',' + chunk
+
+    def _stream_ndjson(self, chunks):
+        for rows in chunks:
+            yield self._ndjson_rows(rows)
+
+    async def _astream_ndjson(self, chunks):
+        async for rows in chunks:
+            yield self._ndjson_rows(rows)
+
+    def _stream_json(self, chunks):
+        yield self.json_head
+        count = 0
+        for rows in chunks:
+            yield self._json_rows(rows, count)
+            count += len(rows)
+        yield self.json_tail % count
+
+    async def _astream_json(self, chunks):
+        yield self.json_head
+        count = 0
+        async for rows in chunks:
+            yield self._json_rows(rows, count)
+            count += len(rows)
+        yield self.json_tail % count
+
     def get_paginated_response(self, data):
         return Response(OrderedDict([
             ('recordsTotal', 0),
@@ -89,3 +295,196 @@ class LimitOffsetPagination100(pagination.LimitOffsetPagination):
             ('recordsFiltered', self.count),
             ('data', data)
         ]))
+
+
+class KeysetPagination(pagination.CursorPagination):
+    """
+    Keyset (seek) pagination with signed, opaque cursors.
+
+    Pages are fetched with ``WHERE <ordering> > <last seen value> LIMIT n``
+    so page 1000 costs the same as page one. Ordering defaults to the
+    model's ``Meta.ordering``; its first field should be unique or nearly
+    unique (``username`` for ``account.User``).
+
+    The DataTables style envelope (``recordsTotal``/``recordsFiltered``/
+    ``data``) is kept for existing clients. ``count_mode`` controls what
+    goes into ``recordsFiltered``:
+
+    - ``None``: no count at all, ``recordsFiltered`` is ``null``
+    - ``'estimate'``: planner row estimate on PostgreSQL, cached count elsewhere
+    - ``'cached'``: exact ``COUNT(*)`` cached for ``count_cache_timeout`` seconds
+    - ``'exact'``: exact ``COUNT(*)`` on every request
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'length'
+    page_size = 10
+    max_page_size = 1000
+    ordering = None
+    count_mode = 'estimate'
+    count_cache_timeout = 60
+    cursor_salt = 'projectx.utils.KeysetPagination'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = self.get_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_ordering(self, request, queryset, view):
+        if self.ordering is None:
+            self.ordering = (queryset.query.order_by
+                             or queryset.model._meta.ordering
+                             or ('pk',))
+        ordering = super().get_ordering(request, queryset, view)
+        if isinstance(ordering, str):
+            return (ordering,)
+        return tuple(ordering)
+
+    def get_count(self, queryset):
+        if self.count_mode is None:
+            return None
+        if self.count_mode == 'exact':
+            return queryset.count()
+        if self.count_mode == 'estimate':
+            estimate = self.get_estimated_count(queryset)
+            if estimate is not None:
+                return estimate
+        return self.get_cached_count(queryset)
+
+    def get_estimated_count(self, queryset):
+        """
+        Ask the PostgreSQL planner for its row estimate instead of running
+        COUNT(*). Returns ``None`` if the estimate is not available.
+        """
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+
+        sql, params = queryset.order_by().query.sql_with_params()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+                plan = cursor.fetchone()[0]
+        except DatabaseError:
+            return None
+
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    def get_cached_count(self, queryset):
+        sql, params = queryset.order_by().query.sql_with_params()
+        digest = hashlib.md5((sql + repr(params)).encode(),
+                             usedforsecurity=False).hexdigest()
+        key = 'pagination:count:%s:%s' % (queryset.db, digest)
+        return cache.get_or_set(key, queryset.count, self.count_cache_timeout)
+
+    def encode_cursor(self, cursor):
+        tokens = {}
+        if cursor.offset != 0:
+            tokens['o'] = cursor.offset
+        if cursor.reverse:
+            tokens['r'] = 1
+        if cursor.position is not None:
+            tokens['p'] = cursor.position
+
+        encoded = signing.dumps(tokens, salt=self.cursor_salt, compress=True)
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            tokens = signing.loads(encoded, salt=self.cursor_salt)
+            offset = _positive_int(tokens.get('o', 0), cutoff=self.offset_cutoff)
+            reverse = bool(int(tokens.get('r', 0)))
+            position = tokens.get('p')
+        except (signing.BadSignature, AttributeError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return Cursor(offset=offset, reverse=reverse, position=position)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('recordsTotal', 0),
+            ('recordsFiltered', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('data', data)
+        ]))
+
+
+class KeysetPagination10(KeysetPagination):
+    page_size = 10
+
+
+class KeysetPagination100(KeysetPagination):
+    page_size = 100
+
+
+class StreamingListModelMixin(mixins.ListModelMixin):
+    """
+    List mixin that hands the filtered queryset to the paginator's
+    ``get_streaming_response`` when the paginator wants to stream this
+    request (see ``LimitOffsetPagination10v2``). Any other paginator keeps
+    the regular paginated list.
+
+    ``alist`` is the same for async views: unpaginated querysets are read
+    with the async ORM, paginators (which are sync) run in a thread.
+
+    When the serializer has a read plan (``projectx.serializers``), rows
+    are fetched with ``values()`` for exactly its fields and serialized
+    by the plan instead of field by field from model instances.
+
+    The list, and only the list, can also be rendered as NDJSON.
+    """
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if getattr(self, 'action', None) == 'list':
+            renderers.append(NDJSONRenderer())
+        return renderers
+
+    def list(self, request, *args, **kwargs):
+        queryset, serialize = self.get_list_queryset()
+        if self.wants_stream(request):
+            return self.paginator.get_streaming_response(queryset, serialize, request)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serialize(page))
+        return Response(serialize(queryset))
+
+    async def alist(self, request, *args, **kwargs):
+        queryset, serialize = self.get_list_queryset()
+        if self.wants_stream(request):
+            return self.paginator.get_streaming_response(queryset, serialize, request)
+
+        if self.paginator is not None:
+            page = await sync_to_async(self.paginate_queryset)(queryset)
+            if page is not None:
+                return self.get_paginated_response(serialize(page))
+
+        return Response(serialize([obj async for obj in queryset]))
+
+    def get_read_plan(self):
+        get_read_plan = getattr(self.get_serializer_class(), 'get_read_plan', None)
+        return get_read_plan() if get_read_plan is not None else None
+
+    def get_list_queryset(self):
+        """
+        The filtered queryset of the list and the function serializing a
+        list of its rows.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        plan = self.get_read_plan()
+        if plan is None:
+            return queryset, lambda rows: self.get_serializer(rows, many=True).data
+
+        # cursor paginators read the ordering fields from every row
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        extra = [field.lstrip('-') for field in ordering if isinstance(field, str)]
+        return plan.narrow(queryset, extra), plan.serialize
+
+    def wants_stream(self, request):
+        wants_stream = getattr(self.paginator, 'wants_stream', None)
+        return wants_stream is not None and wants_stream(request)
@@ -1,18 +1,233 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist, ValidationError
+from django.http import Http404
 from django.utils import timezone
-from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from django.utils.decorators import classonlymethod
+from django.utils.functional import classproperty
+from rest_framework import exceptions, status
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
 
-@api_view()
-@permission_classes((AllowAny,))
-def ping(request):
+class AsyncAPIViewMixin:
+    """
+    Native async dispatch for DRF views and viewsets, when the server is
+    ASGI (``ASYNC_VIEWS``, set by ``projectx.asgi``).
+
+    Under WSGI an async view would cost an ``async_to_sync`` hop per
+    request plus a ``sync_to_async`` hop per ORM or cache call, so views
+    stay sync there and DRF's regular dispatch runs the sync handlers.
+
+    Under ASGI, authentication uses the authenticators' ``aauthenticate``
+    when they have one, and a handler's async twin, prefixed with ``a``
+    (``list`` -> ``alist``, ``get`` -> ``aget``), is awaited when there is
+    one. Handlers without one (writes, anything not ported yet) run
+    through ``sync_to_async``, so a view can port only its hot read paths.
+    Responses are rendered before they are returned, see
+    ``render_inline``.
+    """
+    # fixed per view function by as_view()
+    async_dispatch = False
+
+    @classproperty
+    def view_is_async(cls):
+        return getattr(settings, 'ASYNC_VIEWS', False)
+
+    @classonlymethod
+    def as_view(cls, *args, **initkwargs):
+        initkwargs.setdefault('async_dispatch', cls.view_is_async)
+        view = super().as_view(*args, **initkwargs)
+        if initkwargs['async_dispatch'] and not iscoroutinefunction(view):
+            # viewsets build their own view function which is not marked
+            view = markcoroutinefunction(view)
+        return view
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.async_dispatch:
+            return self.adispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_async_handler(self, handler):
+        ahandler = getattr(self, 'a' + getattr(handler, '__name__', ''), None)
+        return ahandler if iscoroutinefunction(ahandler) else None
+
+    async def adispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.aperform_authentication(request)
+            self.initial(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(),
+                                  self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            ahandler = self.get_async_handler(handler)
+            if ahandler is not None:
+                response = await ahandler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.render_inline(self.response)
+
+    @staticmethod
+    def render_inline(response):
+        """
+        Render the response now, on the event loop. The handler renders
+        responses that have a callable ``render`` itself, in async mode
+        through ``sync_to_async``: a thread hop to serialize data that is
+        already in memory.
+        """
+        if callable(getattr(response, 'render', None)):
+            response.render()
+            # rendered, the handler skips responses without one
+            response.render = None
+        return response
+
+    async def aperform_authentication(self, request):
+        """
+        Async version of ``Request._authenticate``; afterwards
+        ``request.user`` is set and ``initial()`` does not authenticate again.
+        """
+        for authenticator in request.authenticators:
+            try:
+                aauthenticate = getattr(authenticator, 'aauthenticate', None)
+                if aauthenticate is not None:
+                    user_auth_tuple = await aauthenticate(request)
+                else:
+                    user_auth_tuple = await sync_to_async(authenticator.authenticate)(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+
+            if user_auth_tuple is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth_tuple
+                return
+
+        request._not_authenticated()
+
+    async def aget_object(self):
+        """
+        ``get_object`` with the lookup done by the async ORM.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (ObjectDoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404
+
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+
+class SparseFieldsMixin:
+    """
+    Sparse fieldsets for list requests: ``?fields=id,email`` returns only
+    those fields, ``?omit=phone`` all but those. Both are checked against
+    ``sparse_fields`` (the serializer's readable fields by default), an
+    unknown name is a 400.
+
+    The SQL narrows with the output: the read plan (see
+    ``StreamingListModelMixin``) fetches only the selected columns, or
+    the queryset is limited with ``only()`` when the serializer has no
+    read plan. Other actions ignore the parameters. Goes before
+    ``StreamingListModelMixin`` in the bases.
+    """
+    fields_query_param = 'fields'
+    omit_query_param = 'omit'
+    sparse_fields = None
+
+    def get_sparse_fields(self):
+        """
+        The requested field names in serializer order, None for all.
+        """
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = self._parse_sparse_fields()
+        return self._sparse_fields
+
+    def _parse_sparse_fields(self):
+        params = self.request.query_params
+        if self.action != 'list' or not (self.fields_query_param in params or self.omit_query_param in params):
+            return None
+
+        serializer = self.get_serializer_class()()
+        allowed = [name for name, field in serializer.fields.items()
+                   if not field.write_only and (self.sparse_fields is None or name in self.sparse_fields)]
+        selected = set(allowed)
+        for param in (self.fields_query_param, self.omit_query_param):
+            if param not in params:
+                continue
+            names = {name.strip() for name in params[param].split(',') if name.strip()}
+            unknown = names - set(allowed)
+            if unknown:
+                raise exceptions.ValidationError({param: [
+                    'Unknown field(s): %s. Choose from: %s.' % (', '.join(sorted(unknown)), ', '.join(allowed))]})
+            selected = selected & names if param == self.fields_query_param else selected - names
+        if not selected:
+            raise exceptions.ValidationError({self.fields_query_param: ['No fields selected.']})
+        return tuple(name for name in allowed if name in selected)
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_read_plan(self):
+        plan = super().get_read_plan()
+        fields = self.get_sparse_fields()
+        if plan is None or fields is None:
+            return plan
+        return plan.subset(fields)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        fields = self.get_sparse_fields()
+        if fields is None or super().get_read_plan() is not None:
+            return queryset
+
+        serializer = self.get_serializer_class()(fields=fields)
+        opts = queryset.model._meta
+        # cursor paginators read the ordering fields from the last row
+        ordering = queryset.query.order_by or opts.ordering
+        concrete = {field.name for field in opts.concrete_fields}
+        columns = [name for name in (field.lstrip('-') for field in ordering if isinstance(field, str))
+                   if name in concrete]
+        for field in serializer.fields.values():
+            try:
+                columns.append(opts.get_field(field.source.split('.')[0]).name)
+            except FieldDoesNotExist:
+                # computed from other columns, load them all
+                return queryset
+        return queryset.only(*columns)
+
+
+class PingView(AsyncAPIViewMixin, APIView):
+    permission_classes = (AllowAny,)
+
+    def get(self, request):
+        return Response(
+            {
+                "status": "ok",
+                "is_authenticated": request.user.is_authenticated,
+                "timestamp": timezone.now().isoformat(),
+            },
+            status=status.HTTP_200_OK)
+
+    async def aget(self, request):
+        return self.get(request)
 
-    return Response(
-        {
-            "status": "ok",
-            "is_authenticated": request.user.is_authenticated,
-            "timestamp": timezone.now().isoformat(),
-        },
-        status=status.HTTP_200_OK)